@@ -0,0 +1,28 @@
+# etl/api_hooks.py
+import os, json
+import urllib.request
+
+def invalidate_api_cache(scope=None):
+    """
+    Tell the API to drop cached route scores after new data lands.
+    No-op unless SAFERIDE_API_URL is set (e.g. http://localhost:8080);
+    sends ADMIN_TOKEN as X-Admin-Token when present.
+    """
+    base = os.getenv("SAFERIDE_API_URL")
+    if not base:
+        return None
+    url = base.rstrip("/") + "/routes/cache/invalidate"
+    if scope:
+        url += f"?scope={scope}"
+    req = urllib.request.Request(url, data=b"", method="POST")
+    token = os.getenv("ADMIN_TOKEN")
+    if token:
+        req.add_header("X-Admin-Token", token)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            cleared = json.loads(resp.read() or b"{}").get("cleared")
+            print(f"API cache invalidated: {cleared}")
+            return cleared
+    except Exception as e:
+        print(f"⚠ API cache invalidation failed ({url}): {e}")
+        return None
@@ -0,0 +1,147 @@
+# etl/bulk.py
+import io, os, time
+import pandas as pd
+from sqlalchemy import text
+
+def copy_frame(dbapi_conn, table, df, columns):
+    """
+    Stream `df[columns]` into `table` with COPY ... FROM STDIN (CSV).
+    Empty cells become NULL. Works with psycopg2 and psycopg 3 connections.
+    """
+    buf = io.StringIO()
+    df.to_csv(buf, columns=columns, index=False, header=False)
+    buf.seek(0)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cur = dbapi_conn.cursor()
+    try:
+        if hasattr(cur, "copy_expert"):       # psycopg2
+            cur.copy_expert(sql, buf)
+        else:                                 # psycopg 3
+            with cur.copy(sql) as cp:
+                cp.write(buf.getvalue())
+    finally:
+        cur.close()
+    return len(df)
+
+class Stopwatch:
+    """Named phase timings with a rows/sec report."""
+
+    def __init__(self):
+        self.phases = []
+        self._t = time.perf_counter()
+
+    def lap(self, name, rows):
+        now = time.perf_counter()
+        self.phases.append((name, rows, now - self._t))
+        self._t = now
+
+    def add(self, name, rows, secs):
+        """Accumulate into phase `name` (for stages that interleave, e.g. per chunk)."""
+        for i, (n, r, s) in enumerate(self.phases):
+            if n == name:
+                self.phases[i] = (n, r + rows, s + secs)
+                return
+        self.phases.append((name, rows, secs))
+
+    def report(self, label, rows):
+        """Print `label` with the end-to-end rate, then one line per phase."""
+        total = sum(s for _, _, s in self.phases)
+        print(f"{label} in {total:.2f}s ({rows / total if total > 0 else 0:,.0f} rows/s)")
+        for name, n, secs in self.phases:
+            rate = n / secs if secs > 0 else 0
+            print(f"  {name:<8} {n:>10,} rows  {secs:7.2f}s  {rate:>12,.0f} rows/s")
+
+# ---------- Chunked streaming with a per-source checkpoint ----------
+CHECKPOINT_DDL = """
+CREATE TABLE IF NOT EXISTS saferide.etl_checkpoint (
+  source     TEXT PRIMARY KEY,
+  src        TEXT NOT NULL,
+  src_size   BIGINT NOT NULL,
+  src_mtime  DOUBLE PRECISION NOT NULL,
+  rows_done  BIGINT NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+def _fingerprint(src):
+    st = os.stat(src)
+    return {"src": os.path.abspath(src), "src_size": st.st_size, "src_mtime": st.st_mtime}
+
+def _checkpoint_start(engine, source, fp, resume):
+    """Rows already committed for this exact file, or 0 (and forget any stale checkpoint)."""
+    with engine.begin() as conn:
+        conn.execute(text(CHECKPOINT_DDL))
+        row = conn.execute(text(
+            "SELECT src, src_size, src_mtime, rows_done FROM saferide.etl_checkpoint WHERE source = :s"
+        ), {"s": source}).mappings().first()
+        if row and resume and all(row[k] == fp[k] for k in fp):
+            return int(row["rows_done"])
+        conn.execute(text("DELETE FROM saferide.etl_checkpoint WHERE source = :s"), {"s": source})
+        return 0
+
+SAVE_CHECKPOINT_SQL = text("""
+INSERT INTO saferide.etl_checkpoint (source, src, src_size, src_mtime, rows_done)
+VALUES (:source, :src, :src_size, :src_mtime, :rows_done)
+ON CONFLICT (source) DO UPDATE SET
+  src        = EXCLUDED.src,
+  src_size   = EXCLUDED.src_size,
+  src_mtime  = EXCLUDED.src_mtime,
+  rows_done  = EXCLUDED.rows_done,
+  updated_at = now();
+""")
+
+def stream_csv(engine, source, src, chunksize, load_chunk, resume=False):
+    """
+    Read `src` in `chunksize`-row chunks and call load_chunk(conn, df) for each
+    one inside its own transaction, which also advances the checkpoint for
+    `source`. A crashed run restarted with resume=True skips the rows that were
+    already committed, as long as the file is unchanged. Memory stays at about
+    one chunk. Returns (source rows read, rows loaded).
+    """
+    fp = _fingerprint(src)
+    done = _checkpoint_start(engine, source, fp, resume)
+    if done:
+        print(f"[{source}] resuming {src} after {done:,} rows")
+
+    t0 = time.perf_counter()
+    pos, seen, loaded = 0, done, 0
+    for i, chunk in enumerate(pd.read_csv(src, dtype=str, chunksize=chunksize)):
+        end = pos + len(chunk)
+        if end <= done:
+            pos = end
+            continue
+        if pos < done:
+            chunk = chunk.iloc[done - pos:]
+        pos = end
+
+        t = time.perf_counter()
+        with engine.begin() as conn:
+            n = load_chunk(conn, chunk.fillna(""))
+            conn.execute(SAVE_CHECKPOINT_SQL, {"source": source, "rows_done": end, **fp})
+        seen, loaded = end, loaded + n
+        dt = time.perf_counter() - t
+        print(f"[{source}] chunk {i + 1}: {end:,} rows read, {loaded:,} loaded "
+              f"({len(chunk) / dt if dt > 0 else 0:,.0f} rows/s, "
+              f"{(end - done) / (time.perf_counter() - t0):,.0f} rows/s overall)")
+
+    # Finished cleanly: the next run starts from the top again
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM saferide.etl_checkpoint WHERE source = :s"), {"s": source})
+    return seen, loaded
+
+# ---------- Derived tables ----------
+def refresh_bikeway_risk(engine):
+    """
+    Rescore bikeway segments near crashes/hazards changed by this load
+    (saferide.refresh_bikeway_risk, 40_bikeway_risk.sql). Returns segments
+    scored, or None when the function is missing or fails.
+    """
+    t = time.perf_counter()
+    try:
+        with engine.begin() as conn:
+            n = conn.execute(text("SELECT saferide.refresh_bikeway_risk()")).scalar()
+    except Exception as e:
+        print(f"⚠ Bikeway risk refresh skipped: {e.__class__.__name__}: {str(e).splitlines()[0]}")
+        return None
+    print(f"Bikeway risk refreshed: {n} segments rescored in {time.perf_counter() - t:.2f}s")
+    return n
@@ -0,0 +1,125 @@
+# etl/incremental.py
+"""
+Incremental loads: only new or changed rows go to the database.
+
+Every loaded row carries a 64-bit content hash (row_hash) of its cleaned
+fields. Each source also keeps a watermark, the max timestamp it has loaded,
+in saferide.etl_watermark. Rows newer than the watermark are new and are sent
+as they are. Older rows (or rows without a timestamp) are compared with the
+stored hashes by primary key, and unchanged ones are skipped client side.
+The merge itself only rewrites a row when its hash differs, so no-op updates
+never touch the table or its GiST index.
+"""
+from dataclasses import dataclass
+
+import pandas as pd
+from sqlalchemy import text
+
+from bulk import copy_frame
+
+WATERMARK_DDL = """
+CREATE TABLE IF NOT EXISTS saferide.etl_watermark (
+  source     TEXT PRIMARY KEY,
+  watermark  TIMESTAMP,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+SET_WATERMARK_SQL = text("""
+INSERT INTO saferide.etl_watermark (source, watermark)
+VALUES (:source, :watermark)
+ON CONFLICT (source) DO UPDATE SET
+  watermark  = GREATEST(saferide.etl_watermark.watermark, EXCLUDED.watermark),
+  updated_at = now();
+""")
+
+@dataclass
+class Counts:
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+    def add(self, other):
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.skipped += other.skipped
+        return self
+
+    def __str__(self):
+        return f"{self.inserted} inserted, {self.updated} updated, {self.skipped} skipped"
+
+def ensure_hash_column(conn, table):
+    """
+    row_hash column on saferide.<table>. 10_schema.sql declares it; this only
+    upgrades databases initialised before it did. Full (non-incremental) loads
+    need it too: they reset row_hash to NULL on every row they write, so a
+    stored hash always describes the row's current content and the next
+    --incremental run never skips a row on a stale hash.
+
+    Not memoized: the ALTER runs inside the loader's transaction, and a
+    rollback would leave a cached "done" pointing at a column that never
+    landed. The catalog check is cheap.
+    """
+    has_col = conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'saferide' AND table_name = :t AND column_name = 'row_hash';
+    """), {"t": table}).first()
+    if not has_col:
+        conn.execute(text(f"ALTER TABLE saferide.{table} ADD COLUMN IF NOT EXISTS row_hash BIGINT;"))
+
+def ensure_schema(conn, table):
+    """etl_watermark plus a row_hash column on saferide.<table> (in the caller's transaction)."""
+    conn.execute(text(WATERMARK_DDL))
+    ensure_hash_column(conn, table)
+
+def get_watermark(conn, source):
+    return conn.execute(text("SELECT watermark FROM saferide.etl_watermark WHERE source = :s"),
+                        {"s": source}).scalar()
+
+def row_hashes(df, columns):
+    """Stable signed 64-bit hash of the given columns' string forms."""
+    h = pd.util.hash_pandas_object(df[columns].astype(str), index=False)
+    return pd.Series(h.to_numpy().view("int64"), index=df.index)
+
+def merge_changed(conn, source, rows_df, *, table, key, hash_columns, ts_col,
+                  stage_sql, stage_table, stage_columns, merge_sql):
+    """
+    Hash `rows_df`, drop rows whose stored hash already matches, and merge
+    the rest through `stage_table`. `merge_sql` must upsert from the stage
+    with a `WHERE <table>.row_hash IS DISTINCT FROM EXCLUDED.row_hash` guard
+    and `RETURNING (xmax = 0)`. Advances the watermark in the same transaction.
+    """
+    ensure_schema(conn, table)
+    counts = Counts()
+    if rows_df.empty:
+        return counts
+    rows_df = rows_df.assign(row_hash=row_hashes(rows_df, hash_columns))
+    top = rows_df[ts_col].max() if ts_col else None
+
+    # Rows past the watermark are new; everything else is checked by key
+    wm = get_watermark(conn, source) if ts_col else None
+    if wm is None or ts_col is None:
+        check = pd.Series(True, index=rows_df.index)
+    else:
+        check = ~(rows_df[ts_col] > pd.Timestamp(wm))
+    ids = rows_df.loc[check, key].tolist()
+    if ids:
+        stored = pd.Series(dict(conn.execute(
+            text(f"SELECT {key}, row_hash FROM saferide.{table} WHERE {key} = ANY(:ids)"),
+            {"ids": ids}).fetchall()), dtype="Int64")
+        same = check & (rows_df[key].map(stored) == rows_df["row_hash"]).fillna(False)
+        counts.skipped = int(same.sum())
+        rows_df = rows_df[~same]
+
+    if not rows_df.empty:
+        conn.exec_driver_sql(stage_sql)
+        copy_frame(conn.connection.dbapi_connection, stage_table, rows_df, stage_columns + ["row_hash"])
+        flags = [r[0] for r in conn.exec_driver_sql(merge_sql).fetchall()]
+        counts.inserted = sum(flags)
+        counts.updated = len(flags) - counts.inserted
+        # Unchanged rows that were not looked up client side (the hash guard skipped them)
+        counts.skipped += len(rows_df) - len(flags)
+
+    if ts_col and not pd.isna(top):
+        conn.execute(SET_WATERMARK_SQL, {"source": source, "watermark": top.to_pydatetime()})
+    return counts
@@ -1,53 +1,43 @@
 # etl/load_311.py
-import sys, os, re, math
+import os, math, argparse
 import pandas as pd
 from sqlalchemy import text, create_engine
 from dotenv import load_dotenv
 
-load_dotenv()
-ENGINE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(ENGINE_URL, future=True)
-
-SRC = sys.argv[1] if len(sys.argv) > 1 else "data/crash_311.csv"  # your file name
-
-# ---- 1) Read CSV ----
-df = pd.read_csv(SRC, dtype=str).fillna("")
+from api_hooks import invalidate_api_cache
+from bulk import Stopwatch, refresh_bikeway_risk, stream_csv
+from incremental import Counts, ensure_hash_column, merge_changed
 
 # Column helpers (accept a few possible spellings)
-def pick(*names):
+def pick(cols, *names):
     for n in names:
-        if n in df.columns:
+        if n in cols:
             return n
     return None
 
-col_id   = pick("OBJECTID", "ObjectId", "Id", "OBJECT ID")
-col_lon  = pick("Longitude", "lon", "LONGITUDE", "POINT_X", "geo_lon")
-col_lat  = pick("Latitude", "lat", "LATITUDE", "POINT_Y", "geo_lat")
-col_cts  = pick("Case Status", "Status")
-col_ctd  = pick("Case Created dttm", "Case Created Date", "Created Date", "Opened")
-col_type = pick("Type")
-col_topic= pick("Topic")
-col_sum  = pick("Case Summary", "Summary")
-
-req = [col_id, col_lon, col_lat, col_cts, col_ctd]
-missing = [n for n in ["id","lon","lat","status","created_at"] if req[["id","lon","lat","status","created_at"].index(n)] is None]
-if any(missing):
-    raise SystemExit(f"Missing required columns in {SRC}: {missing}")
-
-# ---- 2) Basic cleaning ----
+def resolve_columns(columns, src):
+    cols = {
+        "id":     pick(columns, "OBJECTID", "ObjectId", "Id", "OBJECT ID"),
+        "lon":    pick(columns, "Longitude", "lon", "LONGITUDE", "POINT_X", "geo_lon"),
+        "lat":    pick(columns, "Latitude", "lat", "LATITUDE", "POINT_Y", "geo_lat"),
+        "status": pick(columns, "Case Status", "Status"),
+        "created_at": pick(columns, "Case Created dttm", "Case Created Date", "Created Date", "Opened"),
+        "type":   pick(columns, "Type"),
+        "topic":  pick(columns, "Topic"),
+        "summary": pick(columns, "Case Summary", "Summary"),
+    }
+    missing = [n for n in ["id", "lon", "lat", "status", "created_at"] if cols[n] is None]
+    if missing:
+        raise SystemExit(f"Missing required columns in {src}: {missing}")
+    return cols
+
+# ---- Basic cleaning ----
 def to_float(s):
     try:
         return float(s)
     except:
         return math.nan
 
-df["_lon"] = df[col_lon].apply(to_float)
-df["_lat"] = df[col_lat].apply(to_float)
-df = df[pd.notnull(df["_lon"]) & pd.notnull(df["_lat"])]
-
-# timestamps
-df["_opened_at"] = pd.to_datetime(df[col_ctd], errors="coerce", utc=False)
-
 # status normalize
 def norm_status(s):
     s = s.strip().lower()
@@ -57,11 +47,9 @@ def norm_status(s):
     if s.startswith("open"): return "open"
     return s.replace(" ", "_")
 
-df["_status"] = df[col_cts].apply(norm_status)
-
 # category from topic/type/summary keywords
-def norm_category(row):
-    src = " ".join([row.get(col_topic,""), row.get(col_type,""), row.get(col_sum,"")]).lower()
+def norm_category(text_):
+    src = text_.lower()
     if any(k in src for k in ["pothole", "potholes"]): return "pothole"
     if any(k in src for k in ["debris", "glass", "trash", "sand", "gravel"]): return "debris"
     if any(k in src for k in ["signal", "traffic light", "stop light"]): return "signal"
@@ -69,29 +57,50 @@ def norm_category(row):
     if any(k in src for k in ["snow", "ice"]): return "snow_ice"
     return "other"
 
-df["_category"] = df.apply(norm_category, axis=1)
-
-# keep last 12 months (optional; comment out to load all)
-cut = pd.Timestamp.utcnow() - pd.Timedelta(days=365)
-df = df[df["_opened_at"] >= cut.tz_localize(None)] if df["_opened_at"].notna().any() else df
-
-# Deduplicate on id
-df = df.drop_duplicates(subset=[col_id])
-
-# ---- 3) Insert into PostGIS ----
-rows = []
-for _, r in df.iterrows():
-    rows.append({
-        "hazard_id": str(r[col_id]),
-        "category": r["_category"],
-        "status": r["_status"],
-        "opened_at": None if pd.isna(r["_opened_at"]) else r["_opened_at"].to_pydatetime(),
-        "closed_at": None,   # can be added if you have a close-date col
-        "lon": float(r["_lon"]),
-        "lat": float(r["_lat"]),
-    })
-
-sql = text("""
+# keep last 12 months (optional; set to None to load all)
+RECENT = pd.Timedelta(days=365)
+
+def recent_cutoff():
+    """Oldest opened_at kept, fixed once per run so every chunk uses the same cut."""
+    if RECENT is None:
+        return None
+    return (pd.Timestamp.now("UTC") - RECENT).tz_localize(None)
+
+def clean(df, cols, cut=None):
+    """
+    Raw string frame -> hazard_id, category, status, opened_at, lon, lat.
+    Drops cases opened before `cut` (and, when filtering, cases without a
+    parseable date); pass the same `cut` to every chunk of a file.
+    """
+    lon = df[cols["lon"]].map(to_float)
+    lat = df[cols["lat"]].map(to_float)
+    keep = lon.notna() & lat.notna()
+
+    # timestamps
+    opened_at = pd.to_datetime(df[cols["created_at"]], errors="coerce", utc=False)
+
+    blank = pd.Series("", index=df.index)
+    words = blank
+    for c in ("topic", "type", "summary"):
+        words = words + " " + (df[cols[c]] if cols[c] else blank)
+
+    out = pd.DataFrame({
+        "hazard_id": df[cols["id"]].astype(str),
+        "category": words.map(norm_category),
+        "status": df[cols["status"]].map(norm_status),
+        "opened_at": opened_at,
+        "lon": lon,
+        "lat": lat,
+    }, index=df.index)[keep]
+
+    if cut is not None:
+        out = out[out["opened_at"] >= cut]   # NaT compares False
+
+    # Deduplicate on id
+    return out.drop_duplicates(subset=["hazard_id"])
+
+# ---- Insert into PostGIS ----
+UPSERT_SQL = text("""
 INSERT INTO saferide.hazard (hazard_id, category, status, opened_at, closed_at, geom)
 VALUES (:hazard_id, :category, :status, :opened_at, :closed_at,
         ST_SetSRID(ST_Point(:lon, :lat), 4326))
@@ -100,10 +109,121 @@ ON CONFLICT (hazard_id) DO UPDATE SET
   status   = EXCLUDED.status,
   opened_at= COALESCE(EXCLUDED.opened_at, saferide.hazard.opened_at),
   closed_at= COALESCE(EXCLUDED.closed_at, saferide.hazard.closed_at),
-  geom     = EXCLUDED.geom;
+  geom     = EXCLUDED.geom,
+  row_hash = NULL;  -- content may have changed: no stale hash for --incremental
 """)
 
-with engine.begin() as conn:
-    conn.execute(sql, rows)
-
-print(f"Loaded {len(rows)} hazards from {SRC}")
+def upsert_rows(conn, rows_df):
+    rows = [{
+        "hazard_id": r.hazard_id,
+        "category": r.category,
+        "status": r.status,
+        "opened_at": None if pd.isna(r.opened_at) else r.opened_at.to_pydatetime(),
+        "closed_at": None,   # can be added if you have a close-date col
+        "lon": float(r.lon),
+        "lat": float(r.lat),
+    } for r in rows_df.itertuples(index=False)]
+    if rows:
+        conn.execute(UPSERT_SQL, rows)
+    return len(rows)
+
+# ---- Incremental: only new or changed rows (etl/incremental.py) ----
+COLUMNS = ["hazard_id", "category", "status", "opened_at", "lon", "lat"]
+
+INC_STAGE_SQL = """
+CREATE TEMP TABLE hazard_stage (
+  hazard_id TEXT,
+  category  TEXT,
+  status    TEXT,
+  opened_at TIMESTAMP,
+  lon       DOUBLE PRECISION,
+  lat       DOUBLE PRECISION,
+  row_hash  BIGINT
+) ON COMMIT DROP;
+"""
+
+INC_MERGE_SQL = """
+INSERT INTO saferide.hazard (hazard_id, category, status, opened_at, geom, row_hash)
+SELECT hazard_id, category, status, opened_at, ST_SetSRID(ST_Point(lon, lat), 4326), row_hash
+FROM hazard_stage
+ON CONFLICT (hazard_id) DO UPDATE SET
+  category = EXCLUDED.category,
+  status   = EXCLUDED.status,
+  opened_at= COALESCE(EXCLUDED.opened_at, saferide.hazard.opened_at),
+  geom     = EXCLUDED.geom,
+  row_hash = EXCLUDED.row_hash
+WHERE saferide.hazard.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+RETURNING (xmax = 0) AS inserted;
+"""
+
+def incremental_upsert(conn, rows_df, counts):
+    """Merge only rows whose content hash changed; adds to `counts`, returns rows written."""
+    c = merge_changed(conn, "hazard", rows_df, table="hazard", key="hazard_id",
+                      hash_columns=COLUMNS, ts_col="opened_at",
+                      stage_sql=INC_STAGE_SQL, stage_table="hazard_stage",
+                      stage_columns=COLUMNS, merge_sql=INC_MERGE_SQL)
+    counts.add(c)
+    return c.inserted + c.updated
+
+def write(conn, rows_df, counts=None):
+    if counts is not None:
+        return incremental_upsert(conn, rows_df, counts)
+    ensure_hash_column(conn, "hazard")
+    return upsert_rows(conn, rows_df)
+
+def load(engine, src, incremental=False):
+    watch = Stopwatch()
+    counts = Counts() if incremental else None
+    df = pd.read_csv(src, dtype=str).fillna("")
+    watch.lap("read", len(df))
+    rows_df = clean(df, resolve_columns(df.columns, src), recent_cutoff())
+    del df
+    watch.lap("clean", len(rows_df))
+    with engine.begin() as conn:
+        n = write(conn, rows_df, counts)
+    watch.lap("upsert", n)
+    watch.report(f"Loaded {n} hazards from {src}" + (f" ({counts})" if counts else ""), n)
+    return n
+
+def load_streaming(engine, src, chunksize, incremental=False, resume=False):
+    """Chunked load: one transaction (and checkpoint) per chunk, flat memory."""
+    counts = Counts() if incremental else None
+    cut = recent_cutoff()
+
+    def load_chunk(conn, df):
+        return write(conn, clean(df, resolve_columns(df.columns, src), cut), counts)
+
+    watch = Stopwatch()
+    read, n = stream_csv(engine, "hazard", src, chunksize, load_chunk, resume=resume)
+    watch.lap("stream", read)
+    watch.report(f"Loaded {n} hazards from {src}" + (f" ({counts})" if counts else ""), n)
+    return n
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load Denver 311 cases into saferide.hazard")
+    ap.add_argument("src", nargs="?", default="data/crash_311.csv")  # your file name
+    ap.add_argument("--incremental", action="store_true",
+                    help="only write new or changed rows (content hash + opened_at watermark)")
+    ap.add_argument("--chunksize", type=int, default=0,
+                    help="stream the file in chunks of this many rows, one transaction each")
+    ap.add_argument("--resume", action="store_true",
+                    help="with --chunksize: skip rows committed by an interrupted run of the same file")
+    args = ap.parse_args(argv)
+
+    load_dotenv()
+    ENGINE_URL = os.getenv("DATABASE_URL")
+    engine = create_engine(ENGINE_URL, future=True)
+
+    if args.chunksize > 0:
+        n = load_streaming(engine, args.src, args.chunksize,
+                           incremental=args.incremental, resume=args.resume)
+    else:
+        n = load(engine, args.src, incremental=args.incremental)
+
+    # Open hazards feed the risk scores
+    if n:
+        refresh_bikeway_risk(engine)
+        invalidate_api_cache("scores,bikeway_risk")
+
+if __name__ == "__main__":
+    main()
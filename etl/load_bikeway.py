@@ -1,9 +1,13 @@
 # etl/load_bikeway.py
-import os, sys, math
+import os, math, argparse
 import pandas as pd
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
+from api_hooks import invalidate_api_cache
+from bulk import Stopwatch, copy_frame, refresh_bikeway_risk, stream_csv
+from incremental import Counts, ensure_hash_column, merge_changed
+
 # --- Config ---
 # Your WKT looks like Colorado State Plane Central (ftUS) ~ EPSG:2232.
 # If your data is actually WGS84 already, change SRC_SRID to 4326.
@@ -24,82 +28,274 @@ def to_float(x):
     except Exception:
         return math.nan
 
-def main():
-    load_dotenv()
-    ENGINE_URL = os.getenv("DATABASE_URL")
-    assert ENGINE_URL, "DATABASE_URL missing. Put it in .env (see earlier steps)."
-    engine = create_engine(ENGINE_URL, future=True)
-
-    src = sys.argv[1] if len(sys.argv) > 1 else "data/bicycle_inventory.csv"
-    df = pd.read_csv(src, dtype=str).fillna("")
-
+def resolve_columns(columns):
     # Likely headers (from your sample)
-    c_id     = pick(df.columns, "FID", "fid", "OBJECTID", "objectid", "geomid")
-    c_name   = pick(df.columns, "name", "NAME", "alt_name")
-    c_type   = pick(df.columns, "fac_type", "FAC_TYPE")
-    c_status = pick(df.columns, "status", "STATUS")
-    c_lenft  = pick(df.columns, "len_ft", "LEN_FT", "length_ft", "shape_stle")  # len_ft preferred
-    c_wkt    = pick(df.columns, "geom", "GEOM", "WKT", "wkt")
-
-    if c_id is None or c_wkt is None:
+    cols = {
+        "id":     pick(columns, "FID", "fid", "OBJECTID", "objectid", "geomid"),
+        "name":   pick(columns, "name", "NAME", "alt_name"),
+        "type":   pick(columns, "fac_type", "FAC_TYPE"),
+        "status": pick(columns, "status", "STATUS"),
+        "lenft":  pick(columns, "len_ft", "LEN_FT", "length_ft", "shape_stle"),  # len_ft preferred
+        "wkt":    pick(columns, "geom", "GEOM", "WKT", "wkt"),
+    }
+    if cols["id"] is None or cols["wkt"] is None:
         raise SystemExit(
             f"CSV must contain an ID column and a WKT column. "
-            f"Got columns: {list(df.columns)}"
+            f"Got columns: {list(columns)}"
         )
+    return cols
 
-    # Build rows
+def build_rows(df, cols):
     rows = []
-    for _, r in df.iterrows():
-        wkt = r[c_wkt].strip()
+    for r in df.to_dict("records"):
+        wkt = r[cols["wkt"]].strip()
         if not wkt or "LINESTRING" not in wkt.upper():
             continue
         rows.append({
-            "src_id": str(r[c_id]),
-            "class": (r[c_type] or "").strip().lower() if c_type else "",
+            "src_id": str(r[cols["id"]]),
+            "class": (r[cols["type"]] or "").strip().lower() if cols["type"] else "",
             "on_off": "",  # CSV may not have this, set to empty or derive from facility_type
-            "status": (r[c_status] or "").strip().upper() if c_status else "",
+            "status": (r[cols["status"]] or "").strip().upper() if cols["status"] else "",
             "wkt": wkt,
         })
+    return rows
+
+def bikeway_pk(conn):
+    """Figure out which PK the table uses: infra_id, way_id, or id"""
+    info = conn.execute(text("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'saferide' AND table_name = 'bikeway';
+    """)).fetchall()
+    cols = {c[0] for c in info}
+    for pk_col in ("infra_id", "way_id", "id"):
+        if pk_col in cols:
+            return pk_col
+    raise SystemExit(
+        "Could not find 'infra_id', 'way_id', or 'id' column in saferide.bikeway. "
+        "Run \\d saferide.bikeway to inspect the table."
+    )
+
+def upsert_sql(pk_col):
+    # Build SQL dynamically to match the PK name
+    return text(f"""
+    INSERT INTO saferide.bikeway ({pk_col}, class, on_off, status, geom)
+    VALUES (:src_id, :class, :on_off, :status,
+            ST_Transform(ST_GeomFromText(:wkt, {SRC_SRID}), 4326))
+    ON CONFLICT ({pk_col}) DO UPDATE SET
+      class  = EXCLUDED.class,
+      on_off = EXCLUDED.on_off,
+      status = EXCLUDED.status,
+      geom   = EXCLUDED.geom,
+      row_hash = NULL;  -- content may have changed: no stale hash for --incremental
+    """)
+
+# --- Client-side geometry (--client-geom): parse, check, reproject in bulk ---
+# Needs shapely>=2 and pyproj; without them only the server-side WKT path works.
+try:
+    import numpy as np
+    import shapely
+    from pyproj import Transformer
+except ImportError:
+    shapely = None
+
+LINE_TYPES = (1, 5)  # shapely type ids: LineString, MultiLineString
+
+_transformer = None
+
+def _to_4326():
+    global _transformer
+    if _transformer is None:
+        _transformer = Transformer.from_crs(SRC_SRID, 4326, always_xy=True)
+    return _transformer
+
+def build_frame(df, cols):
+    """
+    Vectorized alternative to build_rows: parse every WKT at once, keep valid
+    (multi)linestrings, reproject SRC_SRID -> 4326 in one coordinate pass and
+    encode as hex WKB MULTILINESTRINGs (the table's type).
+    Returns (frame, {reason: rows dropped}).
+    """
+    if shapely is None:
+        raise SystemExit("--client-geom needs shapely>=2 and pyproj (pip install shapely pyproj)")
+    wkt = df[cols["wkt"]].str.strip()
+    geoms = shapely.from_wkt(np.where(wkt == "", None, wkt.to_numpy(object)), on_invalid="ignore")
+
+    parsed = ~shapely.is_missing(geoms)
+    is_line = np.isin(shapely.get_type_id(geoms), LINE_TYPES)
+    valid = is_line & shapely.is_valid(geoms) & ~shapely.is_empty(geoms)
+    dropped = {"unparsed": int((~parsed).sum()),
+               "not_line": int((parsed & ~is_line).sum()),
+               "invalid": int((is_line & ~valid).sum())}
+
+    tr = _to_4326()
+    g = shapely.transform(geoms[valid], lambda xy: np.column_stack(tr.transform(xy[:, 0], xy[:, 1])))
+    single = shapely.get_type_id(g) == 1
+    g[single] = shapely.multilinestrings(g[single], indices=np.arange(single.sum()))
+
+    kept = df[valid]
+    blank = pd.Series("", index=kept.index)
+    frame = pd.DataFrame({
+        "src_id": kept[cols["id"]].astype(str),
+        "class": kept[cols["type"]].str.strip().str.lower() if cols["type"] else blank,
+        "on_off": blank,
+        "status": kept[cols["status"]].str.strip().str.upper() if cols["status"] else blank,
+        "wkb": shapely.to_wkb(g, hex=True, output_dimension=2),
+    }, index=kept.index)
+    return frame, dropped
+
+# --- Set-based writes: COPY into a stage, one merge (etl/incremental.py) ---
+# Geometry comes either as source-SRID WKT (server reprojects) or as 4326 WKB
+# built by build_frame. Bikeways have no timestamp, so incremental loads have
+# no watermark and every key is checked by hash.
+COLUMNS = ["src_id", "class", "on_off", "status", "wkt"]
 
-    if not rows:
+GEOM_FROM = {
+    "wkt": f"ST_Transform(ST_GeomFromText(wkt, {SRC_SRID}), 4326)",
+    "wkb": "ST_GeomFromWKB(decode(wkb, 'hex'), 4326)",
+}
+
+def stage_merge_sql(pk_col, geom="wkt", incremental=True):
+    h_col = ",\n      row_hash BIGINT" if incremental else ""
+    stage = f"""
+    CREATE TEMP TABLE bikeway_stage (
+      {pk_col} TEXT,
+      class    TEXT,
+      on_off   TEXT,
+      status   TEXT,
+      {geom}      TEXT{h_col}
+    ) ON COMMIT DROP;
+    """
+    # Full loads clear the hash so --incremental never trusts a stale one
+    h_ins, h_sel, h_set = ((", row_hash", ", row_hash", ",\n      row_hash = EXCLUDED.row_hash") if incremental
+                           else ("", "", ",\n      row_hash = NULL"))
+    guard = ("WHERE saferide.bikeway.row_hash IS DISTINCT FROM EXCLUDED.row_hash\n    "
+             "RETURNING (xmax = 0) AS inserted") if incremental else ""
+    merge = f"""
+    INSERT INTO saferide.bikeway ({pk_col}, class, on_off, status, geom{h_ins})
+    SELECT {pk_col}, class, on_off, status,
+           {GEOM_FROM[geom]}{h_sel}
+    FROM bikeway_stage
+    ON CONFLICT ({pk_col}) DO UPDATE SET
+      class    = EXCLUDED.class,
+      on_off   = EXCLUDED.on_off,
+      status   = EXCLUDED.status,
+      geom     = EXCLUDED.geom{h_set}
+    {guard};
+    """
+    return stage, merge
+
+def merge_frame(conn, rows_df, pk_col, counts=None):
+    """COPY + merge a frame from build_rows (as rows) or build_frame; returns rows written."""
+    geom = "wkb" if "wkb" in rows_df.columns else "wkt"
+    # One row per key: a repeated src_id would make the set-based upsert fail
+    # ("cannot affect row a second time"); last one wins, as with executemany
+    rows_df = rows_df.drop_duplicates(subset=["src_id"], keep="last").rename(columns={"src_id": pk_col})
+    cols = [pk_col, "class", "on_off", "status", geom]
+    stage, merge = stage_merge_sql(pk_col, geom, incremental=counts is not None)
+    if counts is None:
+        conn.exec_driver_sql(stage)
+        copy_frame(conn.connection.dbapi_connection, "bikeway_stage", rows_df, cols)
+        return conn.exec_driver_sql(merge).rowcount
+    c = merge_changed(conn, "bikeway", rows_df, table="bikeway", key=pk_col,
+                      hash_columns=cols, ts_col=None,
+                      stage_sql=stage, stage_table="bikeway_stage",
+                      stage_columns=cols, merge_sql=merge)
+    counts.add(c)
+    return c.inserted + c.updated
+
+def write(conn, rows, pk_col, counts=None):
+    """Write build_rows() dicts or a build_frame() frame; returns rows written."""
+    if len(rows) == 0:
+        return 0
+    if counts is None:
+        ensure_hash_column(conn, "bikeway")
+    if isinstance(rows, pd.DataFrame):
+        return merge_frame(conn, rows, pk_col, counts)
+    if counts is not None:
+        return merge_frame(conn, pd.DataFrame(rows, columns=COLUMNS), pk_col, counts)
+    conn.execute(upsert_sql(pk_col), rows)
+    return len(rows)
+
+def transform(df, client_geom=False):
+    """Raw string frame -> rows for write() (dicts, or a WKB frame with client_geom)."""
+    cols = resolve_columns(df.columns)
+    if not client_geom:
+        return build_rows(df, cols)
+    frame, dropped = build_frame(df, cols)
+    if any(dropped.values()):
+        print("Skipped bikeway rows: " + ", ".join(f"{k}={v}" for k, v in dropped.items() if v))
+    return frame
+
+def load(engine, src, incremental=False, client_geom=False):
+    watch = Stopwatch()
+    counts = Counts() if incremental else None
+    df = pd.read_csv(src, dtype=str).fillna("")
+    watch.lap("read", len(df))
+    rows = transform(df, client_geom)
+    del df
+    watch.lap("clean", len(rows))
+
+    if len(rows) == 0:
         print("No valid LINESTRING features found in the file.")
-        return
+        return 0
 
     with engine.begin() as conn:
-        # Figure out which PK the table uses: infra_id, way_id, or id
-        info = conn.execute(text("""
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_schema = 'saferide' AND table_name = 'bikeway';
-        """)).fetchall()
-        cols = {c[0] for c in info}
-        if "infra_id" in cols:
-            pk_col = "infra_id"
-        elif "way_id" in cols:
-            pk_col = "way_id"
-        elif "id" in cols:
-            pk_col = "id"
-        else:
-            raise SystemExit(
-                "Could not find 'infra_id', 'way_id', or 'id' column in saferide.bikeway. "
-                "Run \\d saferide.bikeway to inspect the table."
-            )
-
-        # Build SQL dynamically to match the PK name
-        sql = text(f"""
-        INSERT INTO saferide.bikeway ({pk_col}, class, on_off, status, geom)
-        VALUES (:src_id, :class, :on_off, :status,
-                ST_Transform(ST_GeomFromText(:wkt, {SRC_SRID}), 4326))
-        ON CONFLICT ({pk_col}) DO UPDATE SET
-          class  = EXCLUDED.class,
-          on_off = EXCLUDED.on_off,
-          status = EXCLUDED.status,
-          geom   = EXCLUDED.geom;
-        """)
-
-        conn.execute(sql, rows)
-
-    print(f"Loaded {len(rows)} bikeway segments from {src} (PK column used: {pk_col}, SRID in: {SRC_SRID} → 4326)")
+        pk_col = bikeway_pk(conn)
+        n = write(conn, rows, pk_col, counts)
+    watch.lap("upsert", n)
+
+    where = "client" if client_geom else "server"
+    watch.report(f"Loaded {n} bikeway segments from {src} (PK column used: {pk_col}, "
+                 f"SRID in: {SRC_SRID} → 4326 on the {where})"
+                 + (f" ({counts})" if counts else ""), n)
+    return n
+
+def load_streaming(engine, src, chunksize, incremental=False, client_geom=False, resume=False):
+    """Chunked load: one transaction (and checkpoint) per chunk, flat memory."""
+    counts = Counts() if incremental else None
+    with engine.connect() as conn:
+        pk_col = bikeway_pk(conn)
+
+    def load_chunk(conn, df):
+        return write(conn, transform(df, client_geom), pk_col, counts)
+
+    watch = Stopwatch()
+    read, n = stream_csv(engine, "bikeway", src, chunksize, load_chunk, resume=resume)
+    watch.lap("stream", read)
+    watch.report(f"Loaded {n} bikeway segments from {src} (SRID in: {SRC_SRID} → 4326)"
+                 + (f" ({counts})" if counts else ""), n)
+    return n
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load Denver bicycle inventory into saferide.bikeway")
+    ap.add_argument("src", nargs="?", default="data/bicycle_inventory.csv")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only write new or changed segments (content hash)")
+    ap.add_argument("--client-geom", action="store_true",
+                    help="parse, validate and reproject geometries here (shapely/pyproj) "
+                         "and bulk-load WKB instead of transforming WKT in Postgres")
+    ap.add_argument("--chunksize", type=int, default=0,
+                    help="stream the file in chunks of this many rows, one transaction each")
+    ap.add_argument("--resume", action="store_true",
+                    help="with --chunksize: skip rows committed by an interrupted run of the same file")
+    args = ap.parse_args(argv)
+
+    load_dotenv()
+    ENGINE_URL = os.getenv("DATABASE_URL")
+    assert ENGINE_URL, "DATABASE_URL missing. Put it in .env (see earlier steps)."
+    engine = create_engine(ENGINE_URL, future=True)
+
+    if args.chunksize > 0:
+        n = load_streaming(engine, args.src, args.chunksize, incremental=args.incremental,
+                           client_geom=args.client_geom, resume=args.resume)
+    else:
+        n = load(engine, args.src, incremental=args.incremental, client_geom=args.client_geom)
+
+    # New or moved segments need a risk score
+    if n:
+        refresh_bikeway_risk(engine)
+        invalidate_api_cache("bikeway_risk")
 
 if __name__ == "__main__":
     main()
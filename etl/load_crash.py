@@ -1,94 +1,228 @@
 # etl/load_crash.py
-import sys, os, math
+import os, argparse
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
-load_dotenv()
-ENGINE_URL = os.getenv("DATABASE_URL")
-assert ENGINE_URL, "DATABASE_URL not found. Create a .env with DATABASE_URL=..."
+from api_hooks import invalidate_api_cache
+from bulk import Stopwatch, copy_frame, refresh_bikeway_risk, stream_csv
+from incremental import Counts, ensure_hash_column, merge_changed
 
-engine = create_engine(ENGINE_URL, future=True)
-SRC = sys.argv[1] if len(sys.argv) > 1 else "data/crash.csv"
-
-# ---------- 1) READ ----------
-df = pd.read_csv(SRC, dtype=str).fillna("")
+COLUMNS = ["crash_id", "occurred_at", "severity", "lon", "lat"]
 
 def pick(cols, *names):
     for n in names:
         if n in cols: return n
     return None
 
-col_id   = pick(df.columns, "incident_id", "object_id", "INCIDENT_ID", "objectid", "OBJECTID")
-col_lon  = pick(df.columns, "geo_lon", "POINT_X", "Longitude", "lon", "LONGITUDE")
-col_lat  = pick(df.columns, "geo_lat", "POINT_Y", "Latitude", "lat", "LATITUDE")
-col_time = pick(df.columns, "first_occurrence_date", "occurred_at", "FIRST_OCCURRENCE_DATE", "first_occurrence_dttm")
-col_fat  = pick(df.columns, "FATALITIES", "fatalities", "Fatalities")
-col_ser  = pick(df.columns, "SERIOUSLY_INJURED", "seriously_injured", "Seriously_Injured")
-
-need = [col_id, col_lon, col_lat, col_time]
-missing = [nm for nm, c in zip(["id","lon","lat","time"], need) if c is None]
-if missing:
-    raise SystemExit(f"Missing required columns in {SRC}: {missing}. Found: {list(df.columns)}")
-
-# ---------- 2) CLEAN ----------
-def to_float(x):
-    try: return float(x)
-    except: return math.nan
-
-def to_int(x):
-    try: return int(float(x))
-    except: return 0
-
-df["_lon"] = df[col_lon].map(to_float)
-df["_lat"] = df[col_lat].map(to_float)
-df = df[pd.notnull(df["_lon"]) & pd.notnull(df["_lat"])]
-
-# Parse times as tz-aware UTC
-t_aware = pd.to_datetime(df[col_time], errors="coerce", utc=True)
-valid = pd.notnull(t_aware)
-df = df[valid].copy()
-t_aware = t_aware[valid]
-
-# ---- FILTER using a tz-aware cutoff, then drop tz ----
-cut_aware = pd.Timestamp.now(tz="UTC") - pd.DateOffset(years=5)
-mask = t_aware >= cut_aware
-df = df[mask].copy()
-t_aware = t_aware[mask]
-
-# Now make naive UTC for DB
-df["_occurred_at"] = t_aware.dt.tz_convert("UTC").dt.tz_localize(None)
-
-# Severity: 1=fatal, 2=serious, 3=minor
-fat = df[col_fat].map(to_int) if col_fat else pd.Series([0]*len(df), index=df.index)
-ser = df[col_ser].map(to_int) if col_ser else pd.Series([0]*len(df), index=df.index)
-df["_severity"] = 3
-df.loc[ser > 0, "_severity"] = 2
-df.loc[fat > 0, "_severity"] = 1
-
-# De-dup
-df = df.drop_duplicates(subset=[col_id])
-
-# ---------- 3) UPSERT ----------
-rows = [{
-    "crash_id": str(r[col_id]),
-    "occurred_at": r["_occurred_at"].to_pydatetime(),
-    "severity": int(r["_severity"]),
-    "lon": float(r["_lon"]),
-    "lat": float(r["_lat"]),
-} for _, r in df.iterrows()]
-
-sql = text("""
+def resolve_columns(columns, src):
+    cols = {
+        "id":   pick(columns, "incident_id", "object_id", "INCIDENT_ID", "objectid", "OBJECTID"),
+        "lon":  pick(columns, "geo_lon", "POINT_X", "Longitude", "lon", "LONGITUDE"),
+        "lat":  pick(columns, "geo_lat", "POINT_Y", "Latitude", "lat", "LATITUDE"),
+        "time": pick(columns, "first_occurrence_date", "occurred_at", "FIRST_OCCURRENCE_DATE", "first_occurrence_dttm"),
+        "fat":  pick(columns, "FATALITIES", "fatalities", "Fatalities"),
+        "ser":  pick(columns, "SERIOUSLY_INJURED", "seriously_injured", "Seriously_Injured"),
+    }
+    missing = [nm for nm in ["id", "lon", "lat", "time"] if cols[nm] is None]
+    if missing:
+        raise SystemExit(f"Missing required columns in {src}: {missing}. Found: {list(columns)}")
+    return cols
+
+def _numeric(s):
+    return pd.to_numeric(s.str.strip(), errors="coerce")
+
+def clean(df, cols):
+    """
+    Vectorized cleaning: raw string frame -> crash_id, occurred_at (naive UTC),
+    severity, lon, lat. Same rules as the original per-row cleaning.
+    """
+    lon = _numeric(df[cols["lon"]])
+    lat = _numeric(df[cols["lat"]])
+    # Parse times as tz-aware UTC
+    t_aware = pd.to_datetime(df[cols["time"]], errors="coerce", utc=True)
+
+    # Valid coordinates and time, within the last 5 years (tz-aware cutoff)
+    cut_aware = pd.Timestamp.now(tz="UTC") - pd.DateOffset(years=5)
+    keep = lon.notna() & lat.notna() & t_aware.notna() & (t_aware >= cut_aware)
+
+    # Severity: 1=fatal, 2=serious, 3=minor (counts truncate like int(float(x)))
+    zero = pd.Series(0.0, index=df.index)
+    fat = np.trunc(_numeric(df[cols["fat"]]).fillna(0)) if cols["fat"] else zero
+    ser = np.trunc(_numeric(df[cols["ser"]]).fillna(0)) if cols["ser"] else zero
+    severity = np.select([fat > 0, ser > 0], [1, 2], default=3)
+
+    out = pd.DataFrame({
+        "crash_id": df[cols["id"]].astype(str),
+        "occurred_at": t_aware.dt.tz_convert("UTC").dt.tz_localize(None),
+        "severity": severity.astype(np.int16),
+        "lon": lon,
+        "lat": lat,
+    }, index=df.index)[keep]
+
+    # De-dup
+    return out.drop_duplicates(subset=["crash_id"])
+
+# ---------- Row-by-row upsert (default) ----------
+UPSERT_SQL = text("""
 INSERT INTO saferide.crash (crash_id, occurred_at, severity, geom)
 VALUES (:crash_id, :occurred_at, :severity, ST_SetSRID(ST_Point(:lon,:lat),4326))
 ON CONFLICT (crash_id) DO UPDATE SET
   occurred_at = EXCLUDED.occurred_at,
   severity    = EXCLUDED.severity,
-  geom        = EXCLUDED.geom;
+  geom        = EXCLUDED.geom,
+  row_hash    = NULL;  -- content may have changed: no stale hash for --incremental
 """)
 
-with engine.begin() as conn:
+def upsert_rows(conn, rows_df):
+    rows = [{
+        "crash_id": r.crash_id,
+        "occurred_at": r.occurred_at.to_pydatetime(),
+        "severity": int(r.severity),
+        "lon": float(r.lon),
+        "lat": float(r.lat),
+    } for r in rows_df.itertuples(index=False)]
     if rows:
-        conn.execute(sql, rows)
-
-print(f"Loaded {len(rows)} crashes from {SRC}")
+        conn.execute(UPSERT_SQL, rows)
+    return len(rows)
+
+# ---------- Bulk: COPY into a staging table, one set-based upsert ----------
+STAGE_SQL = """
+CREATE TEMP TABLE crash_stage (
+  crash_id    TEXT,
+  occurred_at TIMESTAMP,
+  severity    SMALLINT,
+  lon         DOUBLE PRECISION,
+  lat         DOUBLE PRECISION
+) ON COMMIT DROP;
+"""
+
+MERGE_SQL = """
+INSERT INTO saferide.crash (crash_id, occurred_at, severity, geom)
+SELECT crash_id, occurred_at, severity, ST_SetSRID(ST_Point(lon, lat), 4326)
+FROM crash_stage
+ON CONFLICT (crash_id) DO UPDATE SET
+  occurred_at = EXCLUDED.occurred_at,
+  severity    = EXCLUDED.severity,
+  geom        = EXCLUDED.geom,
+  row_hash    = NULL;
+"""
+
+def bulk_upsert(conn, rows_df, watch=None):
+    """COPY the cleaned rows into a temp table and merge them in one statement."""
+    conn.exec_driver_sql(STAGE_SQL)
+    copy_frame(conn.connection.dbapi_connection, "crash_stage", rows_df, COLUMNS)
+    if watch: watch.lap("copy", len(rows_df))
+    merged = conn.exec_driver_sql(MERGE_SQL).rowcount
+    if watch: watch.lap("merge", merged)
+    return merged
+
+# ---------- Incremental: only new or changed rows (etl/incremental.py) ----------
+INC_STAGE_SQL = """
+CREATE TEMP TABLE crash_stage (
+  crash_id    TEXT,
+  occurred_at TIMESTAMP,
+  severity    SMALLINT,
+  lon         DOUBLE PRECISION,
+  lat         DOUBLE PRECISION,
+  row_hash    BIGINT
+) ON COMMIT DROP;
+"""
+
+INC_MERGE_SQL = """
+INSERT INTO saferide.crash (crash_id, occurred_at, severity, geom, row_hash)
+SELECT crash_id, occurred_at, severity, ST_SetSRID(ST_Point(lon, lat), 4326), row_hash
+FROM crash_stage
+ON CONFLICT (crash_id) DO UPDATE SET
+  occurred_at = EXCLUDED.occurred_at,
+  severity    = EXCLUDED.severity,
+  geom        = EXCLUDED.geom,
+  row_hash    = EXCLUDED.row_hash
+WHERE saferide.crash.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+RETURNING (xmax = 0) AS inserted;
+"""
+
+def incremental_upsert(conn, rows_df, counts):
+    """Merge only rows whose content hash changed; adds to `counts`, returns rows written."""
+    c = merge_changed(conn, "crash", rows_df, table="crash", key="crash_id",
+                      hash_columns=COLUMNS, ts_col="occurred_at",
+                      stage_sql=INC_STAGE_SQL, stage_table="crash_stage",
+                      stage_columns=COLUMNS, merge_sql=INC_MERGE_SQL)
+    counts.add(c)
+    return c.inserted + c.updated
+
+def write(conn, rows_df, bulk=False, counts=None, watch=None):
+    if counts is not None:
+        n = incremental_upsert(conn, rows_df, counts)
+    else:
+        ensure_hash_column(conn, "crash")
+        if bulk:
+            return bulk_upsert(conn, rows_df, watch)
+        n = upsert_rows(conn, rows_df)
+    if watch: watch.lap("upsert", n)
+    return n
+
+def load(engine, src, bulk=False, incremental=False):
+    watch = Stopwatch()
+    counts = Counts() if incremental else None
+    # ---------- 1) READ ----------
+    df = pd.read_csv(src, dtype=str).fillna("")
+    watch.lap("read", len(df))
+    cols = resolve_columns(df.columns, src)
+
+    # ---------- 2) CLEAN ----------
+    rows_df = clean(df, cols)
+    del df
+    watch.lap("clean", len(rows_df))
+
+    # ---------- 3) UPSERT ----------
+    with engine.begin() as conn:
+        n = write(conn, rows_df, bulk=bulk, counts=counts, watch=watch)
+    watch.report(f"Loaded {n} crashes from {src}" + (f" ({counts})" if counts else ""), n)
+    return n
+
+def load_streaming(engine, src, chunksize, bulk=False, incremental=False, resume=False):
+    """Chunked load: one transaction (and checkpoint) per chunk, flat memory."""
+    counts = Counts() if incremental else None
+
+    def load_chunk(conn, df):
+        return write(conn, clean(df, resolve_columns(df.columns, src)), bulk=bulk, counts=counts)
+
+    watch = Stopwatch()
+    read, n = stream_csv(engine, "crash", src, chunksize, load_chunk, resume=resume)
+    watch.lap("stream", read)
+    watch.report(f"Loaded {n} crashes from {src}" + (f" ({counts})" if counts else ""), n)
+    return n
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load Denver crash CSV into saferide.crash")
+    ap.add_argument("src", nargs="?", default="data/crash.csv")
+    ap.add_argument("--bulk", action="store_true",
+                    help="COPY into a staging table and merge with one set-based upsert")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only write new or changed rows (content hash + occurred_at watermark)")
+    ap.add_argument("--chunksize", type=int, default=0,
+                    help="stream the file in chunks of this many rows, one transaction each")
+    ap.add_argument("--resume", action="store_true",
+                    help="with --chunksize: skip rows committed by an interrupted run of the same file")
+    args = ap.parse_args(argv)
+
+    load_dotenv()
+    ENGINE_URL = os.getenv("DATABASE_URL")
+    assert ENGINE_URL, "DATABASE_URL not found. Create a .env with DATABASE_URL=..."
+    engine = create_engine(ENGINE_URL, future=True)
+
+    if args.chunksize > 0:
+        n = load_streaming(engine, args.src, args.chunksize, bulk=args.bulk,
+                           incremental=args.incremental, resume=args.resume)
+    else:
+        n = load(engine, args.src, bulk=args.bulk, incremental=args.incremental)
+
+    # Cached route scores are stale once new crashes are in
+    if n:
+        refresh_bikeway_risk(engine)
+        invalidate_api_cache("scores,crash_index,tiles,bikeway_risk")
+
+if __name__ == "__main__":
+    main()
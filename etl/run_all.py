@@ -0,0 +1,158 @@
+# etl/run_all.py
+"""
+Load crash, hazard (311) and bikeway data in one run.
+
+Each source gets its own thread that reads its CSV in chunks. The chunks are
+cleaned in a shared process pool and written back by the source thread, one
+transaction per chunk, through a single engine whose pool is capped at one
+connection per source. At the end it prints read/transform/load timings per
+source, refreshes saferide.bikeway_risk and invalidates the API caches the
+new data touches.
+
+    python etl/run_all.py
+    python etl/run_all.py --only crash,hazard --incremental --workers 4
+"""
+import os, time, argparse
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+from sqlalchemy import create_engine
+from dotenv import load_dotenv
+
+import load_crash, load_311, load_bikeway
+from api_hooks import invalidate_api_cache
+from bulk import Stopwatch, refresh_bikeway_risk
+from incremental import Counts
+
+DEFAULT_SRC = {
+    "crash":   "data/crash.csv",
+    "hazard":  "data/crash_311.csv",
+    "bikeway": "data/bicycle_inventory.csv",
+}
+
+# API caches to drop when a source changed
+INVALIDATES = {
+    "crash":   "scores,crash_index,tiles,bikeway_risk",
+    "hazard":  "scores,bikeway_risk",
+    "bikeway": "bikeway_risk",
+}
+
+# ---------- Worker side (runs in the process pool) ----------
+def transform(source, src, df, client_geom=False, cut=None):
+    """
+    Raw string chunk -> rows ready to write; returns (rows, rows in, seconds).
+    `cut` is the hazard opened_at cutoff, fixed once per run by the source side.
+    """
+    t = time.perf_counter()
+    if source == "crash":
+        out = load_crash.clean(df, load_crash.resolve_columns(df.columns, src))
+    elif source == "hazard":
+        out = load_311.clean(df, load_311.resolve_columns(df.columns, src), cut)
+    else:
+        out = load_bikeway.transform(df, client_geom)
+    return out, len(df), time.perf_counter() - t
+
+# ---------- Source side (one thread per source) ----------
+def write(source, conn, rows, ctx, counts):
+    if source == "crash":
+        return load_crash.write(conn, rows, bulk=True, counts=counts)
+    if source == "hazard":
+        return load_311.write(conn, rows, counts)
+    return load_bikeway.write(conn, rows, ctx["pk_col"], counts)
+
+def run_source(source, src, engine, procs, chunksize, max_pending, incremental, client_geom=False):
+    watch = Stopwatch()
+    counts = Counts() if incremental else None
+    ctx = {}
+    if source == "bikeway":
+        with engine.connect() as conn:
+            ctx["pk_col"] = load_bikeway.bikeway_pk(conn)
+    cut = load_311.recent_cutoff() if source == "hazard" else None
+
+    pending, loaded = deque(), 0
+
+    def drain_one():
+        rows, rows_in, secs = pending.popleft().result()
+        watch.add("transform", rows_in, secs)
+        t = time.perf_counter()
+        with engine.begin() as conn:
+            n = write(source, conn, rows, ctx, counts)
+        watch.add("load", n, time.perf_counter() - t)
+        return n
+
+    t0 = t = time.perf_counter()
+    for chunk in pd.read_csv(src, dtype=str, chunksize=chunksize):
+        watch.add("read", len(chunk), time.perf_counter() - t)
+        pending.append(procs.submit(transform, source, src, chunk.fillna(""), client_geom, cut))
+        # Bound the chunks in flight so memory stays flat
+        while len(pending) >= max_pending:
+            loaded += drain_one()
+        t = time.perf_counter()
+    while pending:
+        loaded += drain_one()
+
+    wall = time.perf_counter() - t0
+    print(f"[{source}] loaded {loaded:,} rows from {src} in {wall:.2f}s"
+          + (f" ({counts})" if counts else ""))
+    return {"source": source, "loaded": loaded, "wall": wall, "phases": watch.phases}
+
+def print_summary(results, wall):
+    print(f"\n{'source':<8} {'stage':<10} {'rows':>10} {'seconds':>9} {'rows/s':>12}")
+    for r in results:
+        for name, rows, secs in r["phases"]:
+            rate = rows / secs if secs > 0 else 0
+            print(f"{r['source']:<8} {name:<10} {rows:>10,} {secs:9.2f} {rate:>12,.0f}")
+        print(f"{r['source']:<8} {'wall':<10} {r['loaded']:>10,} {r['wall']:9.2f}")
+    print(f"all sources in {wall:.2f}s")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load all SafeRide sources concurrently")
+    for name, path in DEFAULT_SRC.items():
+        ap.add_argument(f"--{name}", default=path, help=f"{name} CSV (default {path})")
+    ap.add_argument("--only", default=",".join(DEFAULT_SRC),
+                    help="comma-separated sources to run (crash,hazard,bikeway)")
+    ap.add_argument("--chunksize", type=int, default=50_000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                    help="processes for cleaning/transforming chunks")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only write new or changed rows (see etl/incremental.py)")
+    ap.add_argument("--client-geom", action="store_true",
+                    help="reproject bikeway geometries in the workers (shapely/pyproj)")
+    args = ap.parse_args(argv)
+
+    sources = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = [s for s in sources if s not in DEFAULT_SRC]
+    if unknown:
+        raise SystemExit(f"Unknown sources {unknown}; expected some of {list(DEFAULT_SRC)}")
+
+    load_dotenv()
+    ENGINE_URL = os.getenv("DATABASE_URL")
+    assert ENGINE_URL, "DATABASE_URL not found. Create a .env with DATABASE_URL=..."
+    # Each source thread holds at most one connection at a time
+    engine = create_engine(ENGINE_URL, future=True, pool_size=len(sources),
+                           max_overflow=0, pool_pre_ping=True)
+
+    t0 = time.perf_counter()
+    max_pending = max(2, args.workers)
+    # spawn: workers must not inherit the source threads' locks via fork
+    with ProcessPoolExecutor(args.workers, mp_context=mp.get_context("spawn")) as procs, \
+         ThreadPoolExecutor(len(sources)) as threads:
+        futures = [threads.submit(run_source, s, getattr(args, s), engine, procs,
+                                  args.chunksize, max_pending, args.incremental, args.client_geom)
+                   for s in sources]
+        results = [f.result() for f in futures]
+    # One rescoring pass for everything the sources changed
+    if any(r["loaded"] for r in results):
+        refresh_bikeway_risk(engine)
+    engine.dispose()
+    print_summary(results, time.perf_counter() - t0)
+
+    scopes = sorted({scope for r in results if r["loaded"]
+                     for scope in INVALIDATES[r["source"]].split(",")})
+    if scopes:
+        invalidate_api_cache(",".join(scopes))
+
+if __name__ == "__main__":
+    main()
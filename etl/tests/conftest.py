@@ -0,0 +1,6 @@
+# etl/tests/conftest.py
+import os
+import sys
+
+# The loaders import each other as top-level modules (python etl/load_311.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+# etl/tests/test_load_311.py
+import pandas as pd
+
+import load_311
+
+def _write_csv(path):
+    now = pd.Timestamp.now("UTC").tz_localize(None)
+    recent = str(now - pd.Timedelta(days=10))
+    old = str(now - pd.Timedelta(days=900))
+    dates = [
+        "", "not a date", "",          # chunk 1: no parseable dates at all
+        recent, "", old,               # chunk 2: mixed
+        recent, recent, "garbage",
+        old,
+    ]
+    pd.DataFrame({
+        "OBJECTID": [str(i) for i in range(len(dates))],
+        "Longitude": ["-104.99"] * len(dates),
+        "Latitude": ["39.74"] * len(dates),
+        "Case Status": ["Open"] * len(dates),
+        "Case Created Date": dates,
+        "Topic": ["Pothole"] * len(dates),
+    }).to_csv(path, index=False)
+
+def _full(src, cut):
+    df = pd.read_csv(src, dtype=str).fillna("")
+    return load_311.clean(df, load_311.resolve_columns(df.columns, src), cut)
+
+def _chunked(src, cut, chunksize):
+    parts = [load_311.clean(df.fillna(""), load_311.resolve_columns(df.columns, src), cut)
+             for df in pd.read_csv(src, dtype=str, chunksize=chunksize)]
+    return pd.concat(parts)
+
+def test_chunked_and_full_runs_keep_the_same_rows(tmp_path):
+    src = str(tmp_path / "crash_311.csv")
+    _write_csv(src)
+    cut = load_311.recent_cutoff()
+
+    full = _full(src, cut)
+    assert sorted(full["hazard_id"]) == ["3", "6", "7"]
+    for chunksize in (1, 3, 4):
+        chunked = _chunked(src, cut, chunksize)
+        pd.testing.assert_frame_equal(chunked.reset_index(drop=True), full.reset_index(drop=True))
+
+def test_no_cut_keeps_undated_rows(tmp_path):
+    src = str(tmp_path / "crash_311.csv")
+    _write_csv(src)
+    assert len(_full(src, None)) == 10
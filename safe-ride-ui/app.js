@@ -20,6 +20,7 @@ map.addControl(new maplibregl.NavigationControl({ showCompass: false }), 'top-ri
 
 map.on('load', () => {
   addBasemaps();
+  addCrashHeat();
   setTheme(document.getElementById('theme').value);
   ensureRouteLayers();
 });
@@ -57,6 +58,34 @@ function setTheme(theme) {
 }
 document.getElementById('theme').addEventListener('change', e => setTheme(e.target.value));
 
+// ---------- Crash heat layer (vector tiles from /tiles) ----------
+function addCrashHeat() {
+  if (map.getSource('crashTiles')) return;
+  map.addSource('crashTiles', {
+    type: 'vector',
+    tiles: [`${API_BASE}/tiles/{z}/{x}/{y}.mvt`],
+    minzoom: 8,
+    maxzoom: 16
+  });
+  // Below z12 the tiles carry precomputed per-tile crash counts (polygons)
+  map.addLayer({
+    id: 'crash-density', type: 'fill', source: 'crashTiles', 'source-layer': 'crashes', maxzoom: 12,
+    filter: ['==', ['geometry-type'], 'Polygon'],
+    paint: {
+      'fill-color': ['interpolate', ['linear'], ['get', 'crashes'],
+        0, 'rgba(255,196,0,0)', 50, 'rgba(255,120,0,0.35)', 200, 'rgba(220,20,60,0.55)']
+    }
+  });
+  // From z12 on, individual crash points
+  map.addLayer({
+    id: 'crash-heat', type: 'heatmap', source: 'crashTiles', 'source-layer': 'crashes', minzoom: 12,
+    paint: {
+      'heatmap-radius': ['interpolate', ['linear'], ['zoom'], 12, 8, 16, 20],
+      'heatmap-opacity': 0.6
+    }
+  });
+}
+
 // ---------- Animated markers ----------
 let startMarker = null, endMarker = null;
 
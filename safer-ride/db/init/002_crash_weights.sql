@@ -23,10 +23,12 @@ SELECT
      WHEN 2 THEN 0.30
      ELSE 0.10
    END)
-  * EXP( - LN(2) * (EXTRACT(EPOCH FROM (NOW() - c.occurred_at)) / (30*24*3600.0)) / 24.0 ) AS weight
+  * EXP( - LN(2) * (EXTRACT(EPOCH FROM (NOW() - c.occurred_at)) / (30*24*3600.0)) / 24.0 ) AS weight,
+  c.geom3857              -- indexed Web Mercator geometry (see 10_schema.sql)
 FROM saferide.crash c;
 
 -- Helpful indexes (idempotent)
 CREATE INDEX IF NOT EXISTS idx_crash_geom_4326 ON saferide.crash USING GIST(geom);
 CREATE INDEX IF NOT EXISTS idx_crash_occurred_at ON saferide.crash(occurred_at);
 CREATE INDEX IF NOT EXISTS idx_crash_severity ON saferide.crash(severity);
+CREATE INDEX IF NOT EXISTS crash_gix_3857 ON saferide.crash USING GIST(geom3857);
@@ -19,7 +19,8 @@ CREATE TABLE IF NOT EXISTS bikeway (
   class      TEXT,  -- protected, buffered, painted, shared, trail, unpaved
   on_off     TEXT,  -- ON-STREET / OFF-STREET / NOT APPLICABLE
   status     TEXT,  -- EXISTING / PROPOSED / UNKNOWN
-  geom       geometry(MULTILINESTRING, 4326) NOT NULL
+  geom       geometry(MULTILINESTRING, 4326) NOT NULL,
+  row_hash   BIGINT     -- content hash for --incremental loads (etl/incremental.py)
 );
 CREATE INDEX IF NOT EXISTS bikeway_gix ON bikeway USING GIST (geom);
 
@@ -30,7 +31,8 @@ CREATE TABLE IF NOT EXISTS hazard (
   status     TEXT,        -- open, in_progress, closed
   opened_at  TIMESTAMP,
   closed_at  TIMESTAMP,
-  geom       geometry(POINT, 4326) NOT NULL
+  geom       geometry(POINT, 4326) NOT NULL,
+  row_hash   BIGINT       -- content hash for --incremental loads
 );
 CREATE INDEX IF NOT EXISTS hazard_gix ON hazard USING GIST (geom);
 CREATE INDEX IF NOT EXISTS hazard_opened_ix ON hazard (opened_at);
@@ -40,11 +42,26 @@ CREATE TABLE IF NOT EXISTS crash (
   crash_id    TEXT PRIMARY KEY,
   occurred_at TIMESTAMP,
   severity    SMALLINT,   -- 1=fatal, 2=serious, 3=minor (MVP mapping)
-  geom        geometry(POINT, 4326) NOT NULL
+  geom        geometry(POINT, 4326) NOT NULL,
+  row_hash    BIGINT      -- content hash for --incremental loads
 );
 CREATE INDEX IF NOT EXISTS crash_gix ON crash USING GIST (geom);
 CREATE INDEX IF NOT EXISTS crash_time_ix ON crash (occurred_at);
 
+-- Web Mercator copy of geom, kept in sync by Postgres (loaders never write it).
+-- Route scoring buffers in 3857 and joins on this column so crash_gix_3857 is
+-- used instead of transforming every crash per query. ADD COLUMN also
+-- upgrades tables created before the column existed.
+ALTER TABLE crash ADD COLUMN IF NOT EXISTS geom3857 geometry(POINT, 3857)
+  GENERATED ALWAYS AS (ST_Transform(geom, 3857)) STORED;
+CREATE INDEX IF NOT EXISTS crash_gix_3857 ON crash USING GIST (geom3857);
+
+-- row_hash on tables created before the column existed. Full loads reset it
+-- to NULL on the rows they write; --incremental loads store the hash.
+ALTER TABLE bikeway ADD COLUMN IF NOT EXISTS row_hash BIGINT;
+ALTER TABLE hazard  ADD COLUMN IF NOT EXISTS row_hash BIGINT;
+ALTER TABLE crash   ADD COLUMN IF NOT EXISTS row_hash BIGINT;
+
 -- Optional: user routes for alerts (lines)
 CREATE TABLE IF NOT EXISTS user_route (
   user_id     TEXT,
@@ -76,6 +76,115 @@ SELECT jsonb_build_object(
 );
 $$;
 
+-- Set-based variant: scores N routes in one call and returns, per route
+-- (1-based route_idx, array order), the same jsonb as saferide.score_route.
+-- Candidate crashes and hazards are gathered once, through the 4326 GiST
+-- indexes, for the union of the routes' buffered envelopes and cast to
+-- geography once; each route then only tests candidates inside its own box.
+-- The hazard status list is one case-insensitive regex (`.` stands where
+-- ILIKE's `_` matched any single character).
+CREATE OR REPLACE FUNCTION saferide.score_routes(
+    route_geoms geometry[],
+    lookback_days integer DEFAULT 365,
+    buffer_m double precision DEFAULT 50
+) RETURNS TABLE (route_idx integer, result jsonb)
+LANGUAGE sql
+STABLE
+AS $$
+WITH routes AS MATERIALIZED (
+  SELECT u.i::int AS i, m.geom, m.geom::geography AS geog,
+         GREATEST(ST_Length(m.geom::geography)/1000.0, 0.001) AS km
+  FROM unnest(route_geoms) WITH ORDINALITY AS u(g, i)
+  CROSS JOIN LATERAL (
+    SELECT ST_LineMerge(ST_CollectionExtract(ST_MakeValid(u.g), 2)) AS geom
+  ) m
+),
+boxes AS MATERIALIZED (
+  -- buffer_m in degrees, widened for longitude at the route's highest |lat|
+  SELECT r.i,
+         ST_Expand(r.geom,
+                   buffer_m / (110000.0 * cos(radians(LEAST(GREATEST(abs(ST_YMin(r.geom)), abs(ST_YMax(r.geom))), 89.0)))),
+                   buffer_m / 110000.0) AS box
+  FROM routes r
+),
+env AS (
+  SELECT ST_SetSRID(ST_Extent(box)::geometry, 4326) AS g FROM boxes
+),
+cand_crash AS MATERIALIZED (
+  SELECT c.severity, c.geom, c.geom::geography AS geog
+  FROM saferide.crash c, env
+  WHERE c.geom && env.g
+    AND c.occurred_at >= now() - make_interval(days => lookback_days)
+),
+cand_hazard AS MATERIALIZED (
+  SELECT h.geom, h.geom::geography AS geog
+  FROM saferide.hazard h, env
+  WHERE h.geom && env.g
+    AND lower(COALESCE(h.status,'')) ~ '^(open|re-opened|in.progress|pending.closure|waiting.on.customer|customer.updated)$'
+    AND (h.closed_at IS NULL OR h.closed_at >= now() - make_interval(days => lookback_days))
+    AND h.opened_at >= now() - make_interval(days => lookback_days)
+),
+cr AS (
+  SELECT b.i,
+         COALESCE(SUM(
+           CASE
+             WHEN cc.geom IS NULL THEN 0   -- no match (LEFT JOIN)
+             WHEN cc.severity = 3 THEN 3   -- serious
+             WHEN cc.severity = 2 THEN 2   -- injury
+             ELSE 1                        -- minor/other
+           END
+         ), 0) AS crash_weight,
+         COUNT(cc.geom)::int AS crash_cnt
+  FROM boxes b
+  JOIN routes r USING (i)
+  LEFT JOIN cand_crash cc
+    ON cc.geom && b.box AND ST_DWithin(cc.geog, r.geog, buffer_m)
+  GROUP BY b.i
+),
+hz AS (
+  SELECT b.i, COUNT(ch.geom)::int AS open_hazards
+  FROM boxes b
+  JOIN routes r USING (i)
+  LEFT JOIN cand_hazard ch
+    ON ch.geom && b.box AND ST_DWithin(ch.geog, r.geog, buffer_m)
+  GROUP BY b.i
+),
+dens AS (
+  SELECT
+    r.i,
+    cr.crash_weight / r.km AS crash_weight_per_km,
+    cr.crash_cnt    / r.km AS crash_cnt_per_km,
+    hz.open_hazards / r.km AS hazard_per_km,
+    cr.crash_weight, cr.crash_cnt, hz.open_hazards, r.km
+  FROM routes r
+  JOIN cr USING (i)
+  JOIN hz USING (i)
+),
+scores AS (
+  -- Same soft-saturating transforms and weights as saferide.score_route
+  SELECT
+    d.*,
+    (1 - exp(-(d.crash_weight_per_km / 1.5))) * 60.0  AS crash_points,
+    (1 - exp(-(d.hazard_per_km / 3.0)))        * 40.0  AS hazard_points
+  FROM dens d
+)
+SELECT s.i, jsonb_build_object(
+  'params',        jsonb_build_object('lookback_days', lookback_days, 'buffer_m', buffer_m),
+  'length_km',     s.km,
+  'counts',        jsonb_build_object('crashes', s.crash_cnt,
+                                      'crash_weight', s.crash_weight,
+                                      'open_hazards', s.open_hazards),
+  'densities',     jsonb_build_object('crash_cnt_per_km', s.crash_cnt_per_km,
+                                      'crash_weight_per_km', s.crash_weight_per_km,
+                                      'hazard_per_km', s.hazard_per_km),
+  'component_pts', jsonb_build_object('crash_points', s.crash_points,
+                                      'hazard_points', s.hazard_points),
+  'score',         CEIL(LEAST(s.crash_points + s.hazard_points, 100.0))::int
+)
+FROM scores s
+ORDER BY s.i;
+$$;
+
 -- WKT convenience wrapper
 CREATE OR REPLACE FUNCTION saferide.score_route_wkt(
     route_wkt text,
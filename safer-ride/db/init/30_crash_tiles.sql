@@ -0,0 +1,159 @@
+-- ================================
+-- Safer Ride: Crash Tile Aggregates
+-- ================================
+
+-- Per-tile crash counts and severity-weighted sums for slippy-map tiles
+-- (st_tilecoord convention: x from the west, y from the north). The API's
+-- normalization and hotspot queries read saferide.crash_tiles_z12 instead of
+-- scanning every crash. Statement-level triggers on saferide.crash keep the
+-- table current, so loaders need no extra step; rebuild_crash_tiles() does a
+-- full recompute (run it after adding a zoom to crash_tile_zoom).
+
+-- Zoom levels to maintain
+CREATE TABLE IF NOT EXISTS saferide.crash_tile_zoom (
+  z SMALLINT PRIMARY KEY
+);
+INSERT INTO saferide.crash_tile_zoom (z) VALUES (12) ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS saferide.crash_tiles (
+  z          SMALLINT NOT NULL,
+  x          INT NOT NULL,
+  y          INT NOT NULL,
+  crashes    INT NOT NULL DEFAULT 0,
+  weight_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  geom3857   geometry(POLYGON, 3857) NOT NULL,
+  PRIMARY KEY (z, x, y)
+);
+CREATE INDEX IF NOT EXISTS crash_tiles_z_crashes_ix ON saferide.crash_tiles (z, crashes DESC);
+
+-- Shape the API already queries (see saferide-api/app/db.py)
+CREATE OR REPLACE VIEW saferide.crash_tiles_z12 AS
+SELECT x, y, crashes, weight_sum, geom3857
+FROM saferide.crash_tiles
+WHERE z = 12;
+
+-- Severity weight, same scale as sev_w in saferide.crash_weights
+CREATE OR REPLACE FUNCTION saferide.crash_severity_weight(sev smallint)
+RETURNS double precision
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE sev
+    WHEN 4 THEN 1.00   -- fatal
+    WHEN 3 THEN 0.60   -- serious injury
+    WHEN 2 THEN 0.30   -- minor injury
+    ELSE 0.10          -- property damage only / unknown
+  END;
+$$;
+
+-- Add (+1) or remove (-1) crashes from every maintained zoom
+CREATE OR REPLACE FUNCTION saferide.crash_tiles_apply(
+    geoms geometry[],
+    severities smallint[],
+    signs integer[]
+) RETURNS void
+LANGUAGE sql
+AS $$
+  WITH d AS (
+    SELECT u.g, u.sev, u.sgn
+    FROM unnest(geoms, severities, signs) AS u(g, sev, sgn)
+  ),
+  agg AS (
+    SELECT zz.z, tc.x, tc.y,
+           SUM(d.sgn)::int AS crashes,
+           SUM(d.sgn * saferide.crash_severity_weight(d.sev)) AS weight_sum
+    FROM d
+    CROSS JOIN saferide.crash_tile_zoom zz
+    CROSS JOIN LATERAL st_tilecoord(zz.z, d.g) tc
+    GROUP BY zz.z, tc.x, tc.y
+  )
+  INSERT INTO saferide.crash_tiles AS t (z, x, y, crashes, weight_sum, geom3857)
+  SELECT z, x, y, crashes, weight_sum, ST_TileEnvelope(z, x, y)
+  FROM agg
+  WHERE crashes <> 0 OR weight_sum <> 0
+  ON CONFLICT (z, x, y) DO UPDATE SET
+    crashes    = t.crashes + EXCLUDED.crashes,
+    weight_sum = t.weight_sum + EXCLUDED.weight_sum;
+
+  -- Only tiles that lost crashes in this delta can have emptied out
+  DELETE FROM saferide.crash_tiles t
+  USING (
+    SELECT DISTINCT zz.z, tc.x, tc.y
+    FROM unnest(geoms, signs) AS u(g, sgn)
+    CROSS JOIN saferide.crash_tile_zoom zz
+    CROSS JOIN LATERAL st_tilecoord(zz.z, u.g) tc
+    WHERE u.sgn < 0
+  ) k
+  WHERE t.z = k.z AND t.x = k.x AND t.y = k.y
+    AND t.crashes <= 0;
+$$;
+
+-- Full recompute from saferide.crash; returns the number of tiles
+CREATE OR REPLACE FUNCTION saferide.rebuild_crash_tiles()
+RETURNS integer
+LANGUAGE sql
+AS $$
+  DELETE FROM saferide.crash_tiles;
+
+  INSERT INTO saferide.crash_tiles (z, x, y, crashes, weight_sum, geom3857)
+  SELECT zz.z, tc.x, tc.y,
+         COUNT(*)::int,
+         SUM(saferide.crash_severity_weight(c.severity)),
+         ST_TileEnvelope(zz.z, tc.x, tc.y)
+  FROM saferide.crash c
+  CROSS JOIN saferide.crash_tile_zoom zz
+  CROSS JOIN LATERAL st_tilecoord(zz.z, c.geom) tc
+  GROUP BY zz.z, tc.x, tc.y;
+
+  SELECT COUNT(*)::int FROM saferide.crash_tiles;
+$$;
+
+-- Incremental maintenance: one call per statement, using transition tables,
+-- so a bulk upsert costs a single aggregate rather than one update per row.
+CREATE OR REPLACE FUNCTION saferide.crash_tiles_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM saferide.crash_tiles_apply(array_agg(n.geom), array_agg(n.severity), array_agg(1))
+    FROM new_rows n;
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM saferide.crash_tiles_apply(array_agg(o.geom), array_agg(o.severity), array_agg(-1))
+    FROM old_rows o;
+  ELSE
+    -- Upserts rewrite unchanged rows too; only moved/re-graded crashes count
+    PERFORM saferide.crash_tiles_apply(array_agg(d.g), array_agg(d.sev), array_agg(d.sgn))
+    FROM (
+      SELECT o.geom AS g, o.severity AS sev, -1 AS sgn
+      FROM old_rows o JOIN new_rows n USING (crash_id)
+      WHERE o.geom IS DISTINCT FROM n.geom OR o.severity IS DISTINCT FROM n.severity
+      UNION ALL
+      SELECT n.geom, n.severity, 1
+      FROM old_rows o JOIN new_rows n USING (crash_id)
+      WHERE o.geom IS DISTINCT FROM n.geom OR o.severity IS DISTINCT FROM n.severity
+    ) d;
+  END IF;
+  RETURN NULL;
+END$$;
+
+DROP TRIGGER IF EXISTS crash_tiles_ins ON saferide.crash;
+CREATE TRIGGER crash_tiles_ins
+  AFTER INSERT ON saferide.crash
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.crash_tiles_trg();
+
+DROP TRIGGER IF EXISTS crash_tiles_upd ON saferide.crash;
+CREATE TRIGGER crash_tiles_upd
+  AFTER UPDATE ON saferide.crash
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.crash_tiles_trg();
+
+DROP TRIGGER IF EXISTS crash_tiles_del ON saferide.crash;
+CREATE TRIGGER crash_tiles_del
+  AFTER DELETE ON saferide.crash
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.crash_tiles_trg();
+
+-- Backfill from whatever is already loaded
+SELECT saferide.rebuild_crash_tiles();
@@ -0,0 +1,196 @@
+-- ================================
+-- Safer Ride: Precomputed Bikeway Risk
+-- ================================
+
+-- Risk score for every saferide.bikeway segment, computed in bulk with
+-- saferide.score_routes (20_risk.sql) and served by GET /bikeways/risk.
+-- Statement-level triggers on saferide.crash and saferide.hazard queue the
+-- points of changed rows; saferide.refresh_bikeway_risk() then rescores only
+-- segments near those points, plus new/moved segments and scores older than
+-- max_age (the lookback window slides). The ETL calls it after every load.
+
+-- Scoring parameters (single row)
+CREATE TABLE IF NOT EXISTS saferide.bikeway_risk_params (
+  id            BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  lookback_days INT NOT NULL DEFAULT 365,
+  buffer_m      DOUBLE PRECISION NOT NULL DEFAULT 50,
+  max_age       INTERVAL NOT NULL DEFAULT '1 day'
+);
+INSERT INTO saferide.bikeway_risk_params DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS saferide.bikeway_risk (
+  infra_id      TEXT PRIMARY KEY,
+  score         INT NOT NULL,
+  crashes       INT NOT NULL,
+  open_hazards  INT NOT NULL,
+  length_km     DOUBLE PRECISION NOT NULL,
+  lookback_days INT NOT NULL,
+  buffer_m      DOUBLE PRECISION NOT NULL,
+  result        JSONB NOT NULL,              -- full saferide.score_route payload
+  geom          geometry(MULTILINESTRING, 4326) NOT NULL,
+  scored_at     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS bikeway_risk_gix ON saferide.bikeway_risk USING GIST (geom);
+
+-- Points of crashes/hazards that changed since the last refresh
+CREATE TABLE IF NOT EXISTS saferide.bikeway_risk_pending (
+  id   BIGSERIAL PRIMARY KEY,
+  geom geometry(POINT, 4326) NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bikeway_risk_pending_gix ON saferide.bikeway_risk_pending USING GIST (geom);
+
+-- Rescore stale segments in spatially compact batches; returns segments scored
+CREATE OR REPLACE FUNCTION saferide.refresh_bikeway_risk(
+    full_refresh boolean DEFAULT false,
+    batch_size integer DEFAULT 500
+) RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  p     saferide.bikeway_risk_params%ROWTYPE;
+  upto  bigint;
+  total integer;
+  lo    integer;
+BEGIN
+  SELECT * INTO p FROM saferide.bikeway_risk_params;
+  SELECT COALESCE(max(id), 0) INTO upto FROM saferide.bikeway_risk_pending;
+
+  -- Segments to score, numbered in geohash order so each batch covers a small area
+  CREATE TEMP TABLE IF NOT EXISTS bikeway_risk_todo (ord integer PRIMARY KEY, infra_id text) ON COMMIT DROP;
+  TRUNCATE bikeway_risk_todo;
+  INSERT INTO bikeway_risk_todo (ord, infra_id)
+  SELECT row_number() OVER (ORDER BY ST_GeoHash(ST_PointOnSurface(b.geom), 10)), b.infra_id
+  FROM saferide.bikeway b
+  LEFT JOIN saferide.bikeway_risk r USING (infra_id)
+  WHERE full_refresh
+     OR r.infra_id IS NULL
+     OR r.geom IS DISTINCT FROM b.geom
+     OR r.lookback_days <> p.lookback_days
+     OR r.buffer_m <> p.buffer_m
+     OR r.scored_at < now() - p.max_age
+     -- near a changed crash/hazard (buffer in degrees, conservative up to 60° latitude)
+     OR EXISTS (SELECT 1 FROM saferide.bikeway_risk_pending q
+                WHERE q.id <= upto AND q.geom && ST_Expand(b.geom, p.buffer_m / 55000.0));
+  GET DIAGNOSTICS total = ROW_COUNT;
+
+  FOR lo IN 0 .. total - 1 BY batch_size LOOP
+    WITH batch AS (
+      SELECT array_agg(t.infra_id ORDER BY t.ord) AS ids,
+             array_agg(b.geom ORDER BY t.ord) AS geoms
+      FROM bikeway_risk_todo t
+      JOIN saferide.bikeway b USING (infra_id)
+      WHERE t.ord > lo AND t.ord <= lo + batch_size
+    ),
+    scored AS (
+      SELECT batch.ids[s.route_idx] AS infra_id, batch.geoms[s.route_idx] AS geom, s.result
+      FROM batch, saferide.score_routes(batch.geoms, p.lookback_days, p.buffer_m) s
+    )
+    INSERT INTO saferide.bikeway_risk AS r
+      (infra_id, score, crashes, open_hazards, length_km, lookback_days, buffer_m, result, geom, scored_at)
+    SELECT infra_id,
+           (result->>'score')::int,
+           (result->'counts'->>'crashes')::int,
+           (result->'counts'->>'open_hazards')::int,
+           (result->>'length_km')::float,
+           p.lookback_days, p.buffer_m, result, geom, now()
+    FROM scored
+    ON CONFLICT (infra_id) DO UPDATE SET
+      score         = EXCLUDED.score,
+      crashes       = EXCLUDED.crashes,
+      open_hazards  = EXCLUDED.open_hazards,
+      length_km     = EXCLUDED.length_km,
+      lookback_days = EXCLUDED.lookback_days,
+      buffer_m      = EXCLUDED.buffer_m,
+      result        = EXCLUDED.result,
+      geom          = EXCLUDED.geom,
+      scored_at     = EXCLUDED.scored_at;
+  END LOOP;
+
+  DELETE FROM saferide.bikeway_risk r
+  WHERE NOT EXISTS (SELECT 1 FROM saferide.bikeway b WHERE b.infra_id = r.infra_id);
+  DELETE FROM saferide.bikeway_risk_pending WHERE id <= upto;
+  RETURN total;
+END$$;
+
+-- Queue points of inserted/deleted rows and of updates that change anything
+-- the score reads. Loaders re-upsert unchanged rows, which must not dirty
+-- the whole network.
+CREATE OR REPLACE FUNCTION saferide.bikeway_risk_crash_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO saferide.bikeway_risk_pending (geom) SELECT n.geom FROM new_rows n;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO saferide.bikeway_risk_pending (geom) SELECT o.geom FROM old_rows o;
+  ELSE
+    INSERT INTO saferide.bikeway_risk_pending (geom)
+    SELECT g FROM old_rows o JOIN new_rows n USING (crash_id)
+    CROSS JOIN LATERAL (VALUES (o.geom), (n.geom)) AS v(g)
+    WHERE o.geom IS DISTINCT FROM n.geom
+       OR o.severity IS DISTINCT FROM n.severity
+       OR o.occurred_at IS DISTINCT FROM n.occurred_at;
+  END IF;
+  RETURN NULL;
+END$$;
+
+CREATE OR REPLACE FUNCTION saferide.bikeway_risk_hazard_trg()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO saferide.bikeway_risk_pending (geom) SELECT n.geom FROM new_rows n;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO saferide.bikeway_risk_pending (geom) SELECT o.geom FROM old_rows o;
+  ELSE
+    INSERT INTO saferide.bikeway_risk_pending (geom)
+    SELECT g FROM old_rows o JOIN new_rows n USING (hazard_id)
+    CROSS JOIN LATERAL (VALUES (o.geom), (n.geom)) AS v(g)
+    WHERE o.geom IS DISTINCT FROM n.geom
+       OR o.status IS DISTINCT FROM n.status
+       OR o.opened_at IS DISTINCT FROM n.opened_at
+       OR o.closed_at IS DISTINCT FROM n.closed_at;
+  END IF;
+  RETURN NULL;
+END$$;
+
+DROP TRIGGER IF EXISTS bikeway_risk_crash_ins ON saferide.crash;
+CREATE TRIGGER bikeway_risk_crash_ins
+  AFTER INSERT ON saferide.crash
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.bikeway_risk_crash_trg();
+
+DROP TRIGGER IF EXISTS bikeway_risk_crash_upd ON saferide.crash;
+CREATE TRIGGER bikeway_risk_crash_upd
+  AFTER UPDATE ON saferide.crash
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.bikeway_risk_crash_trg();
+
+DROP TRIGGER IF EXISTS bikeway_risk_crash_del ON saferide.crash;
+CREATE TRIGGER bikeway_risk_crash_del
+  AFTER DELETE ON saferide.crash
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.bikeway_risk_crash_trg();
+
+DROP TRIGGER IF EXISTS bikeway_risk_hazard_ins ON saferide.hazard;
+CREATE TRIGGER bikeway_risk_hazard_ins
+  AFTER INSERT ON saferide.hazard
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.bikeway_risk_hazard_trg();
+
+DROP TRIGGER IF EXISTS bikeway_risk_hazard_upd ON saferide.hazard;
+CREATE TRIGGER bikeway_risk_hazard_upd
+  AFTER UPDATE ON saferide.hazard
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.bikeway_risk_hazard_trg();
+
+DROP TRIGGER IF EXISTS bikeway_risk_hazard_del ON saferide.hazard;
+CREATE TRIGGER bikeway_risk_hazard_del
+  AFTER DELETE ON saferide.hazard
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION saferide.bikeway_risk_hazard_trg();
+
+-- Backfill from whatever is already loaded
+SELECT saferide.refresh_bikeway_risk(true);
@@ -0,0 +1,196 @@
+# saferide-api/app/cache.py
+"""
+Small in-process caches shared by the API modules.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+
+    `maxsize` bounds the number of entries; the least recently used entry is
+    evicted first. Expired entries are dropped lazily on lookup.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        self.name = name
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize == 0:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> int:
+        """Drop every entry; returns how many were removed."""
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+            self.invalidations += 1
+            return n
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+class DiskCache:
+    """
+    JSON-on-disk cache tier that several workers or containers can share
+    (e.g. a mounted volume). One file per key, sharded by hash prefix, written
+    atomically via rename; entries older than `ttl` are treated as misses.
+    """
+
+    def __init__(self, root: str, ttl: float, name: str = "disk"):
+        self.name = name
+        self.root = root
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + ".json")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                self.misses += 1
+                return default
+            with open(path, "r") as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except (OSError, ValueError):
+            self.errors += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError:
+            self.errors += 1
+
+    def clear(self) -> int:
+        n = 0
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                if fn.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(dirpath, fn))
+                        n += 1
+                    except OSError:
+                        pass
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "root": self.root, "ttl_s": self.ttl,
+                "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+# ---- Registry -------------------------------------------------------------------
+
+_registry: Dict[str, Any] = {}
+
+def register(name: str, c: Any) -> Any:
+    """Make a cache (anything with clear() and stats()) visible to invalidate()/stats()."""
+    _registry[name] = c
+    return c
+
+def invalidate(scope: Optional[str] = None) -> Dict[str, int]:
+    """
+    Clear the caches named by `scope` (comma-separated; all when None);
+    returns entries dropped per cache.
+    """
+    names = None if scope is None else {n.strip() for n in scope.split(",")}
+    return {name: c.clear() for name, c in _registry.items() if names is None or name in names}
+
+def stats() -> Dict[str, Any]:
+    return {name: c.stats() for name, c in _registry.items()}
+
+# ---- Route score cache --------------------------------------------------------
+
+# Coordinates are quantized to this many decimal places before hashing
+# (5 ≈ 1.1 m), so float noise in identical OSRM geometries still hits.
+SCORE_CACHE_PRECISION = int(os.getenv("SCORE_CACHE_PRECISION", "5"))
+
+score_cache = register("scores", TTLCache(
+    maxsize=int(os.getenv("SCORE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SCORE_CACHE_TTL", "3600")),
+    name="route_scores",
+))
+
+def route_score_key(line: Sequence[float], buffer_m: float, variant: str = "",
+                    precision: int = SCORE_CACHE_PRECISION) -> str:
+    """
+    Hash of the quantized flat [lon, lat, lon, lat, ...] line plus the buffer
+    and the scoring variant (strategy/engine) that produced the count.
+    """
+    scale = 10 ** precision
+    q = [round(v * scale) for v in line]
+    h = hashlib.blake2b(digest_size=16)
+    h.update(variant.encode("utf-8"))
+    h.update(struct.pack("<d", float(buffer_m)))
+    h.update(struct.pack(f"<{len(q)}q", *q))
+    return h.hexdigest()
@@ -0,0 +1,277 @@
+# saferide-api/app/crash_index.py
+"""
+In-process crash index for DB-free route scoring (SCORING_ENGINE=memory).
+
+Crash points are held as NumPy arrays in Web Mercator meters, bucketed into a
+uniform grid (points sorted by cell id plus a per-cell offset table). Scoring
+a route only compares each segment with the points in the grid cells its
+buffered bounding box overlaps, and counts the distinct points within
+`buffer_m` of any segment.
+
+Results match the SQL path (ST_Buffer in EPSG:3857 + ST_Intersects) up to the
+polygonal approximation of ST_Buffer: its quarter circles have 8 segments, so
+points in the outermost ~2% of the buffer radius may be counted here but not
+in SQL.
+
+Snapshot / reload:
+    python -m app.crash_index snapshot crash_index.npz   # dump from the DB
+    CRASH_INDEX_SNAPSHOT=crash_index.npz                  # load it at startup
+    POST /routes/crash_index/reload                       # rebuild after ETL
+
+The snapshot only seeds the first load. Reloads and cache invalidation
+rebuild from the DB (that is where new crashes land) and then drop the
+cached route scores computed against the old index.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from .cache import register, score_cache
+
+CELL_M = float(os.getenv("CRASH_INDEX_CELL_M", "200"))
+SNAPSHOT = os.getenv("CRASH_INDEX_SNAPSHOT")
+MAX_CELLS = 4_000_000
+
+_R = 6378137.0  # EPSG:3857 sphere radius
+
+# Same relation the SQL strategies in app.scoring score against
+SQL_CRASH_POINTS = """
+SELECT ST_X(geom3857) AS x, ST_Y(geom3857) AS y
+FROM saferide.crash_weights;
+"""
+
+def lonlat_to_3857(coords: Sequence[Sequence[float]]) -> np.ndarray:
+    """[[lon, lat], ...] -> (N, 2) array of Web Mercator meters."""
+    a = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    x = np.radians(a[:, 0]) * _R
+    y = np.log(np.tan(np.pi / 4.0 + np.radians(a[:, 1]) / 2.0)) * _R
+    return np.column_stack((x, y))
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expand (start, count) pairs into flat indices; also returns, for every
+    output element, the position of the pair it came from.
+    """
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return starts[owner] + offset, owner
+
+class CrashIndex:
+    """Uniform-grid index over crash points in EPSG:3857."""
+
+    def __init__(self, xy: np.ndarray, cell_m: float = CELL_M, source: str = ""):
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        xy = xy[np.isfinite(xy).all(axis=1)]
+        self.source = source
+        self.loaded_at = time.time()
+        self.size = len(xy)
+
+        if self.size == 0:
+            self.x0 = self.y0 = 0.0
+            self.cell = float(cell_m)
+            self.ncols = self.nrows = 1
+        else:
+            self.x0, self.y0 = xy.min(axis=0)
+            span_x, span_y = xy.max(axis=0) - (self.x0, self.y0)
+            cell = float(cell_m)
+            # Keep the offset table bounded if a few points are far outliers
+            while (span_x // cell + 1) * (span_y // cell + 1) > MAX_CELLS:
+                cell *= 2.0
+            self.cell = cell
+            self.ncols = int(span_x // cell) + 1
+            self.nrows = int(span_y // cell) + 1
+
+        cid = self._cell_ids(xy[:, 0], xy[:, 1]) if self.size else np.empty(0, np.int64)
+        order = np.argsort(cid, kind="stable")
+        self.xs = np.ascontiguousarray(xy[order, 0])
+        self.ys = np.ascontiguousarray(xy[order, 1])
+        self.offsets = np.searchsorted(cid[order], np.arange(self.ncols * self.nrows + 1))
+
+    def _cell_ids(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        cx = ((x - self.x0) // self.cell).astype(np.int64)
+        cy = ((y - self.y0) // self.cell).astype(np.int64)
+        return cy * self.ncols + cx
+
+    # ---- Scoring ---------------------------------------------------------------
+
+    def count_within(self, coords: Sequence[Sequence[float]], buffer_m: float) -> int:
+        """Number of crashes within `buffer_m` (3857 units) of the polyline [[lon, lat], ...]."""
+        if self.size == 0 or len(coords) == 0:
+            return 0
+        p = lonlat_to_3857(coords)
+        if len(p) == 1:
+            p = np.vstack((p, p))
+        ax, ay, bx, by = p[:-1, 0], p[:-1, 1], p[1:, 0], p[1:, 1]
+        r = float(buffer_m)
+
+        # Grid cells overlapped by each segment's bbox grown by the buffer
+        cx0 = np.floor((np.minimum(ax, bx) - r - self.x0) / self.cell).astype(np.int64)
+        cx1 = np.floor((np.maximum(ax, bx) + r - self.x0) / self.cell).astype(np.int64)
+        cy0 = np.floor((np.minimum(ay, by) - r - self.y0) / self.cell).astype(np.int64)
+        cy1 = np.floor((np.maximum(ay, by) + r - self.y0) / self.cell).astype(np.int64)
+        np.maximum(cx0, 0, out=cx0)
+        np.minimum(cx1, self.ncols - 1, out=cx1)
+        np.maximum(cy0, 0, out=cy0)
+        np.minimum(cy1, self.nrows - 1, out=cy1)
+        nx = np.maximum(cx1 - cx0 + 1, 0)
+        ny = np.maximum(cy1 - cy0 + 1, 0)
+
+        k, seg = _ranges(np.zeros(len(nx), np.int64), nx * ny)
+        if len(k) == 0:
+            return 0
+        cell = (cy0[seg] + k // nx[seg]) * self.ncols + (cx0[seg] + k % nx[seg])
+
+        # (segment, point) candidate pairs for every point in those cells
+        start = self.offsets[cell]
+        pt, pair = _ranges(start, self.offsets[cell + 1] - start)
+        if len(pt) == 0:
+            return 0
+        seg = seg[pair]
+
+        # Point-to-segment distance, vectorized over all pairs
+        sx, sy = bx[seg] - ax[seg], by[seg] - ay[seg]
+        px, py = self.xs[pt] - ax[seg], self.ys[pt] - ay[seg]
+        len2 = sx * sx + sy * sy
+        t = np.divide(px * sx + py * sy, len2, out=np.zeros_like(len2), where=len2 > 0)
+        np.clip(t, 0.0, 1.0, out=t)
+        dx, dy = px - t * sx, py - t * sy
+        hit = dx * dx + dy * dy <= r * r
+        return int(np.unique(pt[hit]).size)
+
+    def count_routes(self, coords_list: Sequence[Sequence[Sequence[float]]],
+                     buffer_m: float) -> list[int]:
+        return [self.count_within(c, buffer_m) for c in coords_list]
+
+    # ---- Persistence -----------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, xy=np.column_stack((self.xs, self.ys)))
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "CrashIndex":
+        with np.load(path) as data:
+            return cls(data["xy"], source=f"snapshot:{path}")
+
+    @classmethod
+    def from_db(cls) -> "CrashIndex":
+        from psycopg.rows import tuple_row
+        from .db import get_pool
+
+        with get_pool().connection() as conn:
+            with conn.cursor(row_factory=tuple_row) as cur:
+                cur.execute(SQL_CRASH_POINTS)
+                rows = cur.fetchall()
+        xy = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return cls(xy, source="db:saferide.crash_weights")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "points": self.size,
+            "cell_m": self.cell,
+            "grid": [self.ncols, self.nrows],
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+        }
+
+# ---- Process-wide instance ------------------------------------------------------
+
+class _IndexHolder:
+    """Lazily loaded, atomically swappable CrashIndex (registered as a cache)."""
+
+    def __init__(self):
+        self._index: Optional[CrashIndex] = None
+        self._lock = threading.Lock()
+        self._stale = False
+        self._rebuild: Optional[threading.Thread] = None
+
+    def get(self) -> CrashIndex:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load(snapshot=True)
+        return self._index
+
+    def _load(self, snapshot: bool = False) -> CrashIndex:
+        t = time.perf_counter()
+        if snapshot and SNAPSHOT and os.path.exists(SNAPSHOT):
+            idx = CrashIndex.from_snapshot(SNAPSHOT)
+        else:
+            idx = CrashIndex.from_db()
+        logging.info(f"Crash index loaded: {idx.size} points from {idx.source} "
+                     f"in {time.perf_counter() - t:.2f}s")
+        return idx
+
+    def _swap(self, idx: CrashIndex) -> None:
+        with self._lock:
+            self._index = idx
+        # Scores cached while the old index was live (including any computed
+        # during the rebuild) would outlive it by up to SCORE_CACHE_TTL
+        score_cache.clear()
+
+    def reload(self) -> CrashIndex:
+        """Rebuild from the DB and swap it in; requests keep using the old one meanwhile."""
+        idx = self._load()
+        self._swap(idx)
+        return idx
+
+    def clear(self) -> int:
+        """
+        Invalidation means "new crashes landed": mark the index stale and
+        rebuild it on a background thread if we were in use, so the caller
+        (POST /routes/cache/invalidate) does not wait for the load.
+        """
+        if self._index is None:
+            return 0
+        with self._lock:
+            self._stale = True
+            if self._rebuild is None:
+                self._rebuild = threading.Thread(target=self._refresh, name="crash-index-rebuild",
+                                                 daemon=True)
+                self._rebuild.start()
+        return self._index.size
+
+    def _refresh(self) -> None:
+        # Invalidations that arrive mid-load set _stale again and get one more pass
+        while True:
+            with self._lock:
+                if not self._stale:
+                    self._rebuild = None
+                    return
+                self._stale = False
+            try:
+                idx = self._load()
+            except Exception:
+                logging.error("Crash index rebuild failed; keeping the previous index", exc_info=True)
+                with self._lock:
+                    self._rebuild = None
+                return
+            self._swap(idx)
+
+    def stats(self) -> Dict[str, Any]:
+        if self._index is None:
+            return {"points": None}
+        return {**self._index.stats(), "stale": self._stale or self._rebuild is not None}
+
+holder = register("crash_index", _IndexHolder())
+
+def get_index() -> CrashIndex:
+    return holder.get()
+
+def reload_index() -> CrashIndex:
+    return holder.reload()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "snapshot":
+        index = CrashIndex.from_db()
+        index.save(sys.argv[2])
+        print(f"Wrote {index.size} crash points to {sys.argv[2]}")
+    else:
+        raise SystemExit("usage: python -m app.crash_index snapshot <path.npz>")
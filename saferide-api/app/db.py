@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import sys
+import threading
+import time
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
-from psycopg_pool import ConnectionPool
-from psycopg.rows import dict_row
+if TYPE_CHECKING:
+    from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
 # ---- Connection pool ---------------------------------------------------------
 
@@ -18,6 +22,11 @@ class DBConfig:
     password: str = os.getenv("PGPASSWORD", "postgres")
     pool_min: int = int(os.getenv("PGPOOL_MIN", "1"))
     pool_max: int = int(os.getenv("PGPOOL_MAX", "10"))
+    # Async ranking path (RANK_ASYNC): its own pool, waiters queue without a thread
+    async_pool_max: int = int(os.getenv("PGPOOL_ASYNC_MAX", os.getenv("PGPOOL_MAX", "10")))
+    # Server-side prepared statements for the hot queries (fetchall_rows(prepare=True));
+    # turn off behind a transaction-mode PgBouncer
+    prepare: bool = os.getenv("PG_PREPARE", "1").lower() in ("1", "true", "yes")
 
     @property
     def dsn(self) -> str:
@@ -28,13 +37,17 @@ class DBConfig:
 
 cfg = DBConfig()
 
-# Lazy initialization of connection pool
-_pool: Optional[ConnectionPool] = None
+# Lazy initialization of connection pool. psycopg itself is imported on first
+# use too, so importing the app (Lambda cold start, worker boot) does no DB work.
+_pool: Optional["ConnectionPool"] = None
 
-def get_pool() -> ConnectionPool:
+def get_pool() -> "ConnectionPool":
     """Get or create the connection pool (lazy initialization)"""
     global _pool
     if _pool is None:
+        from psycopg_pool import ConnectionPool
+        from psycopg.rows import dict_row
+
         _pool = ConnectionPool(
             cfg.dsn,
             min_size=cfg.pool_min,
@@ -43,8 +56,44 @@ def get_pool() -> ConnectionPool:
         )
     return _pool
 
+# The async pool is bound to the event loop that opened it, like the OSRM
+# AsyncClient (app.osrm). Opening runs once per loop; concurrent first
+# callers all await the same task.
+_apool: Optional["AsyncConnectionPool"] = None
+_apool_loop: Optional[asyncio.AbstractEventLoop] = None
+_apool_opening: Optional["asyncio.Task[None]"] = None
+
+async def get_async_pool() -> "AsyncConnectionPool":
+    """Get or create the async connection pool (lazy initialization)"""
+    global _apool, _apool_loop, _apool_opening
+    loop = asyncio.get_running_loop()
+    if _apool is None or _apool_loop is not loop:
+        from psycopg_pool import AsyncConnectionPool
+        from psycopg.rows import dict_row
+
+        _apool = AsyncConnectionPool(
+            cfg.dsn,
+            min_size=cfg.pool_min,
+            max_size=cfg.async_pool_max,
+            kwargs={"row_factory": dict_row},
+            open=False,
+        )
+        _apool_loop = loop
+        _apool_opening = loop.create_task(_apool.open())
+    await _apool_opening
+    return _apool
+
+async def aclose_async_pool() -> None:
+    global _apool, _apool_loop, _apool_opening
+    if _apool is not None:
+        await _apool.close()
+        _apool, _apool_loop, _apool_opening = None, None, None
+
 def init_database() -> None:
-    """Initialize database with PostGIS extension if needed"""
+    """
+    Initialize database with PostGIS extension if needed.
+    One-off setup step (`python -m app.db init`); the app never calls it on import.
+    """
     try:
         pool = get_pool()
         with pool.connection() as conn:
@@ -57,7 +106,7 @@ def init_database() -> None:
                         SELECT 1 FROM pg_extension WHERE extname = 'postgis'
                     );
                 """)
-                postgis_exists = cur.fetchone()[0]
+                postgis_exists = next(iter(cur.fetchone().values()))
                 
                 if postgis_exists:
                     print("✓ PostGIS extension already installed")
@@ -79,7 +128,7 @@ def init_database() -> None:
                         WHERE schema_name = 'saferide'
                     );
                 """)
-                schema_exists = cur.fetchone()[0]
+                schema_exists = next(iter(cur.fetchone().values()))
                 
                 if schema_exists:
                     print("✓ saferide schema already exists")
@@ -96,6 +145,54 @@ def init_database() -> None:
         # Don't fail startup if initialization has issues
         pass
 
+# ---- Statement timing --------------------------------------------------------
+
+class StatementStats:
+    """
+    Calls, rows and time per named statement. `execute` is the round trip
+    (parse/plan unless prepared, run, result transfer); `fetch` is turning the
+    result into Python rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, execute_s: float, fetch_s: float, rows: int) -> None:
+        with self._lock:
+            s = self._by_name.setdefault(name, {
+                "calls": 0, "rows": 0, "execute_s": 0.0, "execute_max_s": 0.0, "fetch_s": 0.0})
+            s["calls"] += 1
+            s["rows"] += rows
+            s["execute_s"] += execute_s
+            s["execute_max_s"] = max(s["execute_max_s"], execute_s)
+            s["fetch_s"] += fetch_s
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(s) for name, s in self._by_name.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        out = {}
+        for name, s in self.snapshot().items():
+            n = s["calls"] or 1
+            out[name] = {
+                "calls": int(s["calls"]),
+                "rows": int(s["rows"]),
+                "execute_ms_mean": round(1000.0 * s["execute_s"] / n, 3),
+                "execute_ms_max": round(1000.0 * s["execute_max_s"], 3),
+                "fetch_ms_mean": round(1000.0 * s["fetch_s"] / n, 3),
+            }
+        return {"prepare": cfg.prepare, "statements": out}
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._by_name)
+            self._by_name.clear()
+        return n
+
+statement_stats = StatementStats()
+
 # ---- Small helpers -----------------------------------------------------------
 
 def fetchone_value(sql: str, params: tuple[Any, ...]) -> Optional[Any]:
@@ -116,6 +213,50 @@ def fetchone_value(sql: str, params: tuple[Any, ...]) -> Optional[Any]:
                 return row["result"]
             return next(iter(row.values())) if row else None
 
+def _prepare_flag(prepare: bool) -> Optional[bool]:
+    # None leaves it to psycopg (prepared after prepare_threshold executions)
+    if not prepare:
+        return None
+    return cfg.prepare
+
+def fetchall_rows(sql: str, params: tuple[Any, ...], name: Optional[str] = None,
+                  prepare: bool = False, binary: bool = False) -> list[dict[str, Any]]:
+    """
+    Execute a multi-row SELECT and return every row as a dict.
+
+    prepare: server-side prepared statement on first use on each connection,
+    so repeated calls skip parse/plan. binary: binary result format. Use %b
+    placeholders for parameters that should go over in binary (bytea/bytea[]
+    of WKB) instead of hex-escaped text. With a `name`, the call is timed in
+    statement_stats.
+    """
+    pool = get_pool()
+    with pool.connection() as conn:
+        with conn.cursor(binary=binary) as cur:
+            t0 = time.perf_counter()
+            cur.execute(sql, params, prepare=_prepare_flag(prepare))
+            t1 = time.perf_counter()
+            rows = list(cur.fetchall())
+    if name:
+        statement_stats.record(name, t1 - t0, time.perf_counter() - t1, len(rows))
+    return rows
+
+async def afetchall_rows(sql: str, params: tuple[Any, ...], name: Optional[str] = None,
+                         prepare: bool = False, binary: bool = False) -> list[dict[str, Any]]:
+    """
+    fetchall_rows on the async pool
+    """
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor(binary=binary) as cur:
+            t0 = time.perf_counter()
+            await cur.execute(sql, params, prepare=_prepare_flag(prepare))
+            t1 = time.perf_counter()
+            rows = list(await cur.fetchall())
+    if name:
+        statement_stats.record(name, t1 - t0, time.perf_counter() - t1, len(rows))
+    return rows
+
 # ---- SQL (psycopg v3 uses %s placeholders) ----------------------------------
 
 # Single z=12 tile as FeatureCollection
@@ -125,7 +266,7 @@ SELECT jsonb_build_object(
   'features', jsonb_agg(
     jsonb_build_object(
       'type','Feature',
-      'properties', jsonb_build_object('x', x, 'y', 'crashes', crashes),
+      'properties', jsonb_build_object('x', x, 'y', y, 'crashes', crashes),
       'geometry', ST_AsGeoJSON(ST_Transform(geom3857, 4326), 6)::jsonb
     )
   )
@@ -155,32 +296,6 @@ FROM (
 ) q;
 """
 
-# Score arbitrary route WKT with buffer (meters)
-SQL_SCORE_ROUTE_WKT = """
-WITH route AS (
-  SELECT ST_SetSRID(ST_GeomFromText(%s), 4326) AS g4326
-),
-buf AS (
-  SELECT ST_Transform(ST_Buffer(ST_Transform(g4326, 3857), %s::double precision), 4326) AS g
-  FROM route
-),
-hits AS (
-  SELECT COUNT(*)::int AS crash_count
-  FROM saferide.crash c, buf
-  WHERE ST_Intersects(c.geom, buf.g)
-),
-mx AS (
-  SELECT COALESCE(MAX(crashes),1) AS max_tile
-  FROM saferide.crash_tiles_z12
-)
-SELECT jsonb_build_object(
-  'crashes', hits.crash_count,
-  'buffer_m', %s::int,
-  'score', LEAST(100, ROUND( 100.0 * LOG(1 + hits.crash_count) / LOG(1 + mx.max_tile) , 2))
-)::text AS result
-FROM hits, mx;
-"""
-
 # Optional: score a bikeway by way_id and buffer (meters)
 SQL_SCORE_BIKEWAY = """
 WITH bw AS (
@@ -209,3 +324,9 @@ SELECT jsonb_build_object(
 )::text AS result
 FROM hits, mx;
 """
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["init"]:
+        init_database()
+    else:
+        raise SystemExit("usage: python -m app.db init")
@@ -0,0 +1,215 @@
+# saferide-api/app/geometry.py
+"""
+Compact route geometry.
+
+A route line is a flat array('d') of interleaved [lon, lat, lon, lat, ...]
+values: one allocation per route instead of a list per vertex. OSRM hands us
+encoded polylines (precision 6, see OSRM_GEOMETRIES in app.osrm), which are
+decoded once into that form; PostGIS gets little-endian WKB built straight
+from the array's buffer, and clients can ask for the polyline back instead
+of WKT.
+"""
+from __future__ import annotations
+
+import re
+import struct
+import sys
+from array import array
+from typing import Any, List, Sequence
+
+Line = array  # array('d'), interleaved lon/lat
+
+POLYLINE_PRECISION = 6
+
+# ---- Encoded polylines (Google algorithm; OSRM "polyline6") -------------------
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> Line:
+    """Encoded polyline (lat/lon pairs) -> flat [lon, lat, ...] array."""
+    factor = 10 ** precision
+    out = array("d")
+    index = lat = lon = 0
+    n = len(encoded)
+    try:
+        while index < n:
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            lat += ~(result >> 1) if result & 1 else result >> 1
+
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            lon += ~(result >> 1) if result & 1 else result >> 1
+
+            out.append(lon / factor)
+            out.append(lat / factor)
+    except IndexError:
+        raise ValueError("truncated encoded polyline") from None
+    return out
+
+def _encode_value(v: int, parts: List[str]) -> None:
+    v = ~(v << 1) if v < 0 else v << 1
+    while v >= 0x20:
+        parts.append(chr((0x20 | (v & 0x1F)) + 63))
+        v >>= 5
+    parts.append(chr(v + 63))
+
+def encode_polyline(line: Sequence[float], precision: int = POLYLINE_PRECISION) -> str:
+    """Flat [lon, lat, ...] -> encoded polyline."""
+    factor = 10 ** precision
+    parts: List[str] = []
+    prev_lat = prev_lon = 0
+    for i in range(0, len(line) - 1, 2):
+        lon = round(line[i] * factor)
+        lat = round(line[i + 1] * factor)
+        _encode_value(lat - prev_lat, parts)
+        _encode_value(lon - prev_lon, parts)
+        prev_lat, prev_lon = lat, lon
+    return "".join(parts)
+
+# ---- Conversions ---------------------------------------------------------------
+
+def line_from_coords(coords: Sequence[Sequence[float]]) -> Line:
+    """[[lon, lat], ...] (GeoJSON order) -> flat array."""
+    out = array("d")
+    for c in coords:
+        out.append(float(c[0]))
+        out.append(float(c[1]))
+    return out
+
+def line_to_coords(line: Sequence[float]) -> List[List[float]]:
+    return [[line[i], line[i + 1]] for i in range(0, len(line) - 1, 2)]
+
+def line_to_wkt(line: Sequence[float]) -> str:
+    return "LINESTRING(" + ",".join(
+        f"{line[i]} {line[i + 1]}" for i in range(0, len(line) - 1, 2)
+    ) + ")"
+
+_wkt_ls_pat = re.compile(r"^\s*LINESTRING\s*\((?P<body>.+)\)\s*$", re.IGNORECASE)
+
+def line_from_wkt(wkt: str) -> Line:
+    """Small LINESTRING WKT parser (2D; extra ordinates are dropped)."""
+    m = _wkt_ls_pat.match(wkt)
+    out = array("d")
+    if not m:
+        return out
+    for pair in m.group("body").split(","):
+        parts = pair.split()
+        if len(parts) >= 2:
+            out.append(float(parts[0]))
+            out.append(float(parts[1]))
+    return out
+
+_WKB_LINESTRING_HEADER = struct.Struct("<BII")
+
+def line_to_wkb(line: Line) -> bytes:
+    """
+    Little-endian WKB LINESTRING (no SRID; pair with ST_GeomFromWKB(..., 4326)).
+    A single vertex is repeated, since PostGIS rejects one-point linestrings.
+    """
+    if len(line) == 2:
+        line = line * 2
+    if not isinstance(line, array) or line.typecode != "d":
+        line = array("d", line)
+    if sys.byteorder != "little":
+        line = array("d", line)
+        line.byteswap()
+    return _WKB_LINESTRING_HEADER.pack(1, 2, len(line) // 2) + line.tobytes()
+
+# ---- Simplification ------------------------------------------------------------
+
+def simplify_line(line: Line, tolerance_m: float) -> Line:
+    """
+    Douglas-Peucker in EPSG:3857 meters (the units the scoring buffer uses).
+
+    Every dropped vertex is within `tolerance_m` of the kept segment that
+    replaces it, and every point of a kept segment is within `tolerance_m` of
+    the original line (symmetric Hausdorff distance <= tolerance_m). So
+    buffer(simplified, r) lies between buffer(original, r - tol) and
+    buffer(original, r + tol): only crashes whose distance to the route is
+    within +-tolerance_m of the buffer radius can be counted differently.
+    """
+    n = len(line) // 2
+    if tolerance_m <= 0 or n < 3:
+        return line
+
+    import numpy as np
+    from .crash_index import lonlat_to_3857
+
+    lonlat = np.frombuffer(line, dtype=np.float64, count=2 * n).reshape(-1, 2)
+    p = lonlat_to_3857(lonlat)
+    x, y = p[:, 0], p[:, 1]
+    tol2 = float(tolerance_m) ** 2
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    active = ~keep  # vertices of segments that may still be split
+
+    # Level-synchronous DP: every open segment is split at its farthest vertex
+    # in the same vectorized pass, so the loop runs ~log2(n) times rather than
+    # once per kept vertex. Same result as the recursive formulation.
+    while True:
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        kept = np.flatnonzero(keep)
+        seg = np.searchsorted(kept, idx) - 1
+        a, b = kept[seg], kept[seg + 1]
+        sx, sy = x[b] - x[a], y[b] - y[a]
+        px, py = x[idx] - x[a], y[idx] - y[a]
+        len2 = sx * sx + sy * sy
+        t = np.divide(px * sx + py * sy, len2, out=np.zeros_like(len2), where=len2 > 0)
+        np.clip(t, 0.0, 1.0, out=t)
+        dx, dy = px - t * sx, py - t * sy
+        d2 = dx * dx + dy * dy
+
+        # Farthest vertex of each segment (first one on ties, like argmax)
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        group = np.repeat(np.arange(starts.size), np.diff(np.r_[starts, idx.size]))
+        at_max = np.flatnonzero(d2 == np.maximum.reduceat(d2, starts)[group])
+        first = at_max[np.r_[True, group[at_max][1:] != group[at_max][:-1]]]
+        split = first[d2[first] > tol2]
+
+        # Segments with nothing beyond the tolerance are final
+        open_group = np.zeros(starts.size, dtype=bool)
+        open_group[group[split]] = True
+        active[idx[~open_group[group]]] = False
+        keep[idx[split]] = True
+        active[idx[split]] = False
+
+    out = array("d")
+    out.frombytes(np.ascontiguousarray(lonlat[keep]).tobytes())
+    return out
+
+# ---- OSRM route objects --------------------------------------------------------
+
+def route_line(route: dict) -> Line:
+    """
+    Geometry of an OSRM route as a flat array. Accepts an encoded polyline6
+    string (what app.osrm requests), a GeoJSON LineString (fixtures, older
+    cached responses, geojson OSRM_URL templates) or an already decoded array
+    (synthetic alternatives).
+    """
+    geom: Any = route.get("geometry")
+    if isinstance(geom, str):
+        return decode_polyline(geom)
+    if isinstance(geom, array):
+        return geom
+    if isinstance(geom, dict):
+        return line_from_coords(geom.get("coordinates") or [])
+    return array("d")
+
+def has_geometry(route: dict) -> bool:
+    geom: Any = route.get("geometry")
+    if isinstance(geom, dict):
+        return bool(geom.get("coordinates"))
+    return bool(geom)
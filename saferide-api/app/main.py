@@ -1,15 +1,35 @@
 # saferide-api/app/main.py
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 
-from .db import init_database
+from . import metrics
+from .db import aclose_async_pool
+from .osrm import aclose_async_client
+from .profiling import ServerTimingMiddleware
+from .routes_bikeways import router as bikeways_router
 from .routes_rank import router as rank_router
+from .routes_tiles import router as tiles_router
+
+# Configured once here (the ranking path used to call basicConfig per request)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # The async ranking path's OSRM client and DB pool (both opened lazily)
+    await aclose_async_client()
+    await aclose_async_pool()
 
 app = FastAPI(
     title="Saferide API",
     version="1.0.0",
     description="Crash-aware multi-route ranking service",
+    lifespan=lifespan,
 )
 
 # CORS (safe defaults; tweak if you host elsewhere)
@@ -18,10 +38,14 @@ app.add_middleware(
     allow_origins=["*"],
     allow_headers=["*"],
     allow_methods=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id"],
 )
+# Server-Timing breakdown (and opt-in profiling) for /routes/* responses
+app.add_middleware(ServerTimingMiddleware)
 
-# Initialize database on module load
-init_database()
+# No DB work at import: the pool opens on first use and schema checks are a
+# one-off step (`python -m app.db init`, run by entrypoint.sh), which keeps
+# Lambda cold starts and uvicorn worker boots fast.
 
 @app.get("/", response_class=HTMLResponse)
 def root():
@@ -294,6 +318,12 @@ def root():
                             <div class="endpoint-description">Rank routes and return as GeoJSON FeatureCollection</div>
                         </div>
                         
+                        <div class="endpoint-card">
+                            <div class="endpoint-method">GET</div>
+                            <div class="endpoint-path">/tiles/{z}/{x}/{y}.mvt</div>
+                            <div class="endpoint-description">Crash (and hazard) vector tiles for map heat layers</div>
+                        </div>
+                        
                         <div class="endpoint-card">
                             <div class="endpoint-method">GET</div>
                             <div class="endpoint-path">/docs</div>
@@ -341,5 +371,12 @@ def version():
     """Get API version"""
     return {"version": app.version}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus metrics: ranking stage latencies, OSRM calls, DB pool and statement stats"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Routes
 app.include_router(rank_router, prefix="/routes", tags=["routes"])
+app.include_router(tiles_router, prefix="/tiles", tags=["tiles"])
+app.include_router(bikeways_router, prefix="/bikeways", tags=["bikeways"])
@@ -0,0 +1,295 @@
+# saferide-api/app/metrics.py
+"""
+Prometheus metrics for the ranking path, served as text by GET /metrics.
+
+A small in-process registry (counters and histograms, plus gauges read at
+scrape time) rendered in the Prometheus text exposition format, so no client
+library is needed. Values are per process: with several uvicorn workers,
+scrape each one or aggregate in Prometheus.
+
+Stages of a /routes/rank request are timed with `stage()`, which observes the
+stage histogram and adds the time to the request's own breakdown
+(`RequestStats`, held in a context variable for the duration of the request).
+"""
+from __future__ import annotations
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Prometheus' default latency buckets, plus the OSRM deadline range
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0)
+
+LabelValues = Tuple[str, ...]
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter, optionally labelled."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally labelled."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 1)
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    row[i] += 1
+                    break
+            row[-1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = []
+        for key, row in items:
+            total = 0.0
+            for upper, n in zip(self.buckets, row):
+                total += n
+                le = 'le="' + _fmt(upper) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_fmt(total)}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(row[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {_fmt(total)}")
+        return out
+
+class Gauges:
+    """
+    A family of gauges (or counters) read at scrape time from `read()`, which
+    returns {label values: value}; for state owned by another object, like the
+    DB pools.
+    """
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str],
+                 read: Callable[[], Dict[LabelValues, float]], kind: str = "gauge"):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.read, self.kind = read, kind
+
+    def collect(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}"
+                for k, v in sorted(self.read().items())]
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.doc}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.collect())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# ---- Ranking path -----------------------------------------------------------
+
+RANK_SECONDS = registry.add(Histogram(
+    "saferide_rank_seconds", "Whole /routes/rank and /rank_fc requests.", ("endpoint",)))
+OSRM_FETCH_SECONDS = registry.add(Histogram(
+    "saferide_rank_osrm_fetch_seconds", "Primary OSRM route fetch (cache lookup included).", ("mode",)))
+ALTERNATIVES_SECONDS = registry.add(Histogram(
+    "saferide_rank_alternatives_seconds",
+    "Filling in missing alternatives, by source: compass waypoints, "
+    "_generate_alternative_routes detours, synthetic fallback.", ("source",)))
+SCORING_SECONDS = registry.add(Histogram(
+    "saferide_rank_scoring_seconds", "Scoring the alternatives (DB or in-memory index).",
+    ("score_mode", "engine")))
+SERIALIZATION_SECONDS = registry.add(Histogram(
+    "saferide_rank_serialization_seconds", "Building the response body from the ranked routes.",
+    ("endpoint",)))
+OSRM_CALLS_PER_REQUEST = registry.add(Histogram(
+    "saferide_rank_osrm_calls", "OSRM HTTP calls made by one ranking request.", (),
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24)))
+OSRM_CALLS = registry.add(Counter(
+    "saferide_osrm_calls_total", "OSRM HTTP calls, by outcome (ok|error|cancelled).", ("outcome",)))
+OSRM_CALL_SECONDS = registry.add(Histogram(
+    "saferide_osrm_call_seconds", "Single OSRM HTTP calls, waiting for a connection included."))
+
+# ---- Per-request breakdown --------------------------------------------------
+
+class RequestStats:
+    """Stage times (seconds) and OSRM call count of one ranking request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.osrm_calls = 0
+        # Set by app.profiling: sample this request, and the stored profile's id
+        self.profile = False
+        self.profile_id: Optional[str] = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count_osrm_call(self) -> None:
+        with self._lock:
+            self.osrm_calls += 1
+
+# Set for the duration of a ranking request. Asyncio tasks and
+# run_in_threadpool copy the context, so they share the same RequestStats;
+# plain executor threads need contextvars.copy_context() (see app.osrm).
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "saferide_request_stats", default=None)
+
+def current() -> Optional[RequestStats]:
+    return _current.get()
+
+@contextmanager
+def bind_request(stats: RequestStats) -> Iterator[RequestStats]:
+    """Make `stats` the current request's for the enclosed block (app.profiling middleware)."""
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def start_request() -> RequestStats:
+    """Give the current context (e.g. one /rank_batch item's task) its own RequestStats."""
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+@contextmanager
+def rank_request(endpoint: str) -> Iterator[RequestStats]:
+    """
+    Time one ranking request and record its OSRM call count, reusing the
+    RequestStats already set for this context if there is one.
+    """
+    stats = _current.get()
+    token = None
+    if stats is None:
+        stats = RequestStats()
+        token = _current.set(stats)
+    t = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        RANK_SECONDS.observe(time.perf_counter() - t, endpoint=endpoint)
+        OSRM_CALLS_PER_REQUEST.observe(stats.osrm_calls)
+        if token is not None:
+            _current.reset(token)
+
+@contextmanager
+def stage(name: str, histogram: Histogram, **labels: str) -> Iterator[None]:
+    """Time a block into `histogram` and the current request's `name` stage."""
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        secs = time.perf_counter() - t
+        histogram.observe(secs, **labels)
+        stats = _current.get()
+        if stats is not None:
+            stats.add(name, secs)
+
+def record_osrm_call(seconds: float, outcome: str) -> None:
+    OSRM_CALLS.inc(outcome=outcome)
+    OSRM_CALL_SECONDS.observe(seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.count_osrm_call()
+
+# ---- DB ---------------------------------------------------------------------
+
+def _pools() -> Dict[str, object]:
+    from . import db
+    return {name: p for name, p in (("sync", db._pool), ("async", db._apool)) if p is not None}
+
+def _pool_stat(fn: Callable[[Dict[str, int]], float]) -> Callable[[], Dict[LabelValues, float]]:
+    def read() -> Dict[LabelValues, float]:
+        # get_stats() is a plain (non-async) snapshot on both pool flavours
+        return {(name,): fn(p.get_stats()) for name, p in _pools().items()}
+    return read
+
+registry.add(Gauges(
+    "saferide_db_pool_connections", "Open connections in the psycopg pool.", ("pool",),
+    _pool_stat(lambda s: s.get("pool_size", 0))))
+registry.add(Gauges(
+    "saferide_db_pool_connections_in_use", "Connections checked out of the psycopg pool.", ("pool",),
+    _pool_stat(lambda s: s.get("pool_size", 0) - s.get("pool_available", 0))))
+registry.add(Gauges(
+    "saferide_db_pool_max_connections", "Configured maximum pool size.", ("pool",),
+    _pool_stat(lambda s: s.get("pool_max", 0))))
+registry.add(Gauges(
+    "saferide_db_pool_requests_waiting", "Callers currently queued for a connection.", ("pool",),
+    _pool_stat(lambda s: s.get("requests_waiting", 0))))
+registry.add(Gauges(
+    "saferide_db_pool_requests_queued_total", "Connection requests that had to queue.", ("pool",),
+    _pool_stat(lambda s: s.get("requests_queued", 0)), kind="counter"))
+registry.add(Gauges(
+    "saferide_db_pool_wait_seconds_total", "Total time callers spent queued for a connection.",
+    ("pool",), _pool_stat(lambda s: s.get("requests_wait_ms", 0) / 1000.0), kind="counter"))
+registry.add(Gauges(
+    "saferide_db_pool_errors_total", "Connection requests that failed or timed out.", ("pool",),
+    _pool_stat(lambda s: s.get("requests_errors", 0)), kind="counter"))
+
+def _statement_stat(field: str) -> Callable[[], Dict[LabelValues, float]]:
+    def read() -> Dict[LabelValues, float]:
+        from .db import statement_stats
+        return {(name,): s[field] for name, s in statement_stats.snapshot().items()}
+    return read
+
+registry.add(Gauges(
+    "saferide_db_statement_calls_total", "Calls per named statement (see /routes/db/stats).",
+    ("statement",), _statement_stat("calls"), kind="counter"))
+registry.add(Gauges(
+    "saferide_db_statement_execute_seconds_total", "Execute round-trip time per named statement.",
+    ("statement",), _statement_stat("execute_s"), kind="counter"))
+registry.add(Gauges(
+    "saferide_db_statement_fetch_seconds_total", "Row fetch time per named statement.",
+    ("statement",), _statement_stat("fetch_s"), kind="counter"))
+
+def render() -> str:
+    return registry.render()
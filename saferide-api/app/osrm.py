@@ -0,0 +1,403 @@
+# saferide-api/app/osrm.py
+"""
+Pooled, concurrent OSRM client.
+
+A single keep-alive requests.Session is shared by every request in the
+process, waypoint detour lookups are fanned out on a small thread pool, and
+a Deadline caps the total time one ranking request may spend on OSRM.
+
+The async ranking path (RANK_ASYNC, app.routes_rank) uses the a-prefixed
+twins below instead: one httpx.AsyncClient per event loop and asyncio tasks
+for the fan-out, so waiting on OSRM holds no thread.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import metrics
+from .cache import DiskCache, TTLCache, register
+from .geometry import has_geometry
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+OSRM_BASE_URL = os.getenv("OSRM_BASE_URL", "https://router.project-osrm.org").rstrip("/")
+OSRM_TIMEOUT = float(os.getenv("OSRM_TIMEOUT", "20"))        # per call cap (s)
+OSRM_DEADLINE = float(os.getenv("OSRM_DEADLINE", "25"))      # per ranking request (s)
+OSRM_MAX_WORKERS = int(os.getenv("OSRM_MAX_WORKERS", "8"))
+# Async path: connections the shared httpx.AsyncClient may open to OSRM
+OSRM_ASYNC_MAX_CONNECTIONS = int(os.getenv("OSRM_ASYNC_MAX_CONNECTIONS", "32"))
+# Route geometry format requested from OSRM: polyline6 (compact, decoded once
+# into app.geometry arrays) or geojson
+OSRM_GEOMETRIES = os.getenv("OSRM_GEOMETRIES", "polyline6")
+
+# Response cache: start/end are snapped to a grid of this many meters
+OSRM_CACHE_GRID_M = float(os.getenv("OSRM_CACHE_GRID_M", "25"))
+OSRM_CACHE_SIZE = int(os.getenv("OSRM_CACHE_SIZE", "2000"))
+OSRM_CACHE_TTL = float(os.getenv("OSRM_CACHE_TTL", "86400"))
+OSRM_CACHE_DIR = os.getenv("OSRM_CACHE_DIR")                # optional shared tier
+
+Coord = Tuple[float, float]
+
+class DeadlineExceeded(Exception):
+    """Raised when the OSRM budget of a ranking request is used up."""
+
+class Deadline:
+    """Overall time budget shared by every OSRM call of one request."""
+
+    def __init__(self, budget_s: float = OSRM_DEADLINE):
+        self.expires_at = time.monotonic() + budget_s
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def timeout(self, cap: float = OSRM_TIMEOUT) -> float:
+        """Per-call timeout: the smaller of `cap` and what is left of the budget."""
+        left = self.remaining()
+        if left <= 0.0:
+            raise DeadlineExceeded("OSRM deadline exceeded")
+        return min(cap, left)
+
+# ---- Shared session / executor ----------------------------------------------
+
+_session: Optional["requests.Session"] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+def get_session() -> "requests.Session":
+    """Keep-alive session sized to the fan-out pool (lazy initialization)"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                # Imported here to keep `requests` off the cold-start import path
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=OSRM_MAX_WORKERS)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=OSRM_MAX_WORKERS,
+                                               thread_name_prefix="osrm")
+    return _executor
+
+# The AsyncClient's connections belong to the loop that opened them; a new
+# loop (tests, a restarted server) gets a new client.
+_aclient: Optional["httpx.AsyncClient"] = None
+_aclient_loop: Optional[asyncio.AbstractEventLoop] = None
+# Callers over the connection limit wait here: cheap, unlike httpcore's pool
+# queue, which rescans every waiter whenever a connection frees up
+_aslots: Optional[asyncio.Semaphore] = None
+
+def get_async_client() -> "httpx.AsyncClient":
+    """Keep-alive AsyncClient for the running event loop (lazy initialization)"""
+    global _aclient, _aclient_loop, _aslots
+    loop = asyncio.get_running_loop()
+    if _aclient is None or _aclient_loop is not loop:
+        import httpx
+
+        _aclient = httpx.AsyncClient(
+            timeout=OSRM_TIMEOUT,
+            limits=httpx.Limits(max_connections=OSRM_ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=OSRM_ASYNC_MAX_CONNECTIONS),
+        )
+        _aclient_loop = loop
+        _aslots = asyncio.Semaphore(OSRM_ASYNC_MAX_CONNECTIONS)
+    return _aclient
+
+async def aclose_async_client() -> None:
+    global _aclient, _aclient_loop, _aslots
+    if _aclient is not None:
+        await _aclient.aclose()
+        _aclient, _aclient_loop, _aslots = None, None, None
+
+# ---- Calls ------------------------------------------------------------------
+
+def route_url(mode: str, points: Sequence[Coord], alternatives: bool = False) -> str:
+    """OSRM /route URL through `points` ([(lon, lat), ...]) with the full overview geometry."""
+    path = ";".join(f"{lon},{lat}" for lon, lat in points)
+    alt = "true" if alternatives else "false"
+    return (
+        f"{OSRM_BASE_URL}/route/v1/{mode}/{path}"
+        f"?overview=full&geometries={OSRM_GEOMETRIES}&alternatives={alt}"
+    )
+
+def osrm_get(url: str, deadline: Optional[Deadline] = None,
+             timeout: float = OSRM_TIMEOUT) -> dict:
+    """GET an OSRM URL on the shared session, bounded by the request deadline."""
+    t0, outcome = time.perf_counter(), "error"
+    try:
+        t = deadline.timeout(timeout) if deadline else timeout
+        r = get_session().get(url, timeout=t)
+        r.raise_for_status()
+        result = r.json()
+        outcome = "ok"
+        return result
+    finally:
+        metrics.record_osrm_call(time.perf_counter() - t0, outcome)
+
+def _first_route(url: str, deadline: Optional[Deadline], timeout: float) -> Optional[dict]:
+    result = osrm_get(url, deadline, timeout)
+    routes = result.get("routes") or []
+    return routes[0] if routes else None
+
+def fetch_first_routes(urls: Sequence[str], want: int,
+                       accept: Callable[[dict, List[dict]], bool],
+                       deadline: Optional[Deadline] = None,
+                       timeout: float = OSRM_TIMEOUT) -> List[dict]:
+    """
+    Request every URL concurrently and collect the first route of each response
+    that `accept(route, accepted_so_far)` approves, in completion order.
+
+    Stops as soon as `want` routes are accepted or the deadline runs out; calls
+    still queued at that point are cancelled and in-flight ones are abandoned
+    (they finish in the background, bounded by their own timeout).
+    """
+    accepted: List[dict] = []
+    if want <= 0 or not urls:
+        return accepted
+    if deadline is not None and deadline.expired():
+        return accepted
+
+    pool = get_executor()
+    # Each call runs in a copy of the caller's context so it is counted
+    # against the ranking request that made it (app.metrics)
+    pending: Dict[Future, int] = {
+        pool.submit(contextvars.copy_context().run, _first_route, url, deadline, timeout): i
+        for i, url in enumerate(urls)
+    }
+    try:
+        while pending and len(accepted) < want:
+            wait_s = deadline.remaining() if deadline else None
+            if wait_s is not None and wait_s <= 0.0:
+                logging.warning(f"OSRM deadline hit with {len(pending)} detour call(s) pending")
+                break
+            done, _ = wait(list(pending), timeout=wait_s, return_when=FIRST_COMPLETED)
+            if not done:
+                continue
+            for fut in done:
+                i = pending.pop(fut)
+                try:
+                    route = fut.result()
+                except Exception as e:
+                    logging.warning(f"OSRM detour {i+1} failed: {e}")
+                    continue
+                if route and len(accepted) < want and accept(route, accepted):
+                    accepted.append(route)
+    finally:
+        for fut in pending:
+            fut.cancel()
+    return accepted
+
+async def aosrm_get(url: str, deadline: Optional[Deadline] = None,
+                    timeout: float = OSRM_TIMEOUT) -> dict:
+    """Async osrm_get on the shared AsyncClient."""
+    client = get_async_client()
+    t0, outcome = time.perf_counter(), "error"
+    try:
+        async with _aslots:
+            t = deadline.timeout(timeout) if deadline else timeout
+            r = await client.get(url, timeout=t)
+        r.raise_for_status()
+        result = r.json()
+        outcome = "ok"
+        return result
+    except asyncio.CancelledError:
+        outcome = "cancelled"  # detour no longer needed (afetch_first_routes)
+        raise
+    finally:
+        metrics.record_osrm_call(time.perf_counter() - t0, outcome)
+
+async def _afirst_route(url: str, deadline: Optional[Deadline], timeout: float) -> Optional[dict]:
+    result = await aosrm_get(url, deadline, timeout)
+    routes = result.get("routes") or []
+    return routes[0] if routes else None
+
+async def afetch_first_routes(urls: Sequence[str], want: int,
+                              accept: Callable[[dict, List[dict]], bool],
+                              deadline: Optional[Deadline] = None,
+                              timeout: float = OSRM_TIMEOUT) -> List[dict]:
+    """
+    Async fetch_first_routes. Calls still running once `want` routes are
+    accepted or the deadline runs out are cancelled, connection and all.
+    """
+    accepted: List[dict] = []
+    if want <= 0 or not urls:
+        return accepted
+    if deadline is not None and deadline.expired():
+        return accepted
+
+    pending: Dict[asyncio.Task, int] = {
+        asyncio.ensure_future(_afirst_route(url, deadline, timeout)): i for i, url in enumerate(urls)
+    }
+    try:
+        while pending and len(accepted) < want:
+            wait_s = deadline.remaining() if deadline else None
+            if wait_s is not None and wait_s <= 0.0:
+                logging.warning(f"OSRM deadline hit with {len(pending)} detour call(s) pending")
+                break
+            done, _ = await asyncio.wait(list(pending), timeout=wait_s,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = pending.pop(task)
+                try:
+                    route = task.result()
+                except Exception as e:
+                    logging.warning(f"OSRM detour {i+1} failed: {e}")
+                    continue
+                if route and len(accepted) < want and accept(route, accepted):
+                    accepted.append(route)
+    finally:
+        for task in pending:
+            task.cancel()
+    return accepted
+
+def distinct_by_distance(primary: dict, min_rel_diff: float) -> Callable[[dict, List[dict]], bool]:
+    """
+    Accept predicate: the route has geometry and its distance differs by more
+    than `min_rel_diff` from the primary route and from every accepted route.
+    """
+    def _accept(route: dict, accepted: List[dict]) -> bool:
+        if not has_geometry(route):
+            return False
+        dist = float(route.get("distance", 0))
+        for other in [primary, *accepted]:
+            other_dist = float(other.get("distance", 0))
+            if abs(dist - other_dist) / max(other_dist, 1) <= min_rel_diff:
+                return False
+        return True
+    return _accept
+
+# ---- Response cache ---------------------------------------------------------
+
+_M_PER_DEG_LAT = 111_320.0
+
+def snap(point: Coord, grid_m: float = OSRM_CACHE_GRID_M) -> Coord:
+    """
+    Snap (lon, lat) to the center of a ~grid_m x grid_m cell. Latitude is
+    snapped first so the longitude step (which shrinks with cos(lat)) is the
+    same for every point in the row.
+    """
+    lon, lat = point
+    if grid_m <= 0:
+        return (lon, lat)
+    dlat = grid_m / _M_PER_DEG_LAT
+    lat_s = (math.floor(lat / dlat) + 0.5) * dlat
+    dlon = grid_m / (_M_PER_DEG_LAT * max(math.cos(math.radians(lat_s)), 1e-6))
+    lon_s = (math.floor(lon / dlon) + 0.5) * dlon
+    return (round(lon_s, 7), round(lat_s, 7))
+
+class OSRMResponseCache:
+    """
+    Two-tier cache of OSRM /route responses keyed on backend, mode, number of
+    alternatives and snapped start/end: an in-process LRU in front of an
+    optional on-disk tier (OSRM_CACHE_DIR) shared by workers and containers.
+    """
+
+    def __init__(self, grid_m: float, memory: TTLCache, disk: Optional[DiskCache] = None):
+        self.grid_m = grid_m
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._by_mode: Dict[str, Dict[str, int]] = {}
+
+    def key(self, backend: str, mode: str, start: Coord, end: Coord, k: int) -> str:
+        (slon, slat), (elon, elat) = snap(start, self.grid_m), snap(end, self.grid_m)
+        return f"{backend}|{mode}|{k}|{slon},{slat};{elon},{elat}"
+
+    def _count(self, mode: str, outcome: str) -> None:
+        with self._lock:
+            c = self._by_mode.setdefault(mode, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+            c[outcome] += 1
+
+    def get(self, key: str, mode: str) -> Optional[dict]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(mode, "memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                self._count(mode, "disk_hits")
+                return value
+        self._count(mode, "misses")
+        return None
+
+    def set(self, key: str, value: dict) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self) -> int:
+        n = self.memory.clear()
+        if self.disk is not None:
+            n += self.disk.clear()
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_mode = {}
+            for mode, c in self._by_mode.items():
+                lookups = c["memory_hits"] + c["disk_hits"] + c["misses"]
+                hits = c["memory_hits"] + c["disk_hits"]
+                by_mode[mode] = {**c, "hit_rate": round(hits / lookups, 4) if lookups else None}
+        return {
+            "grid_m": self.grid_m,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "by_mode": by_mode,
+        }
+
+response_cache = register("osrm", OSRMResponseCache(
+    OSRM_CACHE_GRID_M,
+    TTLCache(OSRM_CACHE_SIZE, OSRM_CACHE_TTL, name="osrm_responses"),
+    DiskCache(OSRM_CACHE_DIR, OSRM_CACHE_TTL, name="osrm_disk") if OSRM_CACHE_DIR else None,
+))
+
+def cached_route(backend: str, mode: str, start: Coord, end: Coord, k: int,
+                 fetch: Callable[[], dict]) -> dict:
+    """
+    Return the OSRM response for this trip from the cache, or call `fetch()`
+    and cache it. Callers get their own `routes` list, so appending synthetic
+    alternatives never touches the cached copy.
+    """
+    key = response_cache.key(backend, mode, start, end, k)
+    result = response_cache.get(key, mode)
+    if result is None:
+        result = fetch()
+        if result.get("routes"):
+            response_cache.set(key, result)
+    return {**result, "routes": list(result.get("routes") or [])}
+
+async def acached_route(backend: str, mode: str, start: Coord, end: Coord, k: int,
+                        fetch: Callable[[], Awaitable[dict]]) -> dict:
+    """cached_route with an async `fetch`."""
+    key = response_cache.key(backend, mode, start, end, k)
+    result = response_cache.get(key, mode)
+    if result is None:
+        result = await fetch()
+        if result.get("routes"):
+            response_cache.set(key, result)
+    return {**result, "routes": list(result.get("routes") or [])}
@@ -0,0 +1,284 @@
+# saferide-api/app/profiling.py
+"""
+Per-request timing for /routes/*: a Server-Timing header on every response and
+opt-in, sampled wall-clock profiles of the ranking endpoints.
+
+The middleware gives each /routes/* request a RequestStats (app.metrics), which
+the ranking code fills in stage by stage; the header is built from it when the
+response starts. A request is profiled when it is picked by PROFILE_SAMPLE_RATE
+or sends `X-Profile: 1` with a valid X-Admin-Token (see admin_token_ok).
+
+Profiles are sampled, not traced: a background thread records the request's
+call stack every PROFILE_INTERVAL_MS, whether it is running or waiting on
+OSRM/DB. On the threaded path that is the worker thread's stack; on the async
+path it is the request task's chain of awaits (plus the loop thread's stack
+while the task is the one running). Stacks are stored in the collapsed format
+that flamegraph.pl and speedscope read, under PROFILE_DIR, and served by
+GET /routes/profiles/{id}.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from types import FrameType
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from .metrics import RequestStats, bind_request
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))   # 0.01 = 1% of requests
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "saferide-profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))                  # newest profiles kept
+
+# Stages reported in Server-Timing, in pipeline order
+STAGES = (
+    ("osrm", "OSRM fetch"),
+    ("alternatives", "Alternative routes"),
+    ("scoring", "Scoring"),
+    ("serialization", "Serialization"),
+)
+
+# ---- Server-Timing ----------------------------------------------------------
+
+def server_timing(stats: RequestStats, total_s: float) -> str:
+    parts = [f'{name};dur={stats.stages[name] * 1000.0:.1f};desc="{desc}"'
+             for name, desc in STAGES if name in stats.stages]
+    if stats.osrm_calls:
+        parts.append(f'osrm-calls;desc="{stats.osrm_calls} OSRM calls"')
+    if stats.profile_id:
+        parts.append(f'profile;desc="{stats.profile_id}"')
+    parts.append(f'total;dur={total_s * 1000.0:.1f}')
+    return ", ".join(parts)
+
+def admin_token_ok(token: Optional[str]) -> bool:
+    """
+    Whether `token` may use the admin endpoints and on-demand profiling. Fails
+    closed: with ADMIN_TOKEN unset nothing passes, unless ADMIN_OPEN=1 opts a
+    local/dev deployment into open access.
+    """
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        return os.getenv("ADMIN_OPEN", "0").lower() in ("1", "true", "yes")
+    return token is not None and hmac.compare_digest(token.encode("latin-1", "replace"),
+                                                     expected.encode("latin-1", "replace"))
+
+def _wants_profile(headers: Dict[bytes, bytes]) -> bool:
+    if headers.get(b"x-profile", b"").lower() in (b"1", b"true", b"yes"):
+        token = headers.get(b"x-admin-token")
+        if admin_token_ok(token.decode("latin-1") if token is not None else None):
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware for /routes/*: sets up the request's RequestStats, marks it
+    for profiling, and adds Server-Timing (and X-Profile-Id) when the response
+    starts. Streamed responses (/rank_batch) start before any work is done, so
+    theirs only carries `total`.
+    """
+
+    def __init__(self, app, prefix: str = "/routes/"):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        stats.profile = _wants_profile(dict(scope["headers"]))
+        t0 = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if SERVER_TIMING:
+                    value = server_timing(stats, time.perf_counter() - t0)
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                    # Lets the browser UI (another origin) read it via the Resource Timing API
+                    headers.append((b"timing-allow-origin", b"*"))
+                if stats.profile_id:
+                    headers.append((b"x-profile-id", stats.profile_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with bind_request(stats):
+            await self.app(scope, receive, send_with_timing)
+
+# ---- Sampling profiler ------------------------------------------------------
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _thread_stack(ident: int) -> List[FrameType]:
+    frame = sys._current_frames().get(ident)
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def _await_chain(task: "asyncio.Task") -> List[FrameType]:
+    """Frames of a suspended task, outermost coroutine first, down the awaits."""
+    stack, coro = [], task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+class _Sampler:
+    """Counts the collapsed call stacks returned by `stack()` every `interval` s."""
+
+    def __init__(self, stack: Callable[[], List[FrameType]], interval: float):
+        self.stack = stack
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = self.stack()
+            if frames:
+                self.counts[";".join(_frame_name(f) for f in frames)] += 1
+                self.samples += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+def _current_stack_source() -> Callable[[], List[FrameType]]:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Threaded endpoint: sample this worker thread
+        ident = threading.get_ident()
+        return lambda: _thread_stack(ident)
+    task = asyncio.current_task(loop)
+    loop_ident = threading.get_ident()
+
+    def stack() -> List[FrameType]:
+        if asyncio.current_task(loop) is task:
+            return _thread_stack(loop_ident)
+        return _await_chain(task)
+    return stack
+
+def _start_sampler(stats: RequestStats) -> Optional[_Sampler]:
+    if not stats.profile or stats.profile_id:
+        return None
+    sampler = _Sampler(_current_stack_source(), PROFILE_INTERVAL_MS / 1000.0)
+    sampler.start()
+    return sampler
+
+def _finish(sampler: _Sampler, stats: RequestStats, endpoint: str,
+            started_at: float, duration_s: float) -> str:
+    sampler.stop()
+    return save_profile(endpoint, started_at, duration_s, sampler, stats)
+
+@contextmanager
+def profiled(stats: RequestStats, endpoint: str) -> Iterator[None]:
+    """Sample the enclosed block if the request is marked for profiling, then store it."""
+    started_at, t = time.time(), time.perf_counter()
+    sampler = _start_sampler(stats)
+    if sampler is None:
+        yield
+        return
+    try:
+        yield
+    finally:
+        stats.profile_id = _finish(sampler, stats, endpoint, started_at, time.perf_counter() - t)
+
+@asynccontextmanager
+async def aprofiled(stats: RequestStats, endpoint: str) -> AsyncIterator[None]:
+    """
+    profiled() for async endpoints: stopping the sampler (a thread join) and
+    writing the profile (JSON dump, rename, pruning the directory) run in a
+    worker thread instead of blocking the event loop.
+    """
+    started_at, t = time.time(), time.perf_counter()
+    sampler = _start_sampler(stats)
+    if sampler is None:
+        yield
+        return
+    try:
+        yield
+    finally:
+        stats.profile_id = await asyncio.to_thread(
+            _finish, sampler, stats, endpoint, started_at, time.perf_counter() - t)
+
+# ---- Storage ----------------------------------------------------------------
+
+def save_profile(endpoint: str, started_at: float, duration_s: float,
+                 sampler: _Sampler, stats: RequestStats) -> str:
+    profile_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime(started_at)) + "-" + uuid.uuid4().hex[:8]
+    doc = {
+        "id": profile_id,
+        "endpoint": endpoint,
+        "started_at": started_at,
+        "duration_ms": round(duration_s * 1000.0, 1),
+        "interval_ms": PROFILE_INTERVAL_MS,
+        "samples": sampler.samples,
+        "stages_ms": {k: round(v * 1000.0, 1) for k, v in stats.stages.items()},
+        "osrm_calls": stats.osrm_calls,
+        "folded": "".join(f"{s} {n}\n" for s, n in sampler.counts.most_common()),
+    }
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=PROFILE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(doc, f)
+    os.replace(tmp, os.path.join(PROFILE_DIR, f"{profile_id}.json"))
+    _prune()
+    return profile_id
+
+def _profile_files() -> List[str]:
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    return sorted(names, reverse=True)  # ids start with the UTC timestamp
+
+def _prune() -> None:
+    for name in _profile_files()[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
+
+def list_profiles() -> List[Dict[str, Any]]:
+    out = []
+    for name in _profile_files():
+        doc = load_profile(name[:-len(".json")])
+        if doc is not None:
+            doc.pop("folded", None)
+            out.append(doc)
+    return out
+
+def load_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    if os.path.basename(profile_id) != profile_id or profile_id.startswith("."):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
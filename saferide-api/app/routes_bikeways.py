@@ -0,0 +1,97 @@
+# saferide-api/app/routes_bikeways.py
+"""
+Precomputed bikeway risk for the cycling map.
+
+GET /bikeways/risk?bbox=minLon,minLat,maxLon,maxLat returns the segments of
+saferide.bikeway_risk (40_bikeway_risk.sql) inside the box as a GeoJSON
+FeatureCollection with their 0–100 score, so the UI can colour the network
+without scoring anything per request. Responses are cached in-process under
+the "bikeway_risk" scope, which the ETL drops after each load.
+"""
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Response
+
+from .cache import TTLCache, register
+from .db import fetchone_value
+
+router = APIRouter()
+
+BIKEWAY_RISK_MAX_BBOX_DEG = float(os.getenv("BIKEWAY_RISK_MAX_BBOX_DEG", "1.0"))
+BIKEWAY_RISK_MAX_AGE = int(os.getenv("BIKEWAY_RISK_MAX_AGE", "300"))
+
+risk_cache = register("bikeway_risk", TTLCache(
+    maxsize=int(os.getenv("BIKEWAY_RISK_CACHE_SIZE", "500")),
+    ttl=float(os.getenv("BIKEWAY_RISK_CACHE_TTL", "3600")),
+    name="bikeway_risk",
+))
+
+# Params: minLon, minLat, maxLon, maxLat, min_score, limit, precision
+SQL_BIKEWAY_RISK_FC = """
+WITH env AS (
+  SELECT ST_MakeEnvelope(%s, %s, %s, %s, 4326) AS g
+),
+feats AS (
+  SELECT r.infra_id, r.score, r.crashes, r.open_hazards, r.length_km, r.scored_at,
+         b.class, b.status, r.geom
+  FROM saferide.bikeway_risk r
+  JOIN saferide.bikeway b USING (infra_id), env
+  WHERE r.geom && env.g
+    AND r.score >= %s
+  ORDER BY r.score DESC
+  LIMIT %s
+)
+SELECT jsonb_build_object(
+  'type','FeatureCollection',
+  'features', COALESCE(jsonb_agg(
+    jsonb_build_object(
+      'type','Feature',
+      'properties', jsonb_build_object(
+        'infra_id', infra_id, 'score', score, 'crashes', crashes,
+        'open_hazards', open_hazards, 'length_km', round(length_km::numeric, 3),
+        'class', class, 'status', status, 'scored_at', scored_at),
+      'geometry', ST_AsGeoJSON(geom, %s)::jsonb
+    )
+    ORDER BY score DESC
+  ), '[]'::jsonb)
+)::text AS fc
+FROM feats;
+"""
+
+def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    """'minLon,minLat,maxLon,maxLat' -> floats; HTTP 400 when malformed or too large."""
+    try:
+        x0, y0, x1, y1 = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be minLon,minLat,maxLon,maxLat") from None
+    if not (-180 <= x0 < x1 <= 180 and -90 <= y0 < y1 <= 90):
+        raise HTTPException(status_code=400, detail="bbox must be minLon,minLat,maxLon,maxLat within WGS84 bounds")
+    if max(x1 - x0, y1 - y0) > BIKEWAY_RISK_MAX_BBOX_DEG:
+        raise HTTPException(status_code=400,
+                            detail=f"bbox may span at most {BIKEWAY_RISK_MAX_BBOX_DEG:g} degrees")
+    return x0, y0, x1, y1
+
+@router.get("/risk")
+def bikeway_risk(bbox: str,
+                 min_score: int = Query(0, ge=0, le=100),
+                 limit: int = Query(5000, ge=1, le=50000),
+                 precision: int = Query(6, ge=0, le=15)):
+    """
+    Scored bikeway segments inside `bbox` (GeoJSON FeatureCollection),
+    highest score first.
+    """
+    box = parse_bbox(bbox)
+    key = (box, min_score, limit, precision)
+    body: Optional[str] = risk_cache.get(key)
+    if body is None:
+        try:
+            body = fetchone_value(SQL_BIKEWAY_RISK_FC, (*box, min_score, limit, precision))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Bikeway risk query failed: {e}")
+        body = body or '{"type": "FeatureCollection", "features": []}'
+        risk_cache.set(key, body)
+    return Response(content=body, media_type="application/json",
+                    headers={"Cache-Control": f"public, max-age={BIKEWAY_RISK_MAX_AGE}"})
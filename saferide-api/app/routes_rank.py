@@ -1,21 +1,31 @@
 # saferide-api/app/routes_rank.py
 from __future__ import annotations
 
-from typing import List, Optional, Tuple, Any, Dict
+from typing import (
+    List, Optional, Tuple, Any, Dict, AsyncIterator, Iterator, NamedTuple,
+    Awaitable, Callable, Generator,
+)
+import asyncio
 import os
 import json
-import re
 import math
+import tempfile
+from array import array
 
-import requests
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+try:
+    import orjson  # optional: much faster /rank_fc serialization
+except ImportError:
+    orjson = None  # type: ignore
+
 # ---------- DB helper (prefer your app.db; fallback to psycopg2) ----------
 try:
     # Your existing helper (recommended)
-    from .db import fetchone_value  # type: ignore
+    from .db import afetchall_rows, fetchone_value, fetchall_rows  # type: ignore
 except Exception:
     # Minimal fallback if .db is not available
     import psycopg2  # type: ignore
@@ -40,8 +50,57 @@ except Exception:
         finally:
             conn.close()
 
+    def fetchall_rows(sql: str, params: Tuple[Any, ...], name: Optional[str] = None,
+                      prepare: bool = False, binary: bool = False) -> List[Dict[str, Any]]:
+        conn = psycopg2.connect(_DATABASE_URL)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # psycopg2 has no binary (%b) placeholders
+                cur.execute(sql.replace("%b", "%s"), params)
+                return [dict(row) for row in cur.fetchall()]
+        finally:
+            conn.close()
+
+    async def afetchall_rows(sql: str, params: Tuple[Any, ...], name: Optional[str] = None,
+                             prepare: bool = False, binary: bool = False) -> List[Dict[str, Any]]:
+        return await run_in_threadpool(fetchall_rows, sql, params)
+
+from . import cache
+from .cache import route_score_key, score_cache
+from .metrics import (
+    ALTERNATIVES_SECONDS, OSRM_FETCH_SECONDS, SCORING_SECONDS, SERIALIZATION_SECONDS,
+    rank_request, stage, start_request,
+)
+from .profiling import admin_token_ok, aprofiled, list_profiles, load_profile, profiled
+from .scoring import ScoringStrategy, get_strategy
+from .geometry import (
+    Line, encode_polyline, line_to_wkb, line_to_wkt, route_line, simplify_line,
+)
+from .osrm import (
+    OSRM_BASE_URL, OSRM_GEOMETRIES, Deadline, acached_route, afetch_first_routes, aosrm_get, cached_route,
+    distinct_by_distance, fetch_first_routes, osrm_get, route_url,
+)
+
 router = APIRouter()
 
+# "sql" scores in PostGIS; "memory" uses the in-process crash index (app.crash_index)
+SCORING_ENGINE = os.getenv("SCORING_ENGINE", "sql").lower()
+
+# /rank and /rank_fc as async endpoints (httpx OSRM client, async DB pool);
+# 0 keeps the threaded implementation
+RANK_ASYNC = os.getenv("RANK_ASYNC", "1").lower() in ("1", "true", "yes")
+
+# Default number of /rank_batch items ranked at the same time
+RANK_BATCH_CONCURRENCY = int(os.getenv("RANK_BATCH_CONCURRENCY", "4"))
+# JSON-array batch bodies are parsed whole; bigger batches must be NDJSON
+RANK_BATCH_JSON_MAX_BYTES = int(os.getenv("RANK_BATCH_JSON_MAX_BYTES", str(4 << 20)))
+
+# Route simplification before scoring (see app.geometry.simplify_line): the
+# Douglas-Peucker tolerance is this fraction of buffer_m, so only crashes
+# within +-ratio*buffer_m of the buffer edge can change the count.
+ROUTE_SIMPLIFY = os.getenv("ROUTE_SIMPLIFY", "0").lower() in ("1", "true", "yes")
+SIMPLIFY_TOLERANCE_RATIO = float(os.getenv("SIMPLIFY_TOLERANCE_RATIO", "0.05"))
+
 # ---------- Pydantic models ----------
 class RankRequest(BaseModel):
     start: List[float] = Field(..., description="[-105.0, 39.7] (lon, lat)")
@@ -50,38 +109,50 @@ class RankRequest(BaseModel):
     max_alternatives: int = Field(3, ge=1, le=5)
     mode: str = Field("driving", description="driving|cycling|walking")
     use_fixture: bool = Field(False, description="Load routes from local JSON fixture")
+    geometry_format: str = Field("wkt", description="wkt|polyline6 (geometry field returned per route)")
+    simplify: Optional[bool] = Field(None, description="Simplify routes before scoring (default: ROUTE_SIMPLIFY)")
+    scoring_strategy: Optional[str] = Field(
+        None, description="buffer_intersects|dwithin_3857|geography_dwithin (default: SCORING_STRATEGY)")
+    score_mode: str = Field("crashes", description="crashes|risk (rank by saferide.score_routes 0-100 risk)")
+    lookback_days: int = Field(365, ge=1, description="Risk mode: crash/hazard lookback window")
 
 class RouteRank(BaseModel):
     mode: str
     index: int
     length_km: float
     crashes: int
-    wkt: str
+    wkt: Optional[str] = None
+    polyline: Optional[str] = Field(None, description="Encoded polyline, precision 6")
+    vertices: Optional[int] = None
+    vertices_scored: Optional[int] = Field(None, description="Vertices left after simplification")
+    risk_score: Optional[int] = Field(None, description="Risk mode: 0-100 score")
+    risk: Optional[Dict[str, Any]] = Field(None, description="Risk mode: saferide.score_routes diagnostics")
 
 class RankResponse(BaseModel):
     winner: Optional[int]
     routes_ranked: List[RouteRank]
 
-# ---------- SQL: score crashes for buffered route WKT ----------
-SQL_SCORE_ROUTE_WKT = """
-WITH line_4326 AS (
-  SELECT ST_GeomFromText(%s, 4326) AS g
-),
-line_3857 AS (
-  SELECT ST_Transform(g, 3857) AS g FROM line_4326
-),
-buf AS (
-  SELECT ST_Buffer(g, %s::float) AS g FROM line_3857
-),
-hits AS (
-  SELECT COUNT(*) AS crashes
-  FROM saferide.crash_weights c
-  JOIN buf b ON ST_Intersects(
-    CASE WHEN ST_SRID(c.geom)=3857 THEN c.geom ELSE ST_Transform(c.geom,3857) END,
-    b.g
-  )
-)
-SELECT (SELECT crashes FROM hits)::int;
+class ScoredRoute(NamedTuple):
+    """A ranked alternative before rendering: OSRM route dict plus its decoded line."""
+    index: int
+    route: dict
+    line: Line
+    length_km: float
+    crashes: int
+    vertices_scored: int
+    risk: Optional[dict] = None
+
+# ---------- SQL: risk diagnostics for every alternative in one call ----------
+# Params: bytea[] of route WKB (binary), lookback_days, buffer_m; rows come
+# back in array order (route_idx is 1-based) with saferide.score_route's jsonb.
+SQL_RISK_ROUTES_WKB_BATCH = """
+SELECT s.route_idx AS idx, s.result
+FROM saferide.score_routes(
+  (SELECT array_agg(ST_GeomFromWKB(u.wkb, 4326) ORDER BY u.idx)
+   FROM unnest(%b::bytea[]) WITH ORDINALITY AS u(wkb, idx)),
+  %s::int,
+  %s::float
+) AS s;
 """
 
 # ---------- Helpers ----------
@@ -122,32 +193,26 @@ def _normalize_osrm_template(tpl: str, mode: str,
                 url = f"{url}{sep}alternatives=false"
     return url
 
-def _call_osrm(mode: str, start: Tuple[float, float], end: Tuple[float, float], k: int) -> dict:
+def _osrm_backend(mode: str) -> str:
+    """
+    OSRM_URL_<MODE> template > generic OSRM_URL template > OSRM_BASE_URL. Also
+    part of the route cache key, so requests and cache entries follow the
+    same backend.
+    """
+    return os.getenv(f"OSRM_URL_{mode.upper()}") or os.getenv("OSRM_URL") or OSRM_BASE_URL
+
+def _osrm_url(mode: str, start: Tuple[float, float], end: Tuple[float, float], k: int) -> str:
     slon, slat = start
     elon, elat = end
 
-    # Per-mode override > generic OSRM_URL > public demo
-    url_tpl = os.getenv(f"OSRM_URL_{mode.upper()}") or os.getenv("OSRM_URL")
-    if url_tpl:
-        url = _normalize_osrm_template(url_tpl, mode, slon, slat, elon, elat, k)
-    else:
-        # Request alternatives (public OSRM demo server doesn't support 'number' parameter)
-        # Just use alternatives=true and it will return what it can
-        if k > 1:
-            url = (
-                f"https://router.project-osrm.org/route/v1/{mode}/"
-                f"{slon},{slat};{elon},{elat}?alternatives=true&overview=full&geometries=geojson"
-            )
-        else:
-            url = (
-                f"https://router.project-osrm.org/route/v1/{mode}/"
-                f"{slon},{slat};{elon},{elat}?alternatives=false&overview=full&geometries=geojson"
-            )
-
-    timeout = float(os.getenv("OSRM_TIMEOUT", "20"))
-    r = requests.get(url, timeout=timeout)
-    r.raise_for_status()
-    result = r.json()
+    backend = _osrm_backend(mode)
+    if backend != OSRM_BASE_URL:
+        return _normalize_osrm_template(backend, mode, slon, slat, elon, elat, k)
+    # Request alternatives (public OSRM demo server doesn't support 'number' parameter)
+    # Just use alternatives=true and it will return what it can
+    return route_url(mode, [start, end], alternatives=k > 1)
+
+def _check_route_count(result: dict, k: int, url: str) -> dict:
     # Debug: log how many routes were returned
     num_routes = len(result.get("routes", []))
     if num_routes < k:
@@ -155,54 +220,218 @@ def _call_osrm(mode: str, start: Tuple[float, float], end: Tuple[float, float],
         logging.warning(f"OSRM returned {num_routes} route(s) but {k} were requested. URL: {url}")
     return result
 
-def _coords_to_wkt(coords: List[List[float]]) -> str:
-    # coords are [[lon,lat], ...]
-    parts = [f"{c[0]} {c[1]}" for c in coords]
-    return "LINESTRING(" + ",".join(parts) + ")"
+def _call_osrm(mode: str, start: Tuple[float, float], end: Tuple[float, float], k: int,
+               deadline: Optional[Deadline] = None) -> dict:
+    return cached_route(_osrm_backend(mode), mode, start, end, k,
+                        lambda: _fetch_osrm(mode, start, end, k, deadline))
+
+def _fetch_osrm(mode: str, start: Tuple[float, float], end: Tuple[float, float], k: int,
+                deadline: Optional[Deadline] = None) -> dict:
+    url = _osrm_url(mode, start, end, k)
+    return _check_route_count(osrm_get(url, deadline), k, url)
+
+async def _acall_osrm(mode: str, start: Tuple[float, float], end: Tuple[float, float], k: int,
+                      deadline: Optional[Deadline] = None) -> dict:
+    return await acached_route(_osrm_backend(mode), mode, start, end, k,
+                               lambda: _afetch_osrm(mode, start, end, k, deadline))
+
+async def _afetch_osrm(mode: str, start: Tuple[float, float], end: Tuple[float, float], k: int,
+                       deadline: Optional[Deadline] = None) -> dict:
+    url = _osrm_url(mode, start, end, k)
+    return _check_route_count(await aosrm_get(url, deadline), k, url)
+
+def _route_polyline(route: dict, line: Line) -> str:
+    # OSRM's own polyline6 string is returned as-is; anything else is encoded
+    geom = route.get("geometry")
+    if isinstance(geom, str) and OSRM_GEOMETRIES == "polyline6":
+        return geom
+    return encode_polyline(line)
+
+def _shifted_route(route: dict, line: Line, dlat_even: float, dlat_odd: float,
+                   scale: float) -> dict:
+    """
+    Synthetic alternative: `route` with every even vertex moved `dlat_even`
+    and every odd one `dlat_odd` degrees north, distance/duration scaled.
+    """
+    shifted = array("d", line)
+    for j in range(1, len(shifted), 2):
+        shifted[j] += dlat_even if (j // 2) % 2 == 0 else dlat_odd
+    alt = {k: v for k, v in route.items() if k != "geometry"}
+    alt["geometry"] = shifted
+    if "distance" in alt:
+        alt["distance"] = alt["distance"] * scale
+    if "duration" in alt:
+        alt["duration"] = alt["duration"] * scale
+    return alt
+
+def _scoring_query(name: str) -> Dict[str, Any]:
+    # Hot path: prepared once per connection, binary in and out, timed per statement
+    return {"name": name, "prepare": True, "binary": True}
+
+def _counts_by_idx(rows: List[Dict[str, Any]], n: int) -> List[int]:
+    by_idx = {int(row["idx"]): int(row["crashes"] or 0) for row in rows}
+    return [by_idx.get(i + 1, 0) for i in range(n)]
+
+def _risks_by_idx(rows: List[Dict[str, Any]], n: int) -> List[dict]:
+    by_idx = {int(row["idx"]): row["result"] for row in rows}
+    out = []
+    for i in range(1, n + 1):
+        res = by_idx.get(i)
+        if isinstance(res, str):
+            res = json.loads(res)
+        out.append(res or {"score": 0, "counts": {"crashes": 0}})
+    return out
+
+# ---------- One code path for the threaded and async endpoints ----------
+# The ranking logic is written once as generator "flows" that yield an _IO
+# step wherever they need OSRM or the DB and are sent its result. _drive runs
+# a flow with the blocking calls (threaded endpoints); _adrive awaits the
+# async twins (RANK_ASYNC), so a request waiting on I/O holds no thread. An
+# error is thrown back into the flow at its yield, so the flow's own
+# try/except blocks behave the same under both drivers.
+class _IO:
+    """One I/O step of a flow: a blocking call and its awaitable twin, same arguments."""
+
+    def __init__(self, call: Callable[..., Any], acall: Callable[..., Awaitable[Any]],
+                 *args: Any, **kwargs: Any):
+        self.call, self.acall, self.args, self.kwargs = call, acall, args, kwargs
+
+Flow = Generator[_IO, Any, Any]
+
+def _drive(flow: Flow) -> Any:
+    """Run a flow on this thread, blocking on each I/O step."""
+    value, error = None, None
+    try:
+        while True:
+            try:
+                step = flow.send(value) if error is None else flow.throw(error)
+            except StopIteration as done:
+                return done.value
+            try:
+                value, error = step.call(*step.args, **step.kwargs), None
+            except Exception as e:
+                value, error = None, e
+    finally:
+        flow.close()
+
+async def _adrive(flow: Flow) -> Any:
+    """Run a flow on the event loop, awaiting each I/O step."""
+    value, error = None, None
+    try:
+        while True:
+            try:
+                step = flow.send(value) if error is None else flow.throw(error)
+            except StopIteration as done:
+                return done.value
+            try:
+                value, error = await step.acall(*step.args, **step.kwargs), None
+            except Exception as e:
+                value, error = None, e
+    finally:
+        flow.close()
 
-_wkt_ls_pat = re.compile(r"^\s*LINESTRING\s*\((?P<body>.+)\)\s*$")
+def _score_batch(wkbs: List[bytes], buffer_m: float,
+                 strategy: Optional[ScoringStrategy] = None) -> Flow:
+    if not wkbs:
+        return []
+    strategy = strategy or get_strategy()
+    rows = yield _IO(fetchall_rows, afetchall_rows, strategy.batch_sql, (buffer_m, wkbs),
+                     **_scoring_query(f"score:{strategy.name}"))
+    return _counts_by_idx(rows, len(wkbs))
 
-def _wkt_to_coords(wkt: str) -> List[List[float]]:
+def _score_routes_batch(wkbs: List[bytes], buffer_m: float,
+                        strategy: Optional[ScoringStrategy] = None) -> List[int]:
     """
-    Very small parser for LINESTRING WKT -> [[lon,lat], ...]
+    Crash counts for every route WKB, in input order, using a single query
+    (see app.scoring for the strategies).
     """
-    m = _wkt_ls_pat.match(wkt)
-    if not m:
-        return []
-    body = m.group("body")
-    coords: List[List[float]] = []
-    for pair in body.split(","):
-        parts = [p for p in pair.strip().split(" ") if p]
-        if len(parts) >= 2:
-            coords.append([float(parts[0]), float(parts[1])])
-    return coords
+    return _drive(_score_batch(wkbs, buffer_m, strategy))
 
-def _meters_to_km(m: float) -> float:
-    return round(float(m) / 1000.0, 3)
+def _count_routes_memory(lines: List[Line], buffer_m: float) -> List[int]:
+    from .crash_index import get_index
+    return get_index().count_routes(lines, buffer_m)
 
-def _generate_alternative_routes(start: Tuple[float, float], end: Tuple[float, float], 
-                                 mode: str, primary_route: dict, num_alternatives: int) -> List[dict]:
+async def _acount_routes_memory(lines: List[Line], buffer_m: float) -> List[int]:
+    # numpy work (and the first index load): keep it off the event loop
+    return await run_in_threadpool(_count_routes_memory, lines, buffer_m)
+
+def _score_keys(lines: List[Line], buffer_m: float, variant: str) -> List[str]:
+    return [route_score_key(line, buffer_m, variant) for line in lines]
+
+def _cache_lookup(keys: List[str]) -> Tuple[List[Any], List[int]]:
+    """Cached values for `keys` (None on a miss) and the indexes of the misses."""
+    values = [score_cache.get(k) for k in keys]
+    return values, [i for i, v in enumerate(values) if v is None]
+
+def _cache_fill(keys: List[str], values: List[Any], missing: List[int], fresh: List[Any]) -> None:
+    for i, v in zip(missing, fresh):
+        values[i] = v
+        score_cache.set(keys[i], v)
+
+def _crash_variant(strategy: ScoringStrategy) -> str:
+    # The memory engine always measures like buffer_intersects
+    return "memory" if SCORING_ENGINE == "memory" else strategy.name
+
+def _score_routes(lines: List[Line], buffer_m: float,
+                  strategy: Optional[ScoringStrategy] = None) -> Flow:
     """
-    Generate alternative routes by adding intermediate waypoints when OSRM only returns one route.
-    Creates detours by adding waypoints at strategic locations along the route.
+    Crash counts per route line, served from the score cache where possible;
+    the misses are scored together in one batched query and cached.
     """
-    alternatives = []
+    strategy = strategy or get_strategy()
+    keys = _score_keys(lines, buffer_m, _crash_variant(strategy))
+    counts, missing = _cache_lookup(keys)
+    if missing:
+        if SCORING_ENGINE == "memory":
+            fresh = yield _IO(_count_routes_memory, _acount_routes_memory,
+                              [lines[i] for i in missing], buffer_m)
+        else:
+            fresh = yield from _score_batch([line_to_wkb(lines[i]) for i in missing], buffer_m, strategy)
+        _cache_fill(keys, counts, missing, fresh)
+    return [int(n or 0) for n in counts]
+
+def _risk_routes(lines: List[Line], buffer_m: float, lookback_days: int) -> Flow:
+    """
+    saferide.score_routes diagnostics per route line (one call for all the
+    cache misses), cached like crash counts.
+    """
+    keys = _score_keys(lines, buffer_m, f"risk:{lookback_days}")
+    results, missing = _cache_lookup(keys)
+    if missing:
+        wkbs = [line_to_wkb(lines[i]) for i in missing]
+        rows = yield _IO(fetchall_rows, afetchall_rows, SQL_RISK_ROUTES_WKB_BATCH,
+                         (wkbs, lookback_days, buffer_m), **_scoring_query("risk"))
+        _cache_fill(keys, results, missing, _risks_by_idx(rows, len(missing)))
+    return [r or {} for r in results]
+
+def _check_admin_token(token: Optional[str]) -> None:
+    if not admin_token_ok(token):
+        detail = "invalid admin token" if os.getenv("ADMIN_TOKEN") else "ADMIN_TOKEN is not configured"
+        raise HTTPException(status_code=403, detail=detail)
+
+def _meters_to_km(m: float) -> float:
+    return round(float(m) / 1000.0, 3)
+
+def _detour_urls(start: Tuple[float, float], end: Tuple[float, float], mode: str,
+                 primary_route: dict, num_alternatives: int) -> List[str]:
+    """One detour request per waypoint along the primary route (or around the midpoint)."""
     slon, slat = start
     elon, elat = end
     
-    # Get primary route coordinates if available
-    primary_coords = primary_route.get("geometry", {}).get("coordinates", [])
+    # Get primary route geometry if available
+    primary_line = route_line(primary_route)
+    n_points = len(primary_line) // 2
     
     # Calculate waypoint positions
     # Use 1/3 and 2/3 points along the route, or midpoint if no route geometry
-    if len(primary_coords) > 2:
+    if n_points > 2:
         # Use points from the primary route
-        third_idx = len(primary_coords) // 3
-        two_thirds_idx = 2 * len(primary_coords) // 3
+        third_idx = n_points // 3
+        two_thirds_idx = 2 * n_points // 3
         
         waypoints = [
-            (primary_coords[third_idx][0], primary_coords[third_idx][1]),
-            (primary_coords[two_thirds_idx][0], primary_coords[two_thirds_idx][1])
+            (primary_line[2 * third_idx], primary_line[2 * third_idx + 1]),
+            (primary_line[2 * two_thirds_idx], primary_line[2 * two_thirds_idx + 1])
         ]
     else:
         # Fallback: use calculated midpoints
@@ -213,7 +442,7 @@ def _generate_alternative_routes(start: Tuple[float, float], end: Tuple[float, f
             (mid_lon, mid_lat - 0.01)   # Slightly south
         ]
     
-    # Generate alternative routes with different waypoints
+    urls: List[str] = []
     for i, (wp_lon, wp_lat) in enumerate(waypoints[:num_alternatives]):
         # Add perpendicular offset to create detour
         dlat = elat - slat
@@ -229,315 +458,563 @@ def _generate_alternative_routes(start: Tuple[float, float], end: Tuple[float, f
         else:
             offset_lat = wp_lat - perp_lat
             offset_lon = wp_lon - perp_lon
-        
-        # Request route with waypoint
-        try:
-            url = (
-                f"https://router.project-osrm.org/route/v1/{mode}/"
-                f"{slon},{slat};{offset_lon},{offset_lat};{elon},{elat}"
-                f"?overview=full&geometries=geojson&alternatives=false"
-            )
-            r = requests.get(url, timeout=20)
-            if r.status_code == 200:
-                result = r.json()
-                alt_routes = result.get("routes", [])
-                if alt_routes:
-                    alt_route = alt_routes[0]
-                    # Verify it's different from primary
-                    alt_coords = alt_route.get("geometry", {}).get("coordinates", [])
-                    if len(alt_coords) > 0:
-                        # Check route is valid and different
-                        alt_dist = alt_route.get("distance", 0)
-                        primary_dist = primary_route.get("distance", 0)
-                        # Accept if distance differs by at least 5%
-                        if abs(alt_dist - primary_dist) / max(primary_dist, 1) > 0.05:
-                            alternatives.append(alt_route)
-                            if len(alternatives) >= num_alternatives - 1:
-                                break
-        except Exception as e:
-            import logging
-            logging.warning(f"Failed to generate alternative route {i+1}: {e}")
-            continue
+        urls.append(route_url(mode, [start, (offset_lon, offset_lat), end]))
+    return urls
+
+def _midpoint_urls(start: Tuple[float, float], end: Tuple[float, float], mode: str,
+                   have: int, wanted: int) -> List[str]:
+    """Detours through east-west offsets around the midpoint, one per missing route."""
+    mid_lat = (start[1] + end[1]) / 2
+    mid_lon = (start[0] + end[0]) / 2
+    urls = []
+    for n in range(have, wanted):
+        offset = 0.01 * (n + 1)
+        wp_lon = mid_lon + offset if n % 2 == 0 else mid_lon - offset
+        urls.append(route_url(mode, [start, (wp_lon, mid_lat), end]))
+    return urls
+
+def _first_routes(urls: List[str], want: int, accept: Callable[[dict, List[dict]], bool],
+                  deadline: Optional[Deadline], **kwargs: Any) -> _IO:
+    return _IO(fetch_first_routes, afetch_first_routes, urls, want, accept, deadline, **kwargs)
+
+def _generate_alternative_routes(start: Tuple[float, float], end: Tuple[float, float], 
+                                 mode: str, primary_route: dict, num_alternatives: int,
+                                 deadline: Optional[Deadline] = None) -> Flow:
+    """
+    Generate alternative routes by adding intermediate waypoints when OSRM only returns one route.
+    Creates detours by adding waypoints at strategic locations along the route; the
+    detour requests run concurrently and stop once enough alternatives arrived.
+    """
+    wanted = num_alternatives - 1
+    urls = _detour_urls(start, end, mode, primary_route, num_alternatives)
+    # Accept if distance differs by at least 5%
+    alternatives = yield _first_routes(urls, wanted, distinct_by_distance(primary_route, 0.05), deadline)
     
     # If we still don't have enough, create variations with different waypoint positions
-    while len(alternatives) < num_alternatives - 1:
-        # Try with waypoints at different positions
-        mid_lat = (slat + elat) / 2
-        mid_lon = (slon + elon) / 2
-        offset = 0.01 * (len(alternatives) + 1)
-        
-        try:
-            # Try east-west offset
-            wp_lon = mid_lon + offset if len(alternatives) % 2 == 0 else mid_lon - offset
-            wp_lat = mid_lat
-            
-            url = (
-                f"https://router.project-osrm.org/route/v1/{mode}/"
-                f"{slon},{slat};{wp_lon},{wp_lat};{elon},{elat}"
-                f"?overview=full&geometries=geojson&alternatives=false"
-            )
-            r = requests.get(url, timeout=20)
-            if r.status_code == 200:
-                result = r.json()
-                alt_routes = result.get("routes", [])
-                if alt_routes:
-                    alternatives.append(alt_routes[0])
-                    if len(alternatives) >= num_alternatives - 1:
-                        break
-        except Exception:
-            break
+    if len(alternatives) < wanted:
+        urls = _midpoint_urls(start, end, mode, len(alternatives), wanted)
+        alternatives += yield _first_routes(urls, wanted - len(alternatives),
+                                            lambda route, accepted: True, deadline)
     
     return alternatives
 
-# ---------- Endpoints ----------
-@router.post("/rank", response_model=RankResponse)
-def rank_routes(body: RankRequest) -> RankResponse:
+def _compass_urls(body: RankRequest, mode: str) -> List[str]:
+    """Detours through points north, south, east and west of the trip midpoint."""
+    slon, slat = body.start[0], body.start[1]
+    elon, elat = body.end[0], body.end[1]
+    mid_lat = (slat + elat) / 2
+    mid_lon = (slon + elon) / 2
+    
+    # Create offset waypoints (north, south, east, west)
+    offsets = [
+        (0, 0.02),    # North
+        (0, -0.02),   # South
+        (0.02, 0),    # East
+        (-0.02, 0)    # West
+    ]
+    return [
+        route_url(mode, [(slon, slat), (mid_lon + offset_lon, mid_lat + offset_lat), (elon, elat)])
+        for offset_lon, offset_lat in offsets
+    ]
+
+def _vary_primary(routes: List[dict], want: int) -> None:
+    """Final fallback: duplicate the primary route with coordinate variations."""
     import logging
-    logging.basicConfig(level=logging.INFO)
+
+    logging.warning(f"Using final fallback: duplicating primary route with coordinate variations")
+    primary_route_copy = routes[0]
+    primary_line = route_line(primary_route_copy)
     
+    for i in range(want - len(routes)):
+        # Create a variation by slightly offsetting coordinates
+        if len(primary_line) > 0:
+            # Alternate between north/south offset per vertex, growing per route
+            offset = 0.001 * (i + 1)
+            routes.append(_shifted_route(primary_route_copy, primary_line,
+                                         offset, -offset, 1.05 + i * 0.05))
+            logging.info(f"Added variation route {i+1}")
+
+    logging.info(f"Final fallback: Now have {len(routes)} total route(s)")
+
+def _force_alternatives(routes: List[dict], want: int) -> None:
+    """
+    CRITICAL: Ensure we have exactly the requested number of routes. If we
+    still don't have enough, force create them from the primary route.
+    """
+    import logging
+
+    if len(routes) < want and len(routes) > 0:
+        logging.warning(f"FORCE CREATING routes: Have {len(routes)}, need {want}")
+        primary_route = routes[0]
+        primary_line = route_line(primary_route)
+        
+        if len(primary_line) > 0:
+            for i in range(want - len(routes)):
+                # Create offset - alternate between north and south, larger than above
+                offset = 0.002 * (i + 1) * (1 if i % 2 == 0 else -1)
+                routes.append(_shifted_route(primary_route, primary_line,
+                                             offset, offset, 1.1 + i * 0.1))
+                logging.info(f"FORCE CREATED route {len(routes)}")
+        
+        logging.info(f"AFTER FORCE CREATE: Now have {len(routes)} total route(s)")
+
+# (index, OSRM route, decoded line, line to score, distance in meters)
+Candidate = Tuple[int, dict, Line, Line, float]
+
+def _candidates(body: RankRequest, routes: List[dict]) -> List[Candidate]:
+    import logging
+
+    logging.info(f"Processing {len(routes)} route(s) for scoring...")
+    simplify = ROUTE_SIMPLIFY if body.simplify is None else body.simplify
+    tolerance_m = body.buffer_m * SIMPLIFY_TOLERANCE_RATIO if simplify else 0.0
+    candidates: List[Candidate] = []
+    for idx, r in enumerate(routes):
+        # polyline6 from OSRM (GeoJSON from fixtures), decoded once per route
+        line = route_line(r)
+        if not line:
+            logging.warning(f"Skipping route {idx}: no coordinates found")
+            continue
+        
+        # Scoring only needs the line to within a fraction of the buffer
+        scored_line = simplify_line(line, tolerance_m) if tolerance_m > 0 else line
+        logging.info(f"Processing route {idx}: {len(line) // 2} coordinate points, "
+                     f"{len(scored_line) // 2} scored")
+
+        # distance in meters (prefer top-level, else sum legs)
+        dist_m: float = 0.0
+        if "distance" in r:
+            dist_m = float(r["distance"])
+        elif "legs" in r and r["legs"]:
+            try:
+                dist_m = float(sum(float(leg.get("distance", 0.0)) for leg in r["legs"]))
+            except Exception:
+                dist_m = 0.0
+
+        candidates.append((idx, r, line, scored_line, dist_m))
+    return candidates
+
+def _risk_counts(risks: List[dict]) -> List[int]:
+    return [int((r.get("counts") or {}).get("crashes") or 0) for r in risks]
+
+def _rank(candidates: List[Candidate], counts: List[int], risks: List[Optional[dict]],
+          score_mode: str) -> List[ScoredRoute]:
+    import logging
+
+    ranked = [
+        ScoredRoute(idx, r, line, _meters_to_km(dist_m), crashes, len(scored_line) // 2, risk)
+        for (idx, r, line, scored_line, dist_m), crashes, risk in zip(candidates, counts, risks)
+    ]
+    if score_mode == "risk":
+        ranked.sort(key=lambda x: (int(x.risk.get("score") or 0), x.crashes, x.length_km))
+    else:
+        ranked.sort(key=lambda x: (x.crashes, x.length_km))
+    if ranked:
+        logging.info(f"Returning {len(ranked)} ranked route(s), winner: {ranked[0].index}")
+    return ranked
+
+# ---------- Endpoints ----------
+def _validate_mode(body: RankRequest) -> str:
     mode = body.mode.lower()
     if mode not in {"driving", "cycling", "walking"}:
         raise HTTPException(status_code=400, detail="mode must be driving|cycling|walking")
+    return mode
 
-    # 1) fetch OSRM routes
+def _rank_options(body: RankRequest) -> Tuple[ScoringStrategy, str]:
     try:
-        if body.use_fixture:
-            osrm = _load_fixture(mode)
-        else:
-            osrm = _call_osrm(mode, (body.start[0], body.start[1]), (body.end[0], body.end[1]), body.max_alternatives)
+        strategy = get_strategy(body.scoring_strategy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    score_mode = body.score_mode.lower()
+    if score_mode not in {"crashes", "risk"}:
+        raise HTTPException(status_code=400, detail="score_mode must be crashes|risk")
+    return strategy, score_mode
+
+def _scoring_engine(score_mode: str) -> str:
+    # Risk scores always come from saferide.score_routes in PostGIS
+    return "sql" if score_mode == "risk" else SCORING_ENGINE
+
+def _rank_scored(body: RankRequest, mode: str) -> Flow:
+    """
+    Fetch, fill in and score the alternatives for one request. Returns them
+    safest first together with their decoded lines, so /rank and /rank_fc
+    render geometry straight from the arrays. A flow: run it with _drive
+    (threaded endpoints) or _adrive (async endpoints).
+    """
+    import logging
+
+    strategy, score_mode = _rank_options(body)
+    start, end = (body.start[0], body.start[1]), (body.end[0], body.end[1])
+
+    # 1) fetch OSRM routes (one deadline covers the primary call and every detour)
+    deadline = Deadline()
+    try:
+        with stage("osrm", OSRM_FETCH_SECONDS, mode=mode):
+            if body.use_fixture:
+                osrm = _load_fixture(mode)
+            else:
+                osrm = yield _IO(_call_osrm, _acall_osrm, mode, start, end, body.max_alternatives, deadline)
     except Exception as e:
         logging.error(f"OSRM fetch failed: {e}", exc_info=True)
         raise HTTPException(status_code=502, detail=f"OSRM fetch failed: {e}")
 
     routes = osrm.get("routes") or []
     if not routes:
-        return RankResponse(winner=None, routes_ranked=[])
+        return []
     
     # Debug: log actual number of routes received
     logging.info(f"OSRM returned {len(routes)} route(s) for {mode} mode, requested {body.max_alternatives}")
     
     # ALWAYS ensure we have the requested number of routes
-    # If we got fewer routes than requested, generate alternatives
+    # If we got fewer routes than requested, generate alternatives. Every OSRM
+    # call below shares the request deadline; once it is spent we go straight
+    # to the synthetic fallback.
     try:
-        max_iterations = 3  # Prevent infinite loop
-        iteration = 0
-        while len(routes) < body.max_alternatives and len(routes) > 0 and iteration < max_iterations:
-            iteration += 1
+        if len(routes) < body.max_alternatives:
             primary_route = routes[0]
             needed = body.max_alternatives - len(routes)
             logging.info(f"OSRM only returned {len(routes)} route(s), need {needed} more. Generating alternatives...")
             
             # Try generating alternatives with waypoints first
-            slon, slat = body.start[0], body.start[1]
-            elon, elat = body.end[0], body.end[1]
-            mid_lat = (slat + elat) / 2
-            mid_lon = (slon + elon) / 2
-            
-            # Create offset waypoints (north, south, east, west)
-            offsets = [
-                (0, 0.02),    # North
-                (0, -0.02),   # South
-                (0.02, 0),    # East
-                (-0.02, 0)    # West
-            ]
-            
-            alt_added = False
-            for i, (offset_lon, offset_lat) in enumerate(offsets):
-                if len(routes) >= body.max_alternatives:
-                    break
-                wp_lon = mid_lon + offset_lon
-                wp_lat = mid_lat + offset_lat
-                
-                try:
-                    url = (
-                        f"https://router.project-osrm.org/route/v1/{mode}/"
-                        f"{slon},{slat};{wp_lon},{wp_lat};{elon},{elat}"
-                        f"?overview=full&geometries=geojson&alternatives=false"
-                    )
-                    r = requests.get(url, timeout=15)
-                    if r.status_code == 200:
-                        result = r.json()
-                        alt_routes = result.get("routes", [])
-                        if alt_routes and len(alt_routes) > 0:
-                            alt_route = alt_routes[0]
-                            # Check if it's different from primary
-                            primary_coords = primary_route.get("geometry", {}).get("coordinates", [])
-                            alt_coords = alt_route.get("geometry", {}).get("coordinates", [])
-                            if len(alt_coords) > 0 and len(primary_coords) > 0:
-                                # Check if distance is different by at least 3%
-                                alt_dist = alt_route.get("distance", 0)
-                                primary_dist = primary_route.get("distance", 0)
-                                if abs(alt_dist - primary_dist) / max(primary_dist, 1) > 0.03:
-                                    routes.append(alt_route)
-                                    alt_added = True
-                                    logging.info(f"Added alternative route {len(routes)} via waypoint {i+1}")
-                except Exception as e:
-                    logging.warning(f"Waypoint {i+1} failed: {e}")
-                    continue
+            # Accept if distance differs by at least 3%
+            with stage("alternatives", ALTERNATIVES_SECONDS, source="waypoints"):
+                alt_routes = yield _first_routes(_compass_urls(body, mode), needed,
+                                                 distinct_by_distance(primary_route, 0.03),
+                                                 deadline, timeout=15)
+            routes.extend(alt_routes)
+            logging.info(f"Added {len(alt_routes)} alternative route(s) via compass waypoints")
             
             # If still not enough, try the complex generation function
-            if len(routes) < body.max_alternatives:
+            if len(routes) < body.max_alternatives and not deadline.expired():
                 try:
-                    alt_routes = _generate_alternative_routes(
-                        (body.start[0], body.start[1]),
-                        (body.end[0], body.end[1]),
-                        mode,
-                        primary_route,
-                        body.max_alternatives - len(routes) + 1
-                    )
+                    with stage("alternatives", ALTERNATIVES_SECONDS, source="generate"):
+                        alt_routes = yield from _generate_alternative_routes(
+                            start, end, mode, primary_route,
+                            body.max_alternatives - len(routes) + 1, deadline,
+                        )
                     logging.info(f"Generated {len(alt_routes)} alternative route(s) via function")
-                    for alt_route in alt_routes:
-                        if len(routes) >= body.max_alternatives:
-                            break
-                        routes.append(alt_route)
-                        alt_added = True
+                    routes.extend(alt_routes[:body.max_alternatives - len(routes)])
                 except Exception as e:
                     logging.error(f"Alternative generation function failed: {e}", exc_info=True)
             
-            # Final fallback: duplicate primary route with coordinate variations
             if len(routes) < body.max_alternatives:
-                logging.warning(f"Using final fallback: duplicating primary route with coordinate variations")
-                primary_route_copy = routes[0].copy()
-                primary_coords = primary_route_copy.get("geometry", {}).get("coordinates", [])
-                
-                for i in range(body.max_alternatives - len(routes)):
-                    # Create a variation by slightly offsetting coordinates
-                    if primary_coords and len(primary_coords) > 0:
-                        alt_route = json.loads(json.dumps(primary_route_copy))  # Deep copy
-                        alt_coords = []
-                        # Offset coordinates slightly (perpendicular to route direction)
-                        offset = 0.001 * (i + 1)  # Small offset that increases
-                        for j, coord in enumerate(primary_coords):
-                            # Alternate between north/south offset
-                            if j % 2 == 0:
-                                alt_coords.append([coord[0], coord[1] + offset])
-                            else:
-                                alt_coords.append([coord[0], coord[1] - offset])
-                        
-                        alt_route["geometry"]["coordinates"] = alt_coords
-                        # Modify distance slightly
-                        if "distance" in alt_route:
-                            alt_route["distance"] = alt_route["distance"] * (1.05 + i * 0.05)
-                        if "duration" in alt_route:
-                            alt_route["duration"] = alt_route["duration"] * (1.05 + i * 0.05)
-                        
-                        routes.append(alt_route)
-                        logging.info(f"Added variation route {i+1}")
-            
-                logging.info(f"Final fallback: Now have {len(routes)} total route(s)")
-            
-            # Break if we've added routes in this iteration
-            if len(routes) >= body.max_alternatives:
-                break
+                with stage("alternatives", ALTERNATIVES_SECONDS, source="fallback"):
+                    _vary_primary(routes, body.max_alternatives)
     except Exception as e:
         logging.error(f"Error in route generation loop: {e}", exc_info=True)
         # Continue anyway - we'll force create routes below
     
-    # CRITICAL: Ensure we have exactly the requested number of routes
-    # If we still don't have enough, force create them from the primary route
-    if len(routes) < body.max_alternatives and len(routes) > 0:
-        logging.warning(f"FORCE CREATING routes: Have {len(routes)}, need {body.max_alternatives}")
-        primary_route = routes[0]
-        primary_coords = primary_route.get("geometry", {}).get("coordinates", [])
-        
-        if primary_coords and len(primary_coords) > 0:
-            for i in range(body.max_alternatives - len(routes)):
-                # Create a deep copy and modify coordinates
-                alt_route = json.loads(json.dumps(primary_route))
-                alt_coords = []
-                
-                # Create offset - alternate between positive and negative
-                offset = 0.002 * (i + 1)  # Larger offset
-                for coord in primary_coords:
-                    if i % 2 == 0:
-                        # Offset north
-                        alt_coords.append([coord[0], coord[1] + offset])
-                    else:
-                        # Offset south
-                        alt_coords.append([coord[0], coord[1] - offset])
-                
-                alt_route["geometry"]["coordinates"] = alt_coords
-                if "distance" in alt_route:
-                    alt_route["distance"] = alt_route["distance"] * (1.1 + i * 0.1)
-                if "duration" in alt_route:
-                    alt_route["duration"] = alt_route["duration"] * (1.1 + i * 0.1)
-                
-                routes.append(alt_route)
-                logging.info(f"FORCE CREATED route {len(routes)}")
-        
-        logging.info(f"AFTER FORCE CREATE: Now have {len(routes)} total route(s)")
+    if len(routes) < body.max_alternatives:
+        with stage("alternatives", ALTERNATIVES_SECONDS, source="fallback"):
+            _force_alternatives(routes, body.max_alternatives)
 
-    # 2) score each alternative
-    ranked: List[RouteRank] = []
-    logging.info(f"Processing {len(routes)} route(s) for scoring...")
+    # 2) score all alternatives in one DB round trip
     try:
-        for idx, r in enumerate(routes):
-            geom = r.get("geometry") or {}
-            # OSRM returns {type:LineString, coordinates:[[lon,lat]...]}
-            coords = geom.get("coordinates") or []
-            if not coords:
-                # Some fixtures embed geometry differently; try legs->steps fallback
-                coords = []
-            if not coords:
-                logging.warning(f"Skipping route {idx}: no coordinates found")
-                continue
-            
-            logging.info(f"Processing route {idx}: {len(coords)} coordinate points")
-
-            wkt = _coords_to_wkt(coords)
-
-            # distance in meters (prefer top-level, else sum legs)
-            dist_m: float = 0.0
-            if "distance" in r:
-                dist_m = float(r["distance"])
-            elif "legs" in r and r["legs"]:
-                try:
-                    dist_m = float(sum(float(leg.get("distance", 0.0)) for leg in r["legs"]))
-                except Exception:
-                    dist_m = 0.0
-
-            try:
-                crashes_val = fetchone_value(SQL_SCORE_ROUTE_WKT, (wkt, body.buffer_m))
-                crashes = int(crashes_val or 0)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"DB scoring failed for route {idx}: {e}")
-
-            ranked.append(RouteRank(
-                mode=mode,
-                index=idx,
-                length_km=_meters_to_km(dist_m),
-                crashes=crashes,
-                wkt=wkt
-            ))
-
-        if not ranked:
-            return RankResponse(winner=None, routes_ranked=[])
-
-        ranked.sort(key=lambda x: (x.crashes, x.length_km))
-        winner_idx = ranked[0].index
-        logging.info(f"Returning {len(ranked)} ranked route(s), winner: {winner_idx}")
-        return RankResponse(winner=winner_idx, routes_ranked=ranked)
+        candidates = _candidates(body, routes)
+        lines = [c[3] for c in candidates]
+        risks: List[Optional[dict]] = [None] * len(candidates)
+        try:
+            with stage("scoring", SCORING_SECONDS, score_mode=score_mode, engine=_scoring_engine(score_mode)):
+                if score_mode == "risk":
+                    # Crash weight, open hazards and densities in one saferide.score_routes call
+                    risks = yield from _risk_routes(lines, body.buffer_m, body.lookback_days)
+                    counts = _risk_counts(risks)
+                else:
+                    counts = yield from _score_routes(lines, body.buffer_m, strategy)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"DB scoring failed: {e}")
+        return _rank(candidates, counts, risks, score_mode)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in rank_routes: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Route ranking failed: {str(e)}")
 
-@router.post("/rank_fc")
-def rank_routes_fc(body: RankRequest):
+def _geometry_format(body: RankRequest) -> str:
+    geometry_format = body.geometry_format.lower()
+    if geometry_format not in {"wkt", "polyline6"}:
+        raise HTTPException(status_code=400, detail="geometry_format must be wkt|polyline6")
+    return geometry_format
+
+def _rank_response(scored: List[ScoredRoute], mode: str, geometry_format: str) -> RankResponse:
+    ranked = [
+        RouteRank(
+            mode=mode,
+            index=s.index,
+            length_km=s.length_km,
+            crashes=s.crashes,
+            wkt=line_to_wkt(s.line) if geometry_format == "wkt" else None,
+            polyline=_route_polyline(s.route, s.line) if geometry_format == "polyline6" else None,
+            vertices=len(s.line) // 2,
+            vertices_scored=s.vertices_scored,
+            risk_score=s.risk.get("score") if s.risk else None,
+            risk=s.risk,
+        )
+        for s in scored
+    ]
+    return RankResponse(winner=ranked[0].index if ranked else None, routes_ranked=ranked)
+
+def rank_routes_threaded(body: RankRequest) -> RankResponse:
+    mode = _validate_mode(body)
+    geometry_format = _geometry_format(body)
+    with rank_request("rank") as stats, profiled(stats, "rank"):
+        scored = _drive(_rank_scored(body, mode))
+        # WKT/polyline encoding; FastAPI's JSON encoding of the model follows
+        with stage("serialization", SERIALIZATION_SECONDS, endpoint="rank"):
+            return _rank_response(scored, mode, geometry_format)
+
+async def rank_routes_async(body: RankRequest) -> RankResponse:
+    mode = _validate_mode(body)
+    geometry_format = _geometry_format(body)
+    with rank_request("rank") as stats:
+        async with aprofiled(stats, "rank"):
+            scored = await _adrive(_rank_scored(body, mode))
+            with stage("serialization", SERIALIZATION_SECONDS, endpoint="rank"):
+                return _rank_response(scored, mode, geometry_format)
+
+def _fc_coordinates(line: Line, precision: Optional[int]) -> Any:
     """
-    Same as /rank, but returns a GeoJSON FeatureCollection ready for mapping.
+    (N, 2) float64 view of the line for orjson (no per-vertex lists), rounded
+    to `precision` decimals if given; nested lists when orjson is unavailable.
     """
-    res = rank_routes(body)  # reuse logic/validation
-    feats: List[Dict[str, Any]] = []
-    for rr in res.routes_ranked:
-        coords = _wkt_to_coords(rr.wkt)
-        feats.append({
+    import numpy as np
+
+    coords = np.frombuffer(line, dtype=np.float64).reshape(-1, 2)
+    if precision is not None:
+        coords = np.round(coords, precision)
+    return coords if orjson is not None else coords.tolist()
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+def render_feature_collection(ranked: List[ScoredRoute], precision: Optional[int] = None) -> bytes:
+    """GeoJSON FeatureCollection bytes for ranked routes (winner first)."""
+    winner = ranked[0].index if ranked else None
+    return _dumps({"type": "FeatureCollection", "features": [
+        {
             "type": "Feature",
-            "geometry": {"type": "LineString", "coordinates": coords},
+            "geometry": {"type": "LineString", "coordinates": _fc_coordinates(s.line, precision)},
             "properties": {
-                "index": rr.index,
-                "crashes": rr.crashes,
-                "length_km": rr.length_km,
-                "is_winner": (rr.index == res.winner)
+                "index": s.index,
+                "crashes": s.crashes,
+                "length_km": s.length_km,
+                "vertices": len(s.line) // 2,
+                "vertices_scored": s.vertices_scored,
+                "risk_score": s.risk.get("score") if s.risk else None,
+                "is_winner": (s.index == winner)
             }
-        })
-    return JSONResponse({"type": "FeatureCollection", "features": feats})
+        }
+        for s in ranked
+    ]})
+
+def rank_routes_fc_threaded(body: RankRequest,
+                            precision: Optional[int] = Query(None, ge=0, le=15,
+                                                             description="Coordinate decimals (6 ≈ 0.1 m)")):
+    """
+    Same as /rank, but returns a GeoJSON FeatureCollection ready for mapping.
+    """
+    mode = _validate_mode(body)
+    with rank_request("rank_fc") as stats, profiled(stats, "rank_fc"):
+        ranked = _drive(_rank_scored(body, mode))
+        with stage("serialization", SERIALIZATION_SECONDS, endpoint="rank_fc"):
+            content = render_feature_collection(ranked, precision)
+    return Response(content=content, media_type="application/json")
+
+async def rank_routes_fc_async(body: RankRequest,
+                               precision: Optional[int] = Query(None, ge=0, le=15,
+                                                                description="Coordinate decimals (6 ≈ 0.1 m)")):
+    """
+    Same as /rank, but returns a GeoJSON FeatureCollection ready for mapping.
+    """
+    mode = _validate_mode(body)
+    with rank_request("rank_fc") as stats:
+        async with aprofiled(stats, "rank_fc"):
+            ranked = await _adrive(_rank_scored(body, mode))
+            with stage("serialization", SERIALIZATION_SECONDS, endpoint="rank_fc"):
+                content = render_feature_collection(ranked, precision)
+    return Response(content=content, media_type="application/json")
+
+# RANK_ASYNC picks the implementation behind /rank and /rank_fc: async
+# endpoints on the event loop (default), or the threaded ones that Starlette
+# runs in its threadpool (40 threads by default, each blocked on OSRM/DB).
+rank_routes = rank_routes_async if RANK_ASYNC else rank_routes_threaded
+rank_routes_fc = rank_routes_fc_async if RANK_ASYNC else rank_routes_fc_threaded
+router.add_api_route("/rank", rank_routes, methods=["POST"], response_model=RankResponse)
+router.add_api_route("/rank_fc", rank_routes_fc, methods=["POST"])
+
+RANK_BATCH_SPOOL_BYTES = 1 << 20
+
+def _body_too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413,
+                         detail=f"JSON array batches are limited to {limit} bytes; "
+                                f"send larger batches as NDJSON (Content-Type: application/x-ndjson)")
+
+async def _spool_body(request: Request, max_bytes: Optional[int] = None) -> Any:
+    """
+    Copy the request body into a spooled temp file. The body must be consumed
+    before the StreamingResponse starts (Starlette's disconnect listener reads
+    from the same channel), and spooling keeps memory flat for big uploads.
+    Raises 413 once the body passes `max_bytes`.
+    """
+    if max_bytes is not None and int(request.headers.get("content-length") or 0) > max_bytes:
+        raise _body_too_large(max_bytes)
+    spool = tempfile.SpooledTemporaryFile(max_size=RANK_BATCH_SPOOL_BYTES)
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            spool.close()
+            raise _body_too_large(max_bytes)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+def _iter_batch_items(spool: Any, ndjson: bool) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (line number, raw item) from an NDJSON body one line at a time, or
+    from a JSON array / {"items": [...]} body. Arrays are parsed in one go,
+    which is why rank_routes_batch caps their size.
+    """
+    if ndjson:
+        for n, line in enumerate(spool, 1):
+            if line.strip():
+                yield n, line
+    else:
+        body = spool.read()
+        try:
+            payload = json.loads(body or b"[]")
+        except ValueError:
+            # Reported as a single failed item rather than a broken stream
+            yield 1, body
+            return
+        items = payload.get("items", []) if isinstance(payload, dict) else payload
+        for n, item in enumerate(items, 1):
+            yield n, item
+
+async def _rank_batch_item(n: int, raw: Any) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"line": n}
+    try:
+        obj = json.loads(raw) if isinstance(raw, (bytes, str)) else raw
+        if isinstance(obj, dict):
+            # Echo a caller-supplied id (e.g. request_id from replayed logs)
+            item_id = obj.get("id", obj.get("request_id"))
+            if item_id is not None:
+                out["id"] = item_id
+        body = RankRequest.model_validate(obj)
+        # Each item runs in its own task: count its OSRM calls separately
+        start_request()
+        if RANK_ASYNC:
+            res = await rank_routes_async(body)
+        else:
+            res = await run_in_threadpool(rank_routes_threaded, body)
+        out.update(ok=True, result=res.model_dump())
+    except HTTPException as e:
+        out.update(ok=False, status=e.status_code, error=e.detail)
+    except Exception as e:
+        out.update(ok=False, status=400, error=str(e))
+    return out
+
+async def _rank_batch_stream(spool: Any, ndjson: bool, concurrency: int) -> AsyncIterator[str]:
+    # At most `concurrency` items are in flight; the next one is only read
+    # once a slot frees up, so memory stays flat for any batch size.
+    pending: set = set()
+    try:
+        for n, raw in _iter_batch_items(spool, ndjson):
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield json.dumps(task.result()) + "\n"
+            pending.add(asyncio.create_task(_rank_batch_item(n, raw)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps(task.result()) + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
+        spool.close()
+
+@router.post("/rank_batch")
+async def rank_routes_batch(request: Request,
+                            concurrency: int = Query(RANK_BATCH_CONCURRENCY, ge=1, le=32)):
+    """
+    Rank many origin/destination pairs in one call.
+
+    Body: NDJSON (Content-Type: application/x-ndjson, one RankRequest per line)
+    or a JSON array of RankRequest objects. Returns NDJSON, one line per item in
+    completion order: {"line", "id"?, "ok", "result" | "status"+"error"}.
+    Items share the process-wide OSRM session and DB pool. NDJSON is read one
+    line at a time, so memory stays flat for any batch size; JSON arrays are
+    parsed whole and rejected with 413 above RANK_BATCH_JSON_MAX_BYTES.
+    """
+    ctype = request.headers.get("content-type", "")
+    ndjson = "ndjson" in ctype or "jsonl" in ctype
+    spool = await _spool_body(request, None if ndjson else RANK_BATCH_JSON_MAX_BYTES)
+    return StreamingResponse(_rank_batch_stream(spool, ndjson, concurrency),
+                             media_type="application/x-ndjson")
+
+@router.get("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters and sizes of the in-process caches.
+    """
+    return cache.stats()
+
+@router.get("/db/stats")
+def db_stats():
+    """
+    Calls, rows and mean/max execute and fetch time of the scoring queries
+    (prepared, binary WKB), per statement.
+    """
+    from .db import statement_stats
+    return statement_stats.stats()
+
+@router.get("/profiles")
+def profiles(x_admin_token: Optional[str] = Header(None)):
+    """
+    Stored ranking profiles, newest first (see PROFILE_SAMPLE_RATE and the
+    X-Profile request header); requires X-Admin-Token.
+    """
+    _check_admin_token(x_admin_token)
+    return {"profiles": list_profiles()}
+
+@router.get("/profiles/{profile_id}")
+def profile_download(profile_id: str,
+                     format: str = Query("json", description="json | folded (flamegraph.pl / speedscope)"),
+                     x_admin_token: Optional[str] = Header(None)):
+    """
+    One stored profile: stage times plus sampled wall-clock stacks, or only
+    the collapsed stacks with `?format=folded`.
+    """
+    _check_admin_token(x_admin_token)
+    if format not in {"json", "folded"}:
+        raise HTTPException(status_code=400, detail="format must be json|folded")
+    doc = load_profile(profile_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    if format == "folded":
+        return Response(content=doc["folded"], media_type="text/plain",
+                        headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'})
+    return doc
+
+@router.post("/cache/invalidate")
+def cache_invalidate(scope: Optional[str] = None,
+                     x_admin_token: Optional[str] = Header(None)):
+    """
+    Drop cached results (all caches, or only `scope`). Called by the ETL
+    loaders after new crashes land; requires X-Admin-Token.
+    """
+    _check_admin_token(x_admin_token)
+    return {"cleared": cache.invalidate(scope)}
+
+@router.post("/crash_index/reload")
+def crash_index_reload(x_admin_token: Optional[str] = Header(None)):
+    """
+    Rebuild the in-process crash index (SCORING_ENGINE=memory) from the DB;
+    the swap drops cached scores computed against the old data.
+    """
+    _check_admin_token(x_admin_token)
+    from .crash_index import reload_index
+    index = reload_index()
+    return {"engine": SCORING_ENGINE, "index": index.stats()}
@@ -0,0 +1,124 @@
+# saferide-api/app/routes_tiles.py
+"""
+Mapbox Vector Tiles for the crash heat layer.
+
+GET /tiles/{z}/{x}/{y}.mvt renders crashes (and optionally 311 hazards) with
+ST_AsMVT. Tiles use the st_tilecoord / XYZ convention (x from the west, y from
+the north), which is also what ST_TileEnvelope expects. Below
+MVT_POINT_MIN_ZOOM, individual crashes are replaced by the precomputed
+saferide.crash_tiles z12 aggregates so low-zoom tiles stay small.
+
+Rendered tiles are kept in a bounded in-process cache with strong ETags, so
+panning back over already-seen tiles never reaches PostGIS and clients that
+send If-None-Match get a 304.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from .cache import TTLCache, register
+from .db import fetchone_value
+
+router = APIRouter()
+
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MVT_POINT_MIN_ZOOM = int(os.getenv("MVT_POINT_MIN_ZOOM", "12"))
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", "300"))
+LAYERS = ("crashes", "hazards")
+
+tile_cache = register("tiles", TTLCache(
+    maxsize=int(os.getenv("TILE_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("TILE_CACHE_TTL", "3600")),
+    name="mvt_tiles",
+))
+
+# ---------- SQL: one layer per query, concatenated into one tile ----------
+# Params: z, x, y
+SQL_MVT_CRASHES = f"""
+WITH bounds AS (
+  SELECT ST_TileEnvelope(%s, %s, %s) AS env
+),
+feats AS (
+  SELECT c.crash_id, c.severity, c.occurred_at::date::text AS occurred_on,
+         ST_AsMVTGeom(c.geom3857, b.env, {MVT_EXTENT}, {MVT_BUFFER}, true) AS geom
+  FROM saferide.crash c, bounds b
+  WHERE c.geom3857 && b.env
+)
+SELECT ST_AsMVT(feats.*, 'crashes', {MVT_EXTENT}, 'geom') AS mvt
+FROM feats;
+"""
+
+# Low zooms: aggregated z12 crash tiles as polygons with counts
+SQL_MVT_CRASH_TILES = f"""
+WITH bounds AS (
+  SELECT ST_TileEnvelope(%s, %s, %s) AS env
+),
+feats AS (
+  SELECT t.x, t.y, t.crashes, t.weight_sum,
+         ST_AsMVTGeom(t.geom3857, b.env, {MVT_EXTENT}, {MVT_BUFFER}, true) AS geom
+  FROM saferide.crash_tiles_z12 t, bounds b
+  WHERE t.geom3857 && b.env
+)
+SELECT ST_AsMVT(feats.*, 'crashes', {MVT_EXTENT}, 'geom') AS mvt
+FROM feats;
+"""
+
+SQL_MVT_HAZARDS = f"""
+WITH bounds AS (
+  SELECT ST_TileEnvelope(%s, %s, %s) AS env
+),
+feats AS (
+  SELECT h.hazard_id, h.category, h.status,
+         ST_AsMVTGeom(ST_Transform(h.geom, 3857), b.env, {MVT_EXTENT}, {MVT_BUFFER}, true) AS geom
+  FROM saferide.hazard h, bounds b
+  WHERE h.geom && ST_Transform(b.env, 4326)
+)
+SELECT ST_AsMVT(feats.*, 'hazards', {MVT_EXTENT}, 'geom') AS mvt
+FROM feats;
+"""
+
+def _render_tile(z: int, x: int, y: int, layers: tuple[str, ...]) -> bytes:
+    parts = []
+    for layer in layers:
+        if layer == "crashes":
+            sql = SQL_MVT_CRASHES if z >= MVT_POINT_MIN_ZOOM else SQL_MVT_CRASH_TILES
+        else:
+            sql = SQL_MVT_HAZARDS
+        parts.append(bytes(fetchone_value(sql, (z, x, y)) or b""))
+    # MVT layers are independent protobuf messages, so concatenation is a valid tile
+    return b"".join(parts)
+
+@router.get("/{z}/{x}/{y}.mvt")
+def get_tile(z: int, x: int, y: int, layers: str = "crashes",
+             if_none_match: Optional[str] = Header(None)):
+    """
+    Vector tile with the requested layers (comma-separated: crashes,hazards).
+    """
+    if not 0 <= z <= 22:
+        raise HTTPException(status_code=400, detail="z must be between 0 and 22")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="tile out of range")
+    wanted = tuple(l for l in LAYERS if l in {s.strip() for s in layers.split(",")})
+    if not wanted:
+        raise HTTPException(status_code=400, detail=f"layers must be a subset of {','.join(LAYERS)}")
+
+    key = (z, x, y, wanted)
+    cached = tile_cache.get(key)
+    if cached is None:
+        try:
+            body = _render_tile(z, x, y, wanted)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Tile rendering failed: {e}")
+        cached = ('"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"', body)
+        tile_cache.set(key, cached)
+
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={TILE_MAX_AGE}"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/vnd.mapbox-vector-tile", headers=headers)
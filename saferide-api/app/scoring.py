@@ -0,0 +1,111 @@
+# saferide-api/app/scoring.py
+"""
+Crash-scoring strategies for the SQL engine.
+
+Every strategy is one batched query with the same contract: params are
+(buffer_m, bytea[] of route WKB from app.geometry.line_to_wkb) and it returns
+one row per route (1-based `idx`) with its crash count, including zeros. The
+WKB array is a %b (binary) parameter and the query runs as a prepared
+statement (app.db.fetchall_rows), so neither the geometry nor the SQL is
+parsed as text per call.
+
+  buffer_intersects   ST_Buffer in EPSG:3857 + ST_Intersects (the original
+                      scorer). Mercator units are not meters: at Denver's
+                      latitude (~39.7°) a 60 "m" buffer is ~46 m on the ground.
+  dwithin_3857        ST_DWithin on the indexed geom3857 column, with the
+                      radius scaled by 1/cos(latitude) of the route so it is
+                      ground meters again. No buffer polygon is built.
+  geography_dwithin   Exact ST_DWithin on geography (what saferide.score_route
+                      in 20_risk.sql uses), behind a geom3857 bounding-box
+                      prefilter so the GiST index still does the search.
+
+Select with SCORING_STRATEGY or per request; bench/bench_scoring_strategies.py
+compares them on one route corpus.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+@dataclass(frozen=True)
+class ScoringStrategy:
+    name: str
+    description: str
+    batch_sql: str
+
+SQL_BUFFER_INTERSECTS = """
+WITH routes AS (
+  SELECT u.idx::int AS idx,
+         ST_Buffer(ST_Transform(ST_GeomFromWKB(u.wkb, 4326), 3857), %s::float) AS g
+  FROM unnest(%b::bytea[]) WITH ORDINALITY AS u(wkb, idx)
+)
+SELECT r.idx, COUNT(c.crash_id)::int AS crashes
+FROM routes r
+LEFT JOIN saferide.crash_weights c ON ST_Intersects(c.geom3857, r.g)   -- uses crash_gix_3857
+GROUP BY r.idx
+ORDER BY r.idx;
+"""
+
+SQL_DWITHIN_3857 = """
+WITH p AS (
+  SELECT %s::float AS buffer_m
+),
+routes AS (
+  SELECT u.idx::int AS idx,
+         ST_Transform(l.g, 3857) AS g,
+         p.buffer_m / cos(radians(ST_Y(ST_Centroid(l.g)))) AS radius
+  FROM p, unnest(%b::bytea[]) WITH ORDINALITY AS u(wkb, idx)
+  CROSS JOIN LATERAL (SELECT ST_GeomFromWKB(u.wkb, 4326) AS g) l
+)
+SELECT r.idx, COUNT(c.crash_id)::int AS crashes
+FROM routes r
+LEFT JOIN saferide.crash_weights c ON ST_DWithin(c.geom3857, r.g, r.radius)   -- uses crash_gix_3857
+GROUP BY r.idx
+ORDER BY r.idx;
+"""
+
+# The prefilter box grows the route's 3857 bbox by the buffer at the route's
+# highest |latitude| (largest Mercator scale there) plus 2% for the spheroid.
+SQL_GEOGRAPHY_DWITHIN = """
+WITH p AS (
+  SELECT %s::float AS buffer_m
+),
+routes AS (
+  SELECT u.idx::int AS idx,
+         l.g::geography AS geog,
+         ST_Expand(ST_Transform(l.g, 3857),
+                   p.buffer_m * 1.02 / cos(radians(GREATEST(abs(ST_YMin(l.g)), abs(ST_YMax(l.g)))))) AS box
+  FROM p, unnest(%b::bytea[]) WITH ORDINALITY AS u(wkb, idx)
+  CROSS JOIN LATERAL (SELECT ST_GeomFromWKB(u.wkb, 4326) AS g) l
+)
+SELECT r.idx, COUNT(c.crash_id)::int AS crashes
+FROM routes r
+CROSS JOIN p
+LEFT JOIN saferide.crash_weights c
+  ON c.geom3857 && r.box                              -- index prefilter (crash_gix_3857)
+ AND ST_DWithin(c.geom::geography, r.geog, p.buffer_m)
+GROUP BY r.idx
+ORDER BY r.idx;
+"""
+
+STRATEGIES: Dict[str, ScoringStrategy] = {
+    s.name: s for s in (
+        ScoringStrategy("buffer_intersects", "ST_Buffer in EPSG:3857 + ST_Intersects",
+                        SQL_BUFFER_INTERSECTS),
+        ScoringStrategy("dwithin_3857", "ST_DWithin on geom3857, latitude-scaled radius",
+                        SQL_DWITHIN_3857),
+        ScoringStrategy("geography_dwithin", "geography ST_DWithin behind a geom3857 bbox prefilter",
+                        SQL_GEOGRAPHY_DWITHIN),
+    )
+}
+
+SCORING_STRATEGY = os.getenv("SCORING_STRATEGY", "buffer_intersects").lower()
+
+def get_strategy(name: Optional[str] = None) -> ScoringStrategy:
+    """Strategy by name (default: SCORING_STRATEGY); ValueError if unknown."""
+    key = (name or SCORING_STRATEGY).lower()
+    try:
+        return STRATEGIES[key]
+    except KeyError:
+        raise ValueError(f"scoring strategy must be one of {'|'.join(STRATEGIES)}") from None
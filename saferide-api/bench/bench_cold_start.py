@@ -0,0 +1,74 @@
+# saferide-api/bench/bench_cold_start.py
+"""
+Reproducible cold-start benchmark for the Lambda entry point.
+
+Each run starts a fresh interpreter that imports lambda_handler (and with it
+app.main) and then serves one API Gateway event through Mangum. Reported per
+run: interpreter start, import time, time to first response, and total wall
+time as seen by the parent process.
+
+    python -m bench.bench_cold_start --runs 10
+    python -m bench.bench_cold_start --runs 10 --eager-init   # old behaviour: init_database() before serving
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import lambda_handler
+t1 = time.perf_counter()
+if {eager_init}:
+    from app.db import init_database
+    init_database()
+event = {{
+    "resource": "{path}", "path": "{path}", "httpMethod": "GET",
+    "headers": {{}}, "multiValueHeaders": {{}},
+    "queryStringParameters": None, "multiValueQueryStringParameters": None,
+    "pathParameters": None, "stageVariables": None, "body": None, "isBase64Encoded": False,
+    "requestContext": {{"resourcePath": "{path}", "httpMethod": "GET", "path": "/prod{path}",
+                        "stage": "prod", "requestId": "bench", "identity": {{"sourceIp": "127.0.0.1"}}}},
+}}
+class Ctx: pass
+resp = lambda_handler.handler(event, Ctx())
+t2 = time.perf_counter()
+print(json.dumps({{"import_s": t1 - t0, "first_response_s": t2 - t0, "status": resp["statusCode"]}}))
+"""
+
+def _run_once(path: str, eager_init: bool) -> dict:
+    here = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    code = CHILD.format(path=path, eager_init=eager_init)
+    t = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True,
+                         text=True, check=True)
+    wall = time.perf_counter() - t
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["wall_s"] = wall
+    result["interpreter_s"] = wall - result["first_response_s"]
+    return result
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--path", default="/health")
+    ap.add_argument("--eager-init", action="store_true",
+                    help="call init_database() before the first request, as the app used to at import")
+    args = ap.parse_args()
+
+    runs = [_run_once(args.path, args.eager_init) for _ in range(args.runs)]
+    print(f"{args.runs} cold starts, GET {args.path}, eager_init={args.eager_init}, "
+          f"status={runs[0]['status']}")
+    for key in ("interpreter_s", "import_s", "first_response_s", "wall_s"):
+        vals = sorted(r[key] * 1000.0 for r in runs)
+        print(f"  {key[:-2]:<16} median {statistics.median(vals):8.1f} ms   "
+              f"min {vals[0]:8.1f} ms   max {vals[-1]:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
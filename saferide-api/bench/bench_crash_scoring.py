@@ -0,0 +1,158 @@
+# saferide-api/bench/bench_crash_scoring.py
+"""
+Before/after benchmark for route crash scoring on a large synthetic crash table.
+
+Builds a scratch schema (saferide_bench) with N random crashes around Denver,
+then scores the same route corpus with:
+  before  - on-the-fly ST_Transform of every crash (no usable index)
+  after   - stored geom3857 column with a GiST index
+
+Run from saferide-api/ with the usual PG* environment:
+    python -m bench.bench_crash_scoring --crashes 500000 --routes 20
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import statistics
+import time
+
+import psycopg
+
+from app.db import cfg
+
+SCHEMA = "saferide_bench"
+
+# Denver-ish bounding box (lon/lat)
+BBOX = (-105.11, 39.61, -104.60, 39.91)
+
+SETUP_SQL = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+CREATE TABLE {SCHEMA}.crash (
+  crash_id  BIGINT PRIMARY KEY,
+  geom      geometry(POINT, 4326) NOT NULL,
+  geom3857  geometry(POINT, 3857) GENERATED ALWAYS AS (ST_Transform(geom, 3857)) STORED
+);
+INSERT INTO {SCHEMA}.crash (crash_id, geom)
+SELECT i, ST_SetSRID(ST_MakePoint(%(x0)s + random() * %(dx)s, %(y0)s + random() * %(dy)s), 4326)
+FROM generate_series(1, %(n)s) AS i;
+CREATE INDEX ON {SCHEMA}.crash USING GIST (geom);
+CREATE INDEX ON {SCHEMA}.crash USING GIST (geom3857);
+ANALYZE {SCHEMA}.crash;
+"""
+
+QUERIES = {
+    "before": f"""
+WITH buf AS (
+  SELECT ST_Buffer(ST_Transform(ST_GeomFromText(%s, 4326), 3857), %s::float) AS g
+)
+SELECT COUNT(*)::int
+FROM {SCHEMA}.crash c
+JOIN buf b ON ST_Intersects(
+  CASE WHEN ST_SRID(c.geom)=3857 THEN c.geom ELSE ST_Transform(c.geom,3857) END,
+  b.g
+);
+""",
+    "after": f"""
+WITH buf AS (
+  SELECT ST_Buffer(ST_Transform(ST_GeomFromText(%s, 4326), 3857), %s::float) AS g
+)
+SELECT COUNT(*)::int
+FROM {SCHEMA}.crash c
+JOIN buf b ON ST_Intersects(c.geom3857, b.g);
+""",
+}
+
+def synthetic_routes(n: int, vertices: int, seed: int = 7) -> list[str]:
+    """Random-walk LINESTRINGs of `vertices` points (~20 m steps) inside BBOX."""
+    rng = random.Random(seed)
+    x0, y0, x1, y1 = BBOX
+    out = []
+    for _ in range(n):
+        lon, lat = rng.uniform(x0 + 0.05, x1 - 0.05), rng.uniform(y0 + 0.05, y1 - 0.05)
+        heading = rng.uniform(0, 6.283)
+        pts = []
+        for _ in range(vertices):
+            heading += rng.gauss(0, 0.15)
+            lon += 0.00023 * math.cos(heading)
+            lat += 0.00018 * math.sin(heading)
+            pts.append(f"{lon:.6f} {lat:.6f}")
+        out.append("LINESTRING(" + ",".join(pts) + ")")
+    return out
+
+def _plan_summary(plan: dict) -> dict:
+    """Node types used and shared buffers touched, from EXPLAIN (FORMAT JSON)."""
+    nodes: list[str] = []
+
+    def walk(node: dict) -> None:
+        name = node["Node Type"]
+        if "Index Name" in node:
+            name += f" ({node['Index Name']})"
+        nodes.append(name)
+        for child in node.get("Plans", []):
+            walk(child)
+
+    root = plan["Plan"]
+    walk(root)
+    return {
+        "nodes": nodes,
+        "shared_hit": root.get("Shared Hit Blocks"),
+        "shared_read": root.get("Shared Read Blocks"),
+        "execution_ms": plan.get("Execution Time"),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--crashes", type=int, default=500_000)
+    ap.add_argument("--routes", type=int, default=20)
+    ap.add_argument("--vertices", type=int, default=400)
+    ap.add_argument("--buffer-m", type=float, default=60.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--keep", action="store_true", help="keep the scratch schema afterwards")
+    args = ap.parse_args()
+
+    routes = synthetic_routes(args.routes, args.vertices)
+    x0, y0, x1, y1 = BBOX
+
+    with psycopg.connect(cfg.dsn, autocommit=True) as conn:
+        t = time.perf_counter()
+        conn.execute(SETUP_SQL, {"x0": x0, "y0": y0, "dx": x1 - x0, "dy": y1 - y0, "n": args.crashes})
+        print(f"setup: {args.crashes:,} crashes in {time.perf_counter() - t:.1f}s")
+
+        results: dict[str, dict] = {}
+        for name, sql in QUERIES.items():
+            counts = [conn.execute(sql, (wkt, args.buffer_m)).fetchone()[0] for wkt in routes]  # warm-up
+            samples = []
+            for _ in range(args.repeat):
+                for wkt in routes:
+                    t = time.perf_counter()
+                    conn.execute(sql, (wkt, args.buffer_m)).fetchone()
+                    samples.append((time.perf_counter() - t) * 1000.0)
+            plan = conn.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql,
+                                (routes[0], args.buffer_m)).fetchone()[0][0]
+            samples.sort()
+            results[name] = {
+                "counts": counts,
+                "mean_ms": statistics.fmean(samples),
+                "p50_ms": samples[len(samples) // 2],
+                "p95_ms": samples[int(len(samples) * 0.95) - 1],
+                "plan": _plan_summary(plan),
+            }
+
+        if not args.keep:
+            conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+
+    print(f"\n{'variant':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}  plan")
+    for name, r in results.items():
+        print(f"{name:<8} {r['mean_ms']:9.2f} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f}  "
+              f"{' > '.join(r['plan']['nodes'])}")
+    agree = results["before"]["counts"] == results["after"]["counts"]
+    speedup = results["before"]["mean_ms"] / max(results["after"]["mean_ms"], 1e-9)
+    print(f"\ncounts agree: {agree}   speedup: {speedup:.1f}x")
+    print(json.dumps({k: v["plan"] for k, v in results.items()}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# saferide-api/bench/bench_fc_serialization.py
+"""
+Serialization time and size of the /routes/rank_fc FeatureCollection for long
+cross-city routes.
+
+Compares the old path (WKT strings on RouteRank, regex-parsed back into
+[[lon, lat], ...] lists, stdlib json via JSONResponse) with the current one
+(coordinates straight from the scored line arrays, orjson), at full and
+reduced coordinate precision. No database or OSRM needed:
+
+    python -m bench.bench_fc_serialization --routes 5 --vertices 8000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, List, Optional
+
+from app.geometry import line_from_wkt, line_to_coords, line_to_wkt
+from app.routes_rank import ScoredRoute, orjson, render_feature_collection
+from bench.bench_crash_scoring import synthetic_routes
+
+def _legacy(ranked: List[ScoredRoute]) -> bytes:
+    # WKT on the response model, parsed back per feature, stdlib JSON
+    wkts = [line_to_wkt(s.line) for s in ranked]
+    feats = []
+    for s, wkt in zip(ranked, wkts):
+        feats.append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": line_to_coords(line_from_wkt(wkt))},
+            "properties": {"index": s.index, "crashes": s.crashes,
+                           "length_km": s.length_km, "is_winner": s.index == ranked[0].index},
+        })
+    return json.dumps({"type": "FeatureCollection", "features": feats},
+                      ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def _timed(fn: Callable[[], bytes], repeat: int) -> tuple[float, float, int]:
+    out = fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        samples.append((time.perf_counter() - t) * 1000.0)
+    samples.sort()
+    return statistics.fmean(samples), samples[len(samples) // 2], len(out)
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--routes", type=int, default=5, help="alternatives per response")
+    ap.add_argument("--vertices", type=int, default=8000, help="vertices per route (~20 m apart)")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    ranked = [
+        ScoredRoute(i, {}, line_from_wkt(wkt), 160.0, 10 * i, args.vertices)
+        for i, wkt in enumerate(synthetic_routes(args.routes, args.vertices))
+    ]
+    variants: List[tuple[str, Callable[[], bytes]]] = [("legacy wkt+json", lambda: _legacy(ranked))]
+    for precision in (None, 6, 5):
+        label = f"arrays, precision={precision if precision is not None else 'full'}"
+        variants.append((label, lambda p=precision: render_feature_collection(ranked, p)))
+
+    print(f"{args.routes} routes x {args.vertices:,} vertices, "
+          f"encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
+    print(f"{'variant':<26} {'mean ms':>9} {'p50 ms':>9} {'bytes':>12}")
+    base: Optional[float] = None
+    for label, fn in variants:
+        mean_ms, p50_ms, size = _timed(fn, args.repeat)
+        base = base or mean_ms
+        print(f"{label:<26} {mean_ms:9.2f} {p50_ms:9.2f} {size:12,}   {base / mean_ms:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# saferide-api/bench/bench_prepared_scoring.py
+"""
+Per-call latency of the scoring query by protocol: WKT text, WKB as a text
+(hex) bytea[] parameter, binary WKB, and binary WKB as a prepared statement
+(what app.db.fetchall_rows does for the hot scoring queries).
+
+Each call scores --batch routes, like one /routes/rank request with that many
+alternatives, against the live saferide.crash table. The batched variants
+return the same counts (the WKT one too for buffer_intersects); only
+parse/plan and parameter handling differ.
+
+Run from saferide-api/ with the usual PG* environment:
+    python -m bench.bench_prepared_scoring --calls 200 --batch 3 --vertices 2000
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+import psycopg
+
+from app.db import cfg
+from app.geometry import line_from_wkt, line_to_wkb
+from app.scoring import STRATEGIES
+from bench.bench_crash_scoring import synthetic_routes
+
+# The original per-route scorer: one query per route, geometry as WKT text
+SQL_SCORE_ROUTE_WKT = """
+WITH buf AS (
+  SELECT ST_Buffer(ST_Transform(ST_GeomFromText(%s, 4326), 3857), %s::float) AS g
+)
+SELECT COUNT(*)::int
+FROM saferide.crash_weights c
+JOIN buf b ON ST_Intersects(c.geom3857, b.g);
+"""
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--calls", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=3, help="routes scored per call")
+    ap.add_argument("--vertices", type=int, default=2000)
+    ap.add_argument("--buffer-m", type=float, default=60.0)
+    ap.add_argument("--strategy", default="buffer_intersects", choices=list(STRATEGIES))
+    args = ap.parse_args()
+
+    wkts = synthetic_routes(args.calls * args.batch, args.vertices)
+    wkbs = [line_to_wkb(line_from_wkt(w)) for w in wkts]
+    batches = [range(i, i + args.batch) for i in range(0, len(wkbs), args.batch)]
+    sql = STRATEGIES[args.strategy].batch_sql
+    r = args.buffer_m
+
+    def wkt_per_route(conn, b):
+        return [conn.execute(SQL_SCORE_ROUTE_WKT, (wkts[i], r), prepare=False).fetchone()[0] for i in b]
+
+    def wkb_text(conn, b):
+        rows = conn.execute(sql.replace("%b", "%s"), (r, [wkbs[i] for i in b]), prepare=False).fetchall()
+        return [row[1] for row in rows]
+
+    def wkb_binary(conn, b):
+        return [row[1] for row in conn.execute(sql, (r, [wkbs[i] for i in b]), prepare=False).fetchall()]
+
+    def wkb_binary_prepared(conn, b):
+        with conn.cursor(binary=True) as cur:
+            return [row[1] for row in cur.execute(sql, (r, [wkbs[i] for i in b]), prepare=True).fetchall()]
+
+    variants = {
+        "wkt per route": wkt_per_route,
+        "wkb text": wkb_text,
+        "wkb binary": wkb_binary,
+        "wkb binary prepared": wkb_binary_prepared,
+    }
+    print(f"{args.calls} calls x {args.batch} routes x {args.vertices} vertices, "
+          f"buffer {r:g} m, strategy {args.strategy}\n")
+    results = {}
+    for name, run in variants.items():
+        # Fresh connection per variant so no statement is prepared up front
+        with psycopg.connect(cfg.dsn, autocommit=True) as conn:
+            run(conn, batches[0])  # warm-up (and PREPARE for the prepared variant)
+            counts, samples = [], []
+            for b in batches:
+                t = time.perf_counter()
+                counts += run(conn, b)
+                samples.append((time.perf_counter() - t) * 1000.0)
+        samples.sort()
+        results[name] = (counts, samples)
+
+    # The WKT scorer measures like buffer_intersects only
+    reference = results["wkb text"][0]
+    print(f"{'variant':<20} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'counts':>7}")
+    for name, (counts, samples) in results.items():
+        if name == "wkt per route" and args.strategy != "buffer_intersects":
+            same = "-"
+        else:
+            same = "same" if counts == reference else "DIFF"
+        print(f"{name:<20} {statistics.fmean(samples):8.2f} {samples[len(samples) // 2]:8.2f} "
+              f"{samples[max(int(len(samples) * 0.95) - 1, 0)]:8.2f} {same:>7}")
+
+if __name__ == "__main__":
+    main()
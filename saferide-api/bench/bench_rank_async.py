@@ -0,0 +1,215 @@
+# saferide-api/bench/bench_rank_async.py
+"""
+Load test: threaded vs async /routes/rank.
+
+Starts a stub OSRM server with a fixed per-call latency, then one uvicorn
+API process per implementation (RANK_ASYNC=0 and RANK_ASYNC=1) pointed at
+it, and drives each with N concurrent clients for a fixed time. Reported
+per implementation and concurrency level: requests/s, p50/p95/p99 latency
+and errors. The OSRM and score caches are disabled so every request does
+the full OSRM + scoring work.
+
+The stub returns one route per call by default, so each ranking request
+also fans out the compass/detour calls, the path where threads sit idle
+waiting on OSRM. Scoring uses the API's PG* environment (SCORING_ENGINE=sql)
+or, with --engine memory, a synthetic in-process crash index (no DB needed):
+
+    python -m bench.bench_rank_async --engine memory --concurrency 10,50,200 --duration 15
+    python -m bench.bench_rank_async --osrm-latency-ms 120 --osrm-routes 3
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.bench_crash_scoring import BBOX
+
+# ---------- Stub OSRM (runs in its own process) ----------
+def serve_osrm(port: int, latency_ms: float, routes: int) -> None:
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    from app.geometry import encode_polyline, line_from_coords
+
+    async def route(request):
+        await asyncio.sleep(latency_ms / 1000.0 * random.uniform(0.8, 1.2))
+        pts = [[float(v) for v in p.split(",")] for p in request.path_params["coords"].split(";")]
+        # ~50 vertices per leg so decoding/scoring has some work to do
+        coords = []
+        for (x0, y0), (x1, y1) in zip(pts, pts[1:]):
+            coords += [[x0 + (x1 - x0) * t / 50, y0 + (y1 - y0) * t / 50] for t in range(50)]
+        coords.append(pts[-1])
+        dist = sum(math.hypot((x1 - x0) * 85_000, (y1 - y0) * 111_000)
+                   for (x0, y0), (x1, y1) in zip(coords, coords[1:]))
+        alts = [{
+            "distance": dist * (1 + 0.07 * i),
+            "duration": dist * (1 + 0.07 * i) / 8,
+            "geometry": encode_polyline(line_from_coords(
+                [[x, y + 0.002 * i * math.sin(math.pi * j / len(coords))] for j, (x, y) in enumerate(coords)])),
+        } for i in range(routes)]
+        return JSONResponse({"code": "Ok", "routes": alts})
+
+    app = Starlette(routes=[Route("/route/v1/{mode}/{coords:path}", route)])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+# ---------- Processes ----------
+def spawn(args: list[str], env: dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def wait_ready(url: str, timeout_s: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout_s:.0f}s")
+
+def crash_snapshot(n: int) -> str:
+    """Synthetic crash index snapshot for --engine memory."""
+    import numpy as np
+
+    from app.crash_index import CrashIndex, lonlat_to_3857
+
+    rng = np.random.default_rng(7)
+    x0, y0, x1, y1 = BBOX
+    lonlat = np.column_stack((rng.uniform(x0, x1, n), rng.uniform(y0, y1, n)))
+    path = os.path.join(tempfile.mkdtemp(prefix="saferide-bench-"), "crash_index.npz")
+    CrashIndex(lonlat_to_3857(lonlat), source="synthetic").save(path)
+    return path
+
+# ---------- Load generator ----------
+def trip(rng: random.Random) -> dict:
+    x0, y0, x1, y1 = BBOX
+    lon, lat = rng.uniform(x0 + 0.05, x1 - 0.05), rng.uniform(y0 + 0.05, y1 - 0.05)
+    return {
+        "start": [round(lon, 6), round(lat, 6)],
+        "end": [round(lon + rng.uniform(-0.04, 0.04), 6), round(lat + rng.uniform(-0.04, 0.04), 6)],
+        "mode": "cycling",
+        "max_alternatives": 3,
+    }
+
+async def drive(base_url: str, concurrency: int, duration_s: float, seed: int) -> dict:
+    import httpx
+
+    latencies: list[float] = []
+    errors = 0
+    stop_at = time.perf_counter() + duration_s
+
+    async def worker(n: int) -> None:
+        nonlocal errors
+        rng = random.Random(seed * 100_003 + n)
+        # One keep-alive connection per simulated client (a shared httpx pool
+        # this large costs the load generator more CPU than the server)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+            while time.perf_counter() < stop_at:
+                t = time.perf_counter()
+                try:
+                    r = await client.post("/routes/rank", json=trip(rng))
+                    ok = r.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - t)
+                else:
+                    errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    wall = time.perf_counter() - t0
+
+    def pct(p: float) -> float:
+        if not latencies:
+            return float("nan")
+        s = sorted(latencies)
+        return s[min(len(s) - 1, int(p * len(s)))] * 1000.0
+
+    return {
+        "ok": len(latencies), "errors": errors, "rps": len(latencies) / wall,
+        "p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99),
+        "mean": statistics.fmean(latencies) * 1000.0 if latencies else float("nan"),
+    }
+
+async def run(args: argparse.Namespace) -> None:
+    levels = [int(c) for c in args.concurrency.split(",")]
+    procs: list[subprocess.Popen] = []
+    osrm_url = f"http://127.0.0.1:{args.port}"
+    try:
+        procs.append(spawn(["-m", "bench.bench_rank_async", "--serve-osrm", str(args.port),
+                            "--osrm-latency-ms", str(args.osrm_latency_ms),
+                            "--osrm-routes", str(args.osrm_routes)], {}))
+        await wait_ready(f"{osrm_url}/route/v1/cycling/-105,39.7;-104.99,39.75")
+
+        env = {
+            "OSRM_BASE_URL": osrm_url,
+            "OSRM_CACHE_SIZE": "0",
+            "SCORE_CACHE_SIZE": "0",
+            "SCORING_ENGINE": args.engine,
+            # Same OSRM connection budget for both: fan-out threads vs async client
+            "OSRM_MAX_WORKERS": str(args.osrm_connections),
+            "OSRM_ASYNC_MAX_CONNECTIONS": str(args.osrm_connections),
+        }
+        if args.engine == "memory":
+            env["CRASH_INDEX_SNAPSHOT"] = crash_snapshot(args.crashes)
+        for var in ("OSRM_URL", "OSRM_URL_CYCLING"):
+            os.environ.pop(var, None)
+
+        print(f"stub OSRM: {args.osrm_latency_ms:g} ms/call, {args.osrm_routes} route(s) per response; "
+              f"{args.osrm_connections} OSRM connections; engine={args.engine}; {args.duration:g}s per level\n")
+        print(f"{'impl':<9} {'conc':>5} {'ok':>7} {'errors':>7} {'req/s':>8} "
+              f"{'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for i, (impl, flag) in enumerate((("threaded", "0"), ("async", "1"))):
+            port = args.port + 1 + i
+            api = spawn(["-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                         "--log-level", "warning", "--no-access-log"], {**env, "RANK_ASYNC": flag})
+            procs.append(api)
+            base_url = f"http://127.0.0.1:{port}"
+            await wait_ready(f"{base_url}/health")
+            await drive(base_url, 2, 2.0, seed=0)  # warm-up: pools, crash index
+            for c in levels:
+                r = await drive(base_url, c, args.duration, seed=c)
+                print(f"{impl:<9} {c:>5} {r['ok']:>7} {r['errors']:>7} {r['rps']:>8.1f} "
+                      f"{r['mean']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f}")
+            api.terminate()
+            api.wait()
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", default="10,50,200", help="comma-separated client counts")
+    ap.add_argument("--duration", type=float, default=15.0, help="seconds per concurrency level")
+    ap.add_argument("--engine", choices=("sql", "memory"), default="sql")
+    ap.add_argument("--crashes", type=int, default=200_000, help="--engine memory: synthetic crashes")
+    ap.add_argument("--osrm-latency-ms", type=float, default=50.0)
+    ap.add_argument("--osrm-routes", type=int, default=1, help="routes per stub OSRM response")
+    ap.add_argument("--osrm-connections", type=int, default=32,
+                    help="OSRM_MAX_WORKERS / OSRM_ASYNC_MAX_CONNECTIONS for the API processes")
+    ap.add_argument("--port", type=int, default=18500, help="stub OSRM port; the APIs use the next two")
+    ap.add_argument("--serve-osrm", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve_osrm:
+        serve_osrm(args.serve_osrm, args.osrm_latency_ms, args.osrm_routes)
+    else:
+        asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# saferide-api/bench/bench_scoring_strategies.py
+"""
+Latency, plans and count agreement of the SQL scoring strategies (app.scoring).
+
+Runs every strategy on the same synthetic route corpus against the live
+saferide.crash table: whole-batch latency (what /routes/rank issues), per-route
+latency, the EXPLAIN plan, and crash counts compared with a reference strategy
+(geography_dwithin by default, i.e. true ground distance). Ends with the
+fastest strategy whose counts stay within --tolerance of the reference.
+
+Run from saferide-api/ with the usual PG* environment:
+    python -m bench.bench_scoring_strategies --routes 50 --buffer-m 60
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+import psycopg
+
+from app.db import cfg
+from app.geometry import line_from_wkt, line_to_wkb
+from app.scoring import STRATEGIES
+from bench.bench_crash_scoring import _plan_summary, synthetic_routes
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--routes", type=int, default=50)
+    ap.add_argument("--vertices", type=int, default=400)
+    ap.add_argument("--buffer-m", type=float, default=60.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--reference", default="geography_dwithin", choices=list(STRATEGIES))
+    ap.add_argument("--tolerance", type=float, default=0.01,
+                    help="max mean relative count difference to call a strategy accurate")
+    args = ap.parse_args()
+
+    wkbs = [line_to_wkb(line_from_wkt(w)) for w in synthetic_routes(args.routes, args.vertices)]
+    results: dict[str, dict] = {}
+
+    with psycopg.connect(cfg.dsn, autocommit=True) as conn:
+        for name, strategy in STRATEGIES.items():
+            sql = strategy.batch_sql
+            counts = [row[1] for row in conn.execute(sql, (args.buffer_m, wkbs)).fetchall()]  # warm-up
+
+            batch = []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                conn.execute(sql, (args.buffer_m, wkbs)).fetchall()
+                batch.append((time.perf_counter() - t) * 1000.0)
+
+            per_route = []
+            for wkb in wkbs:
+                t = time.perf_counter()
+                conn.execute(sql, (args.buffer_m, [wkb])).fetchall()
+                per_route.append((time.perf_counter() - t) * 1000.0)
+            per_route.sort()
+
+            plan = conn.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql,
+                                (args.buffer_m, wkbs[:1])).fetchone()[0][0]
+            results[name] = {
+                "counts": counts,
+                "batch_ms": statistics.fmean(batch),
+                "p50_ms": per_route[len(per_route) // 2],
+                "p95_ms": per_route[max(int(len(per_route) * 0.95) - 1, 0)],
+                "plan": _plan_summary(plan),
+            }
+
+    ref = results[args.reference]["counts"]
+    print(f"{args.routes} routes x {args.vertices} vertices, buffer {args.buffer_m:g} m, "
+          f"reference: {args.reference}\n")
+    print(f"{'strategy':<18} {'batch ms':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'exact':>7} {'max|diff|':>9} {'mean rel':>9}  plan")
+    accurate = []
+    for name, r in results.items():
+        diffs = [abs(c - x) for c, x in zip(r["counts"], ref)]
+        mean_rel = sum(d / max(x, 1) for d, x in zip(diffs, ref)) / max(len(ref), 1)
+        if mean_rel <= args.tolerance:
+            accurate.append((r["batch_ms"], name))
+        print(f"{name:<18} {r['batch_ms']:9.1f} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} "
+              f"{sum(d == 0 for d in diffs):>3}/{len(diffs):<3} {max(diffs, default=0):9} "
+              f"{mean_rel:9.2%}  {' > '.join(r['plan']['nodes'])}")
+
+    if accurate:
+        ms, name = min(accurate)
+        print(f"\nfastest within {args.tolerance:.0%} of {args.reference}: {name} ({ms:.1f} ms/batch)"
+              f"  ->  SCORING_STRATEGY={name}")
+
+if __name__ == "__main__":
+    main()
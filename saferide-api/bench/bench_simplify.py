@@ -0,0 +1,70 @@
+# saferide-api/bench/bench_simplify.py
+"""
+Vertex reduction and count error of buffer-aware route simplification.
+
+Scores a synthetic route corpus against random crashes with the in-process
+crash index, before and after app.geometry.simplify_line at a few tolerance
+ratios (tolerance = ratio * buffer_m). For every route the count difference
+is checked against its bound: the number of crashes whose distance to the
+original route lies within +-tolerance of the buffer radius. No database
+needed:
+
+    python -m bench.bench_simplify --crashes 200000 --routes 50 --buffer-m 60
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from app.crash_index import CrashIndex, lonlat_to_3857
+from app.geometry import line_from_wkt, simplify_line
+from bench.bench_crash_scoring import BBOX, synthetic_routes
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--crashes", type=int, default=200_000)
+    ap.add_argument("--routes", type=int, default=50)
+    ap.add_argument("--vertices", type=int, default=2000)
+    ap.add_argument("--buffer-m", type=float, default=60.0)
+    ap.add_argument("--ratios", default="0.02,0.05,0.1")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(7)
+    x0, y0, x1, y1 = BBOX
+    lonlat = np.column_stack((rng.uniform(x0, x1, args.crashes), rng.uniform(y0, y1, args.crashes)))
+    index = CrashIndex(lonlat_to_3857(lonlat), source="synthetic")
+    lines = [line_from_wkt(w) for w in synthetic_routes(args.routes, args.vertices)]
+    r = args.buffer_m
+
+    t = time.perf_counter()
+    base = index.count_routes(lines, r)
+    base_ms = (time.perf_counter() - t) * 1000.0
+    total_v = sum(len(l) // 2 for l in lines)
+    print(f"{args.routes} routes, {total_v:,} vertices, {index.size:,} crashes, buffer {r:g} m")
+    print(f"unsimplified scoring: {base_ms:.1f} ms\n")
+    print(f"{'ratio':>6} {'tol m':>6} {'vertices':>9} {'kept':>6} {'simplify ms':>12} "
+          f"{'score ms':>9} {'max |diff|':>10} {'mean rel':>9} {'in bound':>9}")
+
+    for ratio in (float(x) for x in args.ratios.split(",")):
+        tol = r * ratio
+        t = time.perf_counter()
+        simple = [simplify_line(l, tol) for l in lines]
+        simplify_ms = (time.perf_counter() - t) * 1000.0
+        t = time.perf_counter()
+        counts = index.count_routes(simple, r)
+        score_ms = (time.perf_counter() - t) * 1000.0
+
+        # Crashes in the +-tol band around the buffer edge of the original route
+        band = [hi - lo for hi, lo in zip(index.count_routes(lines, r + tol),
+                                          index.count_routes(lines, max(r - tol, 0.0)))]
+        diffs = [abs(c - b) for c, b in zip(counts, base)]
+        kept_v = sum(len(l) // 2 for l in simple)
+        mean_rel = sum(d / max(b, 1) for d, b in zip(diffs, base)) / len(base)
+        in_bound = sum(d <= w for d, w in zip(diffs, band))
+        print(f"{ratio:6.2f} {tol:6.1f} {kept_v:9,} {kept_v / total_v:6.1%} {simplify_ms:12.1f} "
+              f"{score_ms:9.1f} {max(diffs):10} {mean_rel:9.2%} {in_bound:>5}/{len(diffs)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# saferide-api/bench/compare_scoring_engines.py
+"""
+Check that the in-process crash index agrees with the SQL scoring path.
+
+Scores the same synthetic route corpus against the live saferide.crash table
+with both engines and reports per-route differences and timings. Counts may
+differ slightly because ST_Buffer approximates the buffer circle with a
+polygon (see app/crash_index.py).
+
+    python -m bench.compare_scoring_engines --routes 50 --buffer-m 60
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from app.crash_index import CrashIndex
+from app.geometry import line_from_wkt, line_to_wkb
+from app.routes_rank import _score_routes_batch
+from app.scoring import get_strategy
+from bench.bench_crash_scoring import synthetic_routes
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--routes", type=int, default=50)
+    ap.add_argument("--vertices", type=int, default=400)
+    ap.add_argument("--buffer-m", type=float, default=60.0)
+    args = ap.parse_args()
+
+    wkts = synthetic_routes(args.routes, args.vertices)
+    lines = [line_from_wkt(w) for w in wkts]
+
+    t = time.perf_counter()
+    index = CrashIndex.from_db()
+    load_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    # The memory engine measures like buffer_intersects (3857 units)
+    sql_counts = _score_routes_batch([line_to_wkb(l) for l in lines], args.buffer_m,
+                                     get_strategy("buffer_intersects"))
+    sql_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    mem_counts = index.count_routes(lines, args.buffer_m)
+    mem_s = time.perf_counter() - t
+
+    diffs = [m - s for s, m in zip(sql_counts, mem_counts)]
+    worst = max((abs(d) / max(s, 1) for s, d in zip(sql_counts, diffs)), default=0.0)
+    print(f"index: {index.size:,} points, loaded in {load_s:.2f}s")
+    print(f"sql:    {sql_s * 1000:8.1f} ms for {len(wkts)} routes")
+    print(f"memory: {mem_s * 1000:8.1f} ms for {len(wkts)} routes")
+    print(f"exact matches: {sum(d == 0 for d in diffs)}/{len(diffs)}   "
+          f"max |diff|: {max(map(abs, diffs), default=0)}   worst relative: {worst:.2%}")
+
+if __name__ == "__main__":
+    main()
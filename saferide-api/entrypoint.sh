@@ -13,5 +13,8 @@ for i in {1..15}; do
     sleep 1
 done
 
+# One-off schema/extension check (kept out of app import for fast worker boot)
+python3 -m app.db init || echo "⚠ Database init step failed; continuing"
+
 echo "🚀 Starting SafeRide API..."
 exec uvicorn app.main:app --host 0.0.0.0 --port 8080
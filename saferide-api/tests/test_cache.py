@@ -0,0 +1,59 @@
+# saferide-api/tests/test_cache.py
+import time
+from array import array
+
+from app.cache import TTLCache, route_score_key
+
+LINE = [-104.99, 39.74, -104.98, 39.75]
+
+# ---- route_score_key ----------------------------------------------------------
+
+def test_route_score_key_is_stable():
+    # Keys are shared through the disk cache tier: the format must not drift
+    assert route_score_key(LINE, 25.0, "buffer_intersects") == "58ba1edf90a04a74cafd47c401eef3a6"
+    assert route_score_key(array("d", LINE), 25.0, "buffer_intersects") == \
+        route_score_key(LINE, 25.0, "buffer_intersects")
+
+def test_route_score_key_ignores_float_noise():
+    noisy = [v + 1e-9 for v in LINE]
+    assert route_score_key(noisy, 25.0) == route_score_key(LINE, 25.0)
+
+def test_route_score_key_separates_inputs():
+    base = route_score_key(LINE, 25.0, "buffer_intersects")
+    assert route_score_key(LINE, 30.0, "buffer_intersects") != base
+    assert route_score_key(LINE, 25.0, "dwithin") != base
+    assert route_score_key(LINE[:2] + [-104.97, 39.75], 25.0, "buffer_intersects") != base
+    assert route_score_key(LINE[2:] + LINE[:2], 25.0, "buffer_intersects") != base
+
+# ---- TTLCache -----------------------------------------------------------------
+
+def test_ttl_cache_expires_entries():
+    c = TTLCache(maxsize=10, ttl=0.05)
+    c.set("a", 1)
+    assert c.get("a") == 1
+    time.sleep(0.1)
+    assert c.get("a") is None
+    assert len(c) == 0
+    assert (c.hits, c.misses) == (1, 1)
+
+def test_ttl_cache_evicts_least_recently_used():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1   # "b" is now the least recently used
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert (c.get("a"), c.get("c")) == (1, 3)
+    assert c.evictions == 1
+
+def test_ttl_cache_disabled_and_clear():
+    off = TTLCache(maxsize=0, ttl=60)
+    off.set("a", 1)
+    assert off.get("a") is None
+
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.clear() == 2
+    assert c.get("a") is None
+    assert c.stats()["invalidations"] == 1
@@ -0,0 +1,82 @@
+# saferide-api/tests/test_crash_index.py
+import numpy as np
+import pytest
+
+from app.crash_index import CrashIndex, lonlat_to_3857
+
+def _brute_force(xy, coords, buffer_m):
+    """Points of `xy` within `buffer_m` of the polyline, checked against every segment."""
+    p = lonlat_to_3857(coords)
+    if len(p) == 1:
+        p = np.vstack((p, p))
+    a, b = p[:-1], p[1:]
+    count = 0
+    for q in xy:
+        s = b - a
+        d = q - a
+        len2 = (s * s).sum(axis=1)
+        t = np.divide((d * s).sum(axis=1), len2, out=np.zeros_like(len2), where=len2 > 0)
+        e = d - np.clip(t, 0.0, 1.0)[:, None] * s
+        if ((e * e).sum(axis=1) <= buffer_m * buffer_m).any():
+            count += 1
+    return count
+
+@pytest.fixture(scope="module")
+def crashes():
+    rnd = np.random.default_rng(7)
+    lonlat = np.column_stack((rnd.uniform(-105.05, -104.90, 3000),
+                              rnd.uniform(39.68, 39.80, 3000)))
+    return lonlat_to_3857(lonlat)
+
+@pytest.fixture(scope="module")
+def route():
+    rnd = np.random.default_rng(11)
+    steps = rnd.uniform(-0.002, 0.002, (80, 2)) + (0.001, 0.0005)
+    return (np.array([-105.03, 39.70]) + np.cumsum(steps, axis=0)).tolist()
+
+@pytest.mark.parametrize("cell_m", [50.0, 200.0, 5000.0])
+@pytest.mark.parametrize("buffer_m", [10.0, 75.0, 400.0])
+def test_count_within_matches_brute_force(crashes, route, cell_m, buffer_m):
+    index = CrashIndex(crashes, cell_m=cell_m)
+    assert index.count_within(route, buffer_m) == _brute_force(crashes, route, buffer_m)
+
+def test_count_within_single_point_route(crashes):
+    index = CrashIndex(crashes)
+    coords = [[-104.97, 39.74]]
+    assert index.count_within(coords, 300.0) == _brute_force(crashes, coords, 300.0)
+
+def test_count_within_outside_the_grid(crashes):
+    index = CrashIndex(crashes)
+    assert index.count_within([[-100.0, 35.0], [-100.01, 35.01]], 500.0) == 0
+    assert index.count_within([], 500.0) == 0
+
+def test_empty_index_and_non_finite_points():
+    assert CrashIndex(np.empty((0, 2))).count_within([[-104.99, 39.74]], 100.0) == 0
+    xy = lonlat_to_3857([[-104.99, 39.74]])
+    index = CrashIndex(np.vstack((xy, [[np.nan, np.nan]])))
+    assert index.size == 1
+    assert index.count_within([[-104.99, 39.74], [-104.98, 39.74]], 10.0) == 1
+
+# ---- Rebuild on invalidation --------------------------------------------------
+
+def test_invalidation_rebuilds_from_db_and_drops_scores(monkeypatch, crashes, tmp_path):
+    from app import crash_index
+    from app.cache import score_cache
+
+    snapshot = tmp_path / "crash_index.npz"
+    CrashIndex(crashes[:10]).save(str(snapshot))
+    monkeypatch.setattr(crash_index, "SNAPSHOT", str(snapshot))
+    monkeypatch.setattr(CrashIndex, "from_db", classmethod(lambda cls: cls(crashes, source="db")))
+
+    holder = crash_index._IndexHolder()
+    assert holder.get().size == 10          # first load: the snapshot
+
+    score_cache.set("route", 3)             # scored against the old index
+    holder.clear()
+    rebuild = holder._rebuild
+    if rebuild is not None:
+        rebuild.join(5)
+
+    assert holder.get().size == len(crashes)
+    assert holder.get().source == "db"
+    assert score_cache.get("route") is None
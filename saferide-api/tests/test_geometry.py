@@ -0,0 +1,98 @@
+# saferide-api/tests/test_geometry.py
+import random
+import struct
+from array import array
+
+import numpy as np
+import pytest
+
+from app.crash_index import lonlat_to_3857
+from app.geometry import (
+    decode_polyline, encode_polyline, line_from_coords, line_to_wkb, simplify_line,
+)
+
+def _random_walk(n, seed=0, step=0.0005):
+    rnd = random.Random(seed)
+    lon, lat = -104.99, 39.74
+    line = array("d")
+    for _ in range(n):
+        lon += rnd.uniform(-step, step)
+        lat += rnd.uniform(-step, step)
+        line.append(round(lon, 6))
+        line.append(round(lat, 6))
+    return line
+
+def _point_line_distance(px, py, xy):
+    """Distance from (px, py) to the polyline `xy` ((N, 2), 3857 meters)."""
+    a, b = xy[:-1], xy[1:]
+    s = b - a
+    p = np.array([px, py]) - a
+    len2 = (s * s).sum(axis=1)
+    t = np.divide((p * s).sum(axis=1), len2, out=np.zeros_like(len2), where=len2 > 0)
+    d = p - np.clip(t, 0.0, 1.0)[:, None] * s
+    return float(np.sqrt((d * d).sum(axis=1)).min())
+
+# ---- Encoded polylines --------------------------------------------------------
+
+def test_polyline6_round_trip():
+    line = _random_walk(500)
+    decoded = decode_polyline(encode_polyline(line))
+    assert len(decoded) == len(line)
+    assert max(abs(a - b) for a, b in zip(line, decoded)) < 1e-9
+
+def test_polyline_reference_example():
+    # Google's documented example, precision 5: (lat, lng) pairs
+    decoded = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@", precision=5)
+    assert list(decoded) == pytest.approx([-120.2, 38.5, -120.95, 40.7, -126.453, 43.252])
+    assert encode_polyline(decoded, precision=5) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+def test_decode_truncated_polyline():
+    with pytest.raises(ValueError):
+        decode_polyline(encode_polyline(_random_walk(3))[:-1])
+
+# ---- WKB ----------------------------------------------------------------------
+
+def test_wkb_linestring():
+    line = line_from_coords([[-104.99, 39.74], [-104.98, 39.75], [-104.97, 39.76]])
+    wkb = line_to_wkb(line)
+    order, kind, n = struct.unpack_from("<BII", wkb)
+    assert (order, kind, n) == (1, 2, 3)
+    assert len(wkb) == 9 + 3 * 16
+    assert list(struct.unpack_from("<6d", wkb, 9)) == list(line)
+
+def test_wkb_from_list_matches_array():
+    coords = [-104.99, 39.74, -104.98, 39.75]
+    assert line_to_wkb(coords) == line_to_wkb(array("d", coords))
+
+def test_wkb_single_vertex_is_repeated():
+    wkb = line_to_wkb(array("d", [-104.99, 39.74]))
+    assert struct.unpack_from("<BII", wkb)[2] == 2
+    assert struct.unpack_from("<4d", wkb, 9) == (-104.99, 39.74, -104.99, 39.74)
+
+# ---- Simplification -----------------------------------------------------------
+
+@pytest.mark.parametrize("tolerance_m", [1.0, 5.0, 20.0])
+def test_simplify_line_error_bound(tolerance_m):
+    line = _random_walk(2000, seed=int(tolerance_m))
+    simplified = simplify_line(line, tolerance_m)
+
+    original = lonlat_to_3857(np.frombuffer(line, dtype=np.float64).reshape(-1, 2))
+    kept = np.frombuffer(simplified, dtype=np.float64).reshape(-1, 2)
+    assert 2 <= len(kept) < len(original)
+
+    # Kept vertices are original vertices, in order, endpoints included
+    pairs = [tuple(v) for v in np.frombuffer(line, dtype=np.float64).reshape(-1, 2)]
+    positions = [pairs.index(tuple(v)) for v in kept]
+    assert positions == sorted(positions)
+    assert positions[0] == 0 and positions[-1] == len(pairs) - 1
+
+    # Every dropped vertex is within the tolerance of the simplified line
+    kept_xy = lonlat_to_3857(kept)
+    worst = max(_point_line_distance(x, y, kept_xy) for x, y in original)
+    assert worst <= tolerance_m + 1e-6
+
+def test_simplify_line_passthrough():
+    line = _random_walk(50)
+    assert simplify_line(line, 0.0) is line
+    short = _random_walk(2)
+    assert simplify_line(short, 10.0) is short